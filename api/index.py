@@ -4,8 +4,21 @@ import sys
 # Add the backend directory to sys.path so that 'app' module can be found
 sys.path.append(os.path.join(os.path.dirname(__file__), '../backend'))
 
+# Requests arrive through Vercel's edge proxy, which sets X-Forwarded-For (see admission.client_key)
+os.environ.setdefault("TRUSTED_PROXY_HOPS", "1")
+
+# IMPORT_PROFILE=1 logs per-module import times of the cold start (see app/core/import_profile.py)
+_import_profile = bool(os.environ.get("IMPORT_PROFILE"))
+if _import_profile:
+    from app.core import import_profile
+    import_profile.enable()
+
 from app.main import app
 
+if _import_profile:
+    import_profile.disable()
+    import_profile.log_report()
+
 # This is required for Vercel to find the app instance
 if __name__ == "__main__":
     import uvicorn
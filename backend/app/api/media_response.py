@@ -0,0 +1,131 @@
+import os
+import re
+from email.utils import formatdate
+from typing import Optional, Tuple
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CHUNK_SIZE = 256 * 1024
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single-range `Range` header into an inclusive (start, end).
+    Returns None to serve the whole file (no header, or multiple ranges);
+    raises ValueError when the range is not satisfiable.
+    """
+    if not header or "," in header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+class MediaFileResponse(Response):
+    """
+    Serves an immutable, content-addressed file with a strong ETag (its sha256),
+    long-lived Cache-Control and single-range HTTP Range support.
+
+    The body goes through the ASGI zero-copy extension (`http.response.zerocopysend`,
+    i.e. sendfile) when the server offers it, and is streamed in chunks otherwise.
+    """
+
+    def __init__(self, path: str, etag: str, media_type: Optional[str] = None):
+        super().__init__(media_type=media_type)
+        self.path = path
+        self.etag = f'"{etag}"'
+        self.stat = os.stat(path)
+
+    def _etag_matches(self, value: Optional[str]) -> bool:
+        if not value:
+            return False
+        candidates = [v.strip().removeprefix("W/") for v in value.split(",")]
+        return "*" in candidates or self.etag in candidates
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        request = Request(scope)
+        size = self.stat.st_size
+        headers = {
+            "etag": self.etag,
+            "cache-control": IMMUTABLE_CACHE_CONTROL,
+            "accept-ranges": "bytes",
+            "last-modified": formatdate(self.stat.st_mtime, usegmt=True),
+        }
+        if self.media_type:
+            headers["content-type"] = self.media_type
+
+        if self._etag_matches(request.headers.get("if-none-match")):
+            await self._send_head(send, 304, headers)
+            return
+
+        start, end, status = 0, size - 1, 200
+        if_range = request.headers.get("if-range")
+        if not if_range or if_range.strip() == self.etag:
+            try:
+                byte_range = parse_range(request.headers.get("range"), size)
+            except ValueError:
+                headers["content-range"] = f"bytes */{size}"
+                headers["content-length"] = "0"
+                await self._send_head(send, 416, headers)
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                status = 206
+                headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+        count = end - start + 1 if size else 0
+        headers["content-length"] = str(count)
+        await self._send_head(send, status, headers)
+        if scope["method"] == "HEAD" or count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" in extensions:
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f,
+                    "offset": start,
+                    "count": count,
+                    "more_body": False,
+                })
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(start)
+            remaining = count
+            while remaining > 0:
+                chunk = await f.read(min(_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _send_head(self, send: Send, status: int, headers: dict):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()],
+        })
+        if status in (304, 416):
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -0,0 +1,35 @@
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+from app.core.compression import strip_encoding_suffix
+from app.core.json_codec import dumps, etag_for, orjson
+
+
+class ORJSONResponse(JSONResponse):
+    """Default API response class: orjson-encoded when available (several times faster than json)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    # Tags of compressed copies carry an encoding suffix (see compression.py)
+    candidates = [strip_encoding_suffix(v.strip().removeprefix("W/")) for v in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def json_with_etag(request: Request, body: bytes, etag: Optional[str] = None) -> Response:
+    """
+    Returns pre-serialized JSON with an ETag, or an empty 304 when the client's
+    If-None-Match already matches. `no-cache` makes browsers revalidate on every load.
+    """
+    etag = etag or etag_for(body)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,47 +1,268 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Body
-from app.services.qwen import analyze_video, analyze_photo, chat_with_coach
-from app.services.knowledge import add_knowledge_candidate, get_knowledge_entries, approve_knowledge_entry, reject_knowledge_entry, search_knowledge
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Body, Request, Header, Query, Depends
+from app.core import metrics
+from app.core.admission import rate_limit, enforce_rate
 from app.core.config import get_data_dir
+from app.api.responses import json_with_etag
+from app.core.json_codec import dumps
 from typing import Optional, Dict, List
 import os
 import json
+import asyncio
+import math
 from collections import Counter
 
 api_router = APIRouter()
 
+def _model_error(result: dict) -> HTTPException:
+    """
+    429 (admission control) or 503 (model circuit open) with Retry-After for retryable
+    rejections, 500 for other failures.
+    """
+    if result.get("retry_after") is not None:
+        return HTTPException(
+            status_code=result.get("status_code", 503),
+            detail=result["error"],
+            headers={"Retry-After": str(math.ceil(result["retry_after"]))}
+        )
+    return HTTPException(status_code=500, detail=result["error"])
+
 # --- Analysis Endpoints ---
 
-@api_router.post("/analyze/video")
+@api_router.post("/analyze/video", dependencies=[Depends(rate_limit("analysis"))])
 async def analyze_video_endpoint(
     video: UploadFile = File(...),
     coach: str = Form("hu"),
     severity: Optional[int] = Form(5),
-    style: Optional[str] = Form("conservative")
+    style: Optional[str] = Form("conservative"),
+    long_mode: Optional[bool] = Form(None)
 ):
+    from app.services.qwen import analyze_video
+
     try:
-        content = await video.read()
-        result = await analyze_video(content, video.content_type, coach, severity, style)
+        with metrics.span("upload"):
+            content = await video.read()
+        result = await analyze_video(content, video.content_type, coach, severity, style, long_mode=long_mode)
         if "error" in result:
-            raise HTTPException(status_code=500, detail=result["error"])
+            raise _model_error(result)
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.post("/analysis/style")
+def _sse(event: str, data) -> str:
+    """One Server-Sent Event (JSON data, encoded like the API's JSON responses)."""
+    return f"event: {event}\ndata: {dumps(data).decode('utf-8')}\n\n"
+
+@api_router.post("/analyze/video/stream", dependencies=[Depends(rate_limit("analysis"))])
+async def analyze_video_stream_endpoint(
+    video: UploadFile = File(...),
+    coach: str = Form("hu"),
+    severity: Optional[int] = Form(5),
+    style: Optional[str] = Form("conservative"),
+    long_mode: Optional[bool] = Form(None)
+):
+    """
+    /analyze/video as Server-Sent Events: a "section" event ({"key", "value"}) for each top-level
+    report section as soon as the model has produced it (a later event for the same key replaces
+    the earlier one), then "result" with the /analyze/video body or "error" ({"detail", "status_code",
+    "retry_after"}). Comment lines keep the connection alive while frames are prepared.
+    """
+    from fastapi.responses import StreamingResponse
+    from app.services.qwen import analyze_video
+
+    with metrics.span("upload"):
+        content = await video.read()
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_section(key, value):
+        loop.call_soon_threadsafe(events.put_nowait, ("section", {"key": key, "value": value}))
+
+    async def run():
+        try:
+            return await analyze_video(content, video.content_type, coach, severity, style, long_mode=long_mode,
+                                       on_section=on_section)
+        finally:
+            events.put_nowait(("done", None))
+
+    async def stream():
+        # Not cancelled if the client goes away: the finished analysis is still saved to history
+        task = asyncio.create_task(run())
+        while True:
+            try:
+                event, data = await asyncio.wait_for(events.get(), timeout=15)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event == "done":
+                break
+            yield _sse(event, data)
+
+        try:
+            result = task.result()
+        except Exception as e:
+            result = {"error": str(e)}
+        if "error" in result:
+            err = _model_error(result)
+            yield _sse("error", {
+                "detail": err.detail,
+                "status_code": err.status_code,
+                "retry_after": result.get("retry_after")
+            })
+        else:
+            yield _sse("result", result)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.post("/analysis/style", dependencies=[Depends(rate_limit("analysis"))])
 async def analyze_photo_endpoint(
     photo: UploadFile = File(...)
 ):
+    from app.services.qwen import analyze_photo
+
     try:
-        content = await photo.read()
+        with metrics.span("upload"):
+            content = await photo.read()
         result = await analyze_photo(content, photo.content_type)
         if "error" in result:
-            raise HTTPException(status_code=500, detail=result["error"])
+            raise _model_error(result)
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _analyze_uploaded_file(session_id: str, filename: str, content_type: Optional[str], media: dict):
+    """
+    Records an uploaded file (a media store record) in the chat session and runs the analysis
+    its type calls for (video or style photo). Shared by /chat and resumable upload finalize.
+    Content that was already analyzed (same media hash) reuses the existing archive.
+    Returns the chat response, or None for file types without an analysis.
+    """
+    from app.services.history import add_message, save_archive_entry, find_archive_by_media
+    from app.services.media import media_path, media_url
+    from app.services.qwen import analyze_video, analyze_photo
+    import aiofiles
+
+    filename = filename.lower()
+    file_path = media_path(media)
+    file_url = media_url(media)
+    media_sha = media["sha256"]
+    
+    # Save User Message (File)
+    await asyncio.to_thread(add_message, session_id, "user", f"Uploaded file: {filename}", "file", {"url": file_url})
+
+    # Video Analysis Intent
+    if filename.endswith(('.mp4', '.mov', '.avi', '.webm')):
+        existing = find_archive_by_media(media_sha, "video")
+        if existing:
+            result = {"analysis": existing["data"]["analysis"], "previews": existing["data"].get("previews")}
+            archive_id = existing["id"]
+        else:
+            # Pass file_path to avoid reloading large file into RAM
+            with metrics.span("analysis", kind="video"):
+                result = await analyze_video(file_path, content_type, coach="hu", severity=5, style="conservative", media_sha=media_sha)
+            archive_id = None
+        
+        if "analysis" in result:
+             # 1. Save to Archive (The permanent report store)
+             if archive_id is None:
+                 archive_id = await asyncio.to_thread(
+                    save_archive_entry,
+                    type="video",
+                    result=result["analysis"].get("analysis_report", {}).get("video_info", "Video Analysis"),
+                    data={
+                        "analysis": result["analysis"],
+                        "file_url": file_url,
+                        "media_sha": media_sha,
+                        "previews": result.get("previews")
+                    }
+                 )
+             
+             # 2. Save to Chat Session (The conversation history)
+             card_data = {
+                 "type": "video",
+                 "data": result["analysis"],
+                 "fileUrl": file_url,
+                 "previews": result.get("previews"),
+                 "archiveId": archive_id # Link to the archive
+             }
+             await asyncio.to_thread(
+                 add_message, session_id, "assistant", "视频分析已完成，点击下方报告查看详情。", "report_card", card_data
+             )
+
+             return {
+                 "role": "assistant",
+                 "content": "视频分析已完成，点击下方报告查看详情。",
+                 "type": "report_card",
+                 "cardData": card_data,
+                 "sessionId": session_id
+             }
+        if result.get("retry_after") is not None:
+            raise _model_error(result)
+        return result
+
+    # Style/OOTD Analysis Intent
+    elif filename.endswith(('.jpg', '.jpeg', '.png', '.webp')):
+        existing = find_archive_by_media(media_sha, "style")
+        if existing:
+            result = {k: v for k, v in existing["data"].items() if k not in ("file_url", "media_sha")}
+            archive_id = existing["id"]
+        else:
+            # Read file content for image analysis (Images are small enough)
+            async with aiofiles.open(file_path, 'rb') as f:
+                content = await f.read()
+                
+            with metrics.span("analysis", kind="style"):
+                result = await analyze_photo(content, content_type)
+            
+            # Check for errors from analysis
+            if result.get("retry_after") is not None:
+                raise _model_error(result)
+            if "error" in result:
+                return result # Return error directly
+
+            # 1. Save to Archive (The permanent report store)
+            archive_id = await asyncio.to_thread(
+                save_archive_entry,
+                type="style",
+                result=result.get("one_line_summary", "Style Analysis"),
+                data={
+                    **result,
+                    "file_url": file_url,
+                    "media_sha": media_sha
+                }
+            )
+
+        # 2. Save to Chat Session (The conversation history)
+        card_data = {
+            "type": "style",
+            "data": result,
+            "fileUrl": file_url,
+            "archiveId": archive_id # Link to the archive
+        }
+        await asyncio.to_thread(
+            add_message, session_id, "assistant", result.get("message", "穿搭分析已完成。"), "report_card", card_data
+        )
+
+        return {
+             "role": "assistant",
+             "content": result.get("message", "穿搭分析已完成。"),
+             "type": "report_card",
+             "cardData": card_data,
+             "sessionId": session_id
+         }
+
+    return None
+
 @api_router.post("/chat")
 async def chat_endpoint(
+    request: Request,
     message: Optional[str] = Form(None),
     file: Optional[UploadFile] = File(None),
     context: Optional[str] = Form(None),
@@ -50,139 +271,186 @@ async def chat_endpoint(
     """
     Unified Chat Endpoint for Text, Video, and Image.
     """
-    from app.services.history import create_session, add_message, save_archive_entry
+    from app.services.history import create_session, add_message
+
+    # File uploads count against the (stricter) analysis rate limit
+    await enforce_rate(request, "analysis" if file else "chat")
 
     try:
         # Ensure Session Exists (only if not provided or empty string)
         if not session_id or session_id == "null" or session_id == "undefined":
-            session = create_session()
+            session = await asyncio.to_thread(create_session)
             session_id = session["id"]
 
         # 1. Handle File Uploads (Intent Recognition by File Type)
         if file:
-            filename = file.filename.lower()
-            
-            # Save file to static/uploads (Streamed to avoid RAM issues)
-            import uuid
-            import aiofiles
-            
-            file_ext = os.path.splitext(filename)[1]
-            unique_filename = f"{uuid.uuid4()}{file_ext}"
-            file_path = os.path.join(os.path.dirname(__file__), "..", "..", "static", "uploads", unique_filename)
-            
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            
-            async with aiofiles.open(file_path, 'wb') as out_file:
-                while content_chunk := await file.read(1024 * 1024):  # 1MB chunks
-                    await out_file.write(content_chunk)
-                
-            file_url = f"http://localhost:8000/static/uploads/{unique_filename}"
-            
-            # Save User Message (File)
-            add_message(session_id, "user", f"Uploaded file: {filename}", "file", {"url": file_url})
+            from app.services.media import store_stream
 
-            # Video Analysis Intent
-            if filename.endswith(('.mp4', '.mov', '.avi', '.webm')):
-                # Pass file_path to avoid reloading large file into RAM
-                result = await analyze_video(file_path, file.content_type, coach="hu", severity=5, style="conservative")
-                
-                if "analysis" in result:
-                     # 1. Save to Archive (The permanent report store)
-                     archive_id = save_archive_entry(
-                        type="video",
-                        result=result["analysis"].get("analysis_report", {}).get("video_info", "Video Analysis"),
-                        data={
-                            "analysis": result["analysis"],
-                            "file_url": file_url
-                        }
-                     )
-                     
-                     # 2. Save to Chat Session (The conversation history)
-                     card_data = {
-                         "type": "video",
-                         "data": result["analysis"],
-                         "fileUrl": file_url,
-                         "archiveId": archive_id # Link to the archive
-                     }
-                     add_message(session_id, "assistant", "视频分析已完成，点击下方报告查看详情。", "report_card", card_data)
-
-                     return {
-                         "role": "assistant",
-                         "content": "视频分析已完成，点击下方报告查看详情。",
-                         "type": "report_card",
-                         "cardData": card_data,
-                         "sessionId": session_id
-                     }
-                return result
+            async def read_chunks():
+                while content_chunk := await file.read(1024 * 1024):  # 1MB chunks
+                    yield content_chunk
 
-            # Style/OOTD Analysis Intent
-            elif filename.endswith(('.jpg', '.jpeg', '.png', '.webp')):
-                # Read file content for image analysis (Images are small enough)
-                async with aiofiles.open(file_path, 'rb') as f:
-                    content = await f.read()
-                    
-                result = await analyze_photo(content, file.content_type)
-                
-                # Check for errors from analysis
-                if "error" in result:
-                    return result # Return error directly
-
-                # 1. Save to Archive (The permanent report store)
-                archive_id = save_archive_entry(
-                    type="style",
-                    result=result.get("one_line_summary", "Style Analysis"),
-                    data={
-                        **result,
-                        "file_url": file_url
-                    }
-                )
-
-                # 2. Save to Chat Session (The conversation history)
-                card_data = {
-                    "type": "style",
-                    "data": result,
-                    "fileUrl": file_url,
-                    "archiveId": archive_id # Link to the archive
-                }
-                add_message(session_id, "assistant", result.get("message", "穿搭分析已完成。"), "report_card", card_data)
+            # Stream into the content-addressed media store (identical uploads are stored once)
+            with metrics.span("upload"):
+                media = await store_stream(read_chunks(), file.filename, file.content_type)
 
-                return {
-                     "role": "assistant",
-                     "content": result.get("message", "穿搭分析已完成。"),
-                     "type": "report_card",
-                     "cardData": card_data,
-                     "sessionId": session_id
-                 }
+            result = await _analyze_uploaded_file(session_id, file.filename, file.content_type, media)
+            if result is not None:
+                return result
 
         # 2. Handle Text Chat
         if message:
             # Save User Message
-            add_message(session_id, "user", message)
+            await asyncio.to_thread(add_message, session_id, "user", message)
+
+            from app.services.qwen import chat_with_coach
 
             ctx = json.loads(context) if context else None
             result = await chat_with_coach(message, ctx)
             if "error" in result:
-                 raise HTTPException(status_code=500, detail=result["error"])
+                 raise _model_error(result)
             
             # Save Assistant Message
-            add_message(session_id, "assistant", result["response"])
+            await asyncio.to_thread(add_message, session_id, "assistant", result["response"])
 
             return {
                 "role": "assistant",
                 "content": result["response"],
                 "type": "text",
+                "modelMeta": result.get("model_meta"),
                 "sessionId": session_id
             }
 
         return {"error": "No message or file provided"}
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- Resumable Uploads ---
+# init -> PUT chunks at offsets (each with its SHA-256) -> finalize, which runs the /chat analysis.
+# An interrupted upload resumes from GET status's "missing" ranges instead of starting over.
+
+@api_router.post("/uploads")
+async def init_upload_endpoint(
+    filename: str = Body(..., embed=True),
+    size: int = Body(..., embed=True),
+    content_type: Optional[str] = Body(None, embed=True),
+    session_id: Optional[str] = Body(None, embed=True)
+):
+    from app.services.uploads import create_upload, UploadError
+    try:
+        return await asyncio.to_thread(create_upload, filename, size, content_type, session_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.put("/uploads/{id}")
+async def upload_chunk_endpoint(
+    id: str,
+    request: Request,
+    offset: int = Query(...),
+    x_chunk_sha256: Optional[str] = Header(None)
+):
+    """
+    Writes the raw request body at `offset` of the upload. The body is streamed straight
+    into the final file; X-Chunk-Sha256 must match for the range to count as received.
+    """
+    from app.services.uploads import write_chunk, UploadError
+    try:
+        with metrics.span("upload_chunk"):
+            return await write_chunk(id, offset, request.stream(), x_chunk_sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/uploads/{id}")
+async def upload_status_endpoint(id: str):
+    from app.services.uploads import get_upload_status, UploadError
+    try:
+        return get_upload_status(id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@api_router.post("/uploads/{id}/finalize", dependencies=[Depends(rate_limit("analysis"))])
+async def finalize_upload_endpoint(
+    id: str,
+    sha256: Optional[str] = Body(None, embed=True),
+    session_id: Optional[str] = Body(None, embed=True)
+):
+    """
+    Completes the upload and analyzes the file in place, answering like /chat does for a file.
+    """
+    from app.services.uploads import finalize_upload, UploadError
+    from app.services.history import create_session
+
+    try:
+        with metrics.span("upload_finalize"):
+            upload = await asyncio.to_thread(finalize_upload, id, sha256)
+
+        session_id = session_id or upload.get("session_id")
+        if not session_id or session_id == "null" or session_id == "undefined":
+            session_id = (await asyncio.to_thread(create_session))["id"]
+
+        result = await _analyze_uploaded_file(session_id, upload["filename"], upload.get("content_type"), upload["media"])
+        if result is None:
+            return {"error": "Unsupported file type", "sessionId": session_id}
+        return result
+    except HTTPException:
+        raise
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# --- Media ---
+
+@api_router.api_route("/media/{name}", methods=["GET", "HEAD"])
+async def get_media_file(name: str):
+    """
+    Serves stored media by content hash (`<sha256><ext>`), with HTTP Range support for seeking,
+    a strong ETag and immutable caching, so browsers and CDNs never refetch it.
+    """
+    from app.api.media_response import MediaFileResponse
+    from app.services.media import get_media, media_path, touch
+
+    sha = name.split(".", 1)[0]
+    record = get_media(sha)
+    if record is None or not os.path.exists(media_path(record)):
+        raise HTTPException(status_code=404, detail="Media not found")
+    await asyncio.to_thread(touch, sha)
+    return MediaFileResponse(media_path(record), etag=sha, media_type=record.get("content_type") or None)
+
+@api_router.get("/media/{sha}/{asset}")
+async def get_media_asset(sha: str, asset: str):
+    """
+    Returns a preview asset of stored media: poster (JPEG, generated on first request if the
+    analysis did not produce one), sprite (thumbnail sheet of the analyzed frames) or proxy (low-res MP4).
+    """
+    from app.api.media_response import MediaFileResponse
+    from app.services.media import ASSET_SUFFIXES, asset_path, get_poster
+
+    if asset not in ASSET_SUFFIXES:
+        raise HTTPException(status_code=404, detail="Unknown media asset")
+    path = asset_path(sha, asset)
+    if asset == "poster" and not os.path.exists(path):
+        path = await asyncio.to_thread(get_poster, sha)
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Media asset not found")
+    media_type = "video/mp4" if asset == "proxy" else "image/jpeg"
+    version = int(os.path.getmtime(path))
+    return MediaFileResponse(path, etag=f"{sha}-{asset}-{version}", media_type=media_type)
+
+
 # --- Knowledge Base Endpoints ---
 
 @api_router.post("/knowledge/add")
@@ -191,14 +459,18 @@ async def add_knowledge(
     tags: List[str] = Body([], embed=True),
     source: str = Body("USER", embed=True)
 ):
+    from app.services.knowledge import add_knowledge_candidate
+
     try:
-        id = add_knowledge_candidate(content, tags, source)
+        id = await asyncio.to_thread(add_knowledge_candidate, content, tags, source)
         return {"id": id, "message": "Knowledge candidate added successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/knowledge/list")
 async def list_knowledge(status: Optional[str] = None):
+    from app.services.knowledge import get_knowledge_entries
+
     try:
         return get_knowledge_entries(status)
     except Exception as e:
@@ -206,22 +478,28 @@ async def list_knowledge(status: Optional[str] = None):
 
 @api_router.put("/knowledge/{id}/approve")
 async def approve_knowledge(id: str):
+    from app.services.knowledge import approve_knowledge_entry
+
     try:
-        approve_knowledge_entry(id)
+        await asyncio.to_thread(approve_knowledge_entry, id)
         return {"message": "Knowledge approved"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.put("/knowledge/{id}/reject")
 async def reject_knowledge(id: str):
+    from app.services.knowledge import reject_knowledge_entry
+
     try:
-        reject_knowledge_entry(id)
+        await asyncio.to_thread(reject_knowledge_entry, id)
         return {"message": "Knowledge rejected"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.post("/knowledge/search")
+@api_router.post("/knowledge/search", dependencies=[Depends(rate_limit("chat"))])
 async def search_knowledge_endpoint(query: str = Body(..., embed=True)):
+    from app.services.knowledge import search_knowledge
+
     try:
         results = search_knowledge(query)
         return results
@@ -235,7 +513,7 @@ async def delete_knowledge(id: str):
     """
     try:
         from app.services.knowledge import delete_knowledge_entry
-        delete_knowledge_entry(id)
+        await asyncio.to_thread(delete_knowledge_entry, id)
         return {"message": "Knowledge entry deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -252,7 +530,7 @@ async def update_knowledge(
     """
     try:
         from app.services.knowledge import update_knowledge_entry
-        update_knowledge_entry(id, content, tags, status)
+        await asyncio.to_thread(update_knowledge_entry, id, content, tags, status)
         return {"message": "Knowledge entry updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -363,13 +641,14 @@ async def get_dashboard_stats():
         }
 
 @api_router.get("/documentation")
-async def get_documentation_endpoint():
+async def get_documentation_endpoint(request: Request):
     """
     Returns the project documentation from the dynamic store.
+    Supports ETag / If-None-Match (304 when unchanged).
     """
     try:
-        from app.services.documentation import get_all_docs
-        return get_all_docs()
+        from app.services.reference_data import documentation
+        return json_with_etag(request, *documentation.body())
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -385,7 +664,7 @@ async def update_doc_section_endpoint(
     """
     try:
         from app.services.documentation import update_doc_section
-        success = update_doc_section(id, title, content, append)
+        success = await asyncio.to_thread(update_doc_section, id, title, content, append)
         if not success:
             raise HTTPException(status_code=404, detail="Documentation entry not found")
         return {"message": "Section updated successfully"}
@@ -395,31 +674,13 @@ async def update_doc_section_endpoint(
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/technical-guides")
-async def get_technical_guides():
+async def get_technical_guides(request: Request):
     """
     Returns the list of technical guides.
+    Supports ETag / If-None-Match (304 when unchanged).
     """
-    guides_file = os.path.join(get_data_dir(), "technical_guides.json")
-    
-    # Try to find the file in the source tree first (read-only)
-    source_guides_file = os.path.join(os.path.dirname(__file__), "..", "..", "data", "technical_guides.json")
-    
-    if os.path.exists(source_guides_file):
-        try:
-            with open(source_guides_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error reading source technical guides: {e}")
-            
-    # Fallback to get_data_dir() if source not found (e.g. if we decide to make it writable later)
-    if os.path.exists(guides_file):
-        try:
-            with open(guides_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error reading technical guides: {e}")
-
-    return []
+    from app.services.reference_data import technical_guides
+    return json_with_etag(request, *technical_guides.body())
 
 @api_router.get("/sessions")
 async def get_sessions_endpoint():
@@ -452,7 +713,7 @@ async def get_session_detail(id: str):
 async def delete_session_endpoint(id: str):
     try:
         from app.services.history import delete_session
-        success = delete_session(id)
+        success = await asyncio.to_thread(delete_session, id)
         if not success:
             raise HTTPException(status_code=404, detail="Session not found")
         return {"message": "Session deleted"}
@@ -548,7 +809,7 @@ async def delete_archive_endpoint(id: str):
     """
     try:
         from app.services.history import delete_archive
-        success = delete_archive(id)
+        success = await asyncio.to_thread(delete_archive, id)
         if not success:
              raise HTTPException(status_code=404, detail="Archive not found")
         return {"message": "Archive deleted successfully"}
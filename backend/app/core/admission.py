@@ -0,0 +1,299 @@
+"""
+Admission control for expensive work: per-client token-bucket rate limits on the analysis
+and chat endpoints, and a global concurrency limit per workload class (decode, vision, chat,
+embedding) with a bounded wait. Rejections raise AdmissionRejected, answered as 429 with
+Retry-After.
+
+State lives in a backend: in-process memory by default, or Redis (ADMISSION_BACKEND=redis)
+so limits are shared across instances. Other backends can be installed with set_backend().
+"""
+import logging
+import math
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from app.core import metrics
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+WORKLOADS = ("decode", "vision", "chat", "embedding")
+
+
+class AdmissionRejected(Exception):
+    """Over a rate limit or no capacity within the wait budget."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def to_result(self) -> dict:
+        """The error dict services return instead of raising."""
+        return {"error": str(self), "retry_after": self.retry_after, "status_code": 429}
+
+
+# --- Backends ---
+
+class MemoryBackend:
+    """Per-process state: limits apply to each worker/container separately."""
+
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float, float, int]] = {}  # key -> (tokens, updated_at, rate, burst)
+        self._conditions: Dict[str, threading.Condition] = {}
+        self._active: Dict[str, int] = {}
+        self._waiting: Dict[str, int] = {}
+
+    def take_token(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        """Takes one token from the bucket. Returns (allowed, seconds until a token is available)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (float(burst), now))[:2]
+            tokens = min(float(burst), tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[key] = (tokens, now, rate, burst)
+            if len(self._buckets) > 10000:
+                self._prune(now)
+        return allowed, 0.0 if allowed else (1.0 - tokens) / rate
+
+    def _prune(self, now: float):
+        # Buckets that have refilled completely (at their own scope's rate) carry no state
+        full = [
+            k for k, (tokens, at, rate, burst) in self._buckets.items() if tokens + (now - at) * rate >= burst
+        ]
+        for key in full:
+            del self._buckets[key]
+
+    def _condition(self, name: str) -> threading.Condition:
+        with self._lock:
+            condition = self._conditions.get(name)
+            if condition is None:
+                condition = self._conditions[name] = threading.Condition()
+            return condition
+
+    def acquire(self, name: str, limit: int, timeout: float, max_queue: int) -> Optional[str]:
+        """Takes a slot, waiting up to `timeout`. Returns a lease token, or None when rejected."""
+        condition = self._condition(name)
+        deadline = time.monotonic() + timeout
+        with condition:
+            if self._active.get(name, 0) >= limit:
+                if self._waiting.get(name, 0) >= max_queue:
+                    return None
+                self._waiting[name] = self._waiting.get(name, 0) + 1
+                try:
+                    while self._active.get(name, 0) >= limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return None
+                        condition.wait(remaining)
+                finally:
+                    self._waiting[name] -= 1
+            self._active[name] = self._active.get(name, 0) + 1
+        return name
+
+    def release(self, name: str, token: str):
+        condition = self._condition(name)
+        with condition:
+            self._active[name] = max(0, self._active.get(name, 0) - 1)
+            condition.notify()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: {"active": self._active.get(name, 0), "waiting": self._waiting.get(name, 0)} for name in WORKLOADS}
+
+
+_TOKEN_BUCKET_LUA = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+_SEMAPHORE_LUA = """
+local now, limit, lease = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < limit then
+  redis.call('ZADD', KEYS[1], now + lease, ARGV[4])
+  redis.call('EXPIRE', KEYS[1], math.ceil(lease))
+  return 1
+end
+return 0
+"""
+
+
+class RedisBackend:
+    """
+    Shared state in Redis (optional `redis` package). Slots are leases in a sorted set that
+    expire after ADMISSION_LEASE_SECONDS, so a crashed worker cannot hold capacity forever.
+    Waiting for a slot polls; there is no shared queue limit.
+    """
+
+    shared = True
+    _POLL_SECONDS = 0.05
+
+    def __init__(self, url: str, prefix: str = "lssq:admission:"):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._take = self._redis.register_script(_TOKEN_BUCKET_LUA)
+        self._acquire = self._redis.register_script(_SEMAPHORE_LUA)
+
+    def take_token(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        allowed, tokens = self._take(keys=[self._prefix + "rate:" + key], args=[rate, burst, time.time()])
+        return bool(allowed), 0.0 if allowed else (1.0 - float(tokens)) / rate
+
+    def acquire(self, name: str, limit: int, timeout: float, max_queue: int) -> Optional[str]:
+        token = uuid.uuid4().hex
+        key = self._prefix + "slots:" + name
+        deadline = time.monotonic() + timeout
+        while True:
+            if self._acquire(keys=[key], args=[time.time(), limit, settings.ADMISSION_LEASE_SECONDS, token]):
+                return token
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self._POLL_SECONDS)
+
+    def release(self, name: str, token: str):
+        self._redis.zrem(self._prefix + "slots:" + name, token)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        now = time.time()
+        return {name: {"active": self._redis.zcount(self._prefix + "slots:" + name, now, "+inf")} for name in WORKLOADS}
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = MemoryBackend()
+            if settings.ADMISSION_BACKEND == "redis":
+                try:
+                    _backend = RedisBackend(settings.ADMISSION_REDIS_URL)
+                except Exception as e:  # missing package or bad URL: limits stay per process
+                    logger.error(f"Redis admission backend unavailable, using in-memory limits: {e}")
+        return _backend
+
+
+def set_backend(backend):
+    """Installs a custom backend (same methods as MemoryBackend)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+# --- Rate limits ---
+
+def _rate(scope: str) -> Tuple[float, int]:
+    if scope == "analysis":
+        return settings.RATE_LIMIT_ANALYSIS_PER_MINUTE / 60.0, settings.RATE_LIMIT_ANALYSIS_BURST
+    return settings.RATE_LIMIT_CHAT_PER_MINUTE / 60.0, settings.RATE_LIMIT_CHAT_BURST
+
+
+def client_key(request) -> str:
+    """
+    Client identity for rate limits. Behind TRUSTED_PROXY_HOPS proxies it is the X-Forwarded-For
+    address that many hops from the right (what the outermost trusted proxy saw; anything left
+    of it is client-controlled). Otherwise, or when the header is shorter, the peer address.
+    """
+    hops = settings.TRUSTED_PROXY_HOPS
+    if hops > 0:
+        forwarded = ",".join(request.headers.getlist("x-forwarded-for"))
+        addresses = [a.strip() for a in forwarded.split(",") if a.strip()]
+        if len(addresses) >= hops:
+            return addresses[-hops]
+    return request.client.host if request.client else "unknown"
+
+
+def check_rate(client: str, scope: str):
+    """Takes a token from the client's `scope` bucket (analysis or chat) or raises AdmissionRejected."""
+    if not settings.ADMISSION_ENABLED:
+        return
+    rate, burst = _rate(scope)
+    if rate <= 0:
+        return
+    allowed, retry_after = get_backend().take_token(f"{scope}:{client}", rate, burst)
+    if not allowed:
+        raise AdmissionRejected(f"Rate limit exceeded for {scope} requests", retry_after)
+
+
+async def enforce_rate(request, scope: str):
+    """check_rate for the request's client (off the event loop when the backend is remote)."""
+    import asyncio
+
+    if get_backend().shared:
+        await asyncio.to_thread(check_rate, client_key(request), scope)
+    else:
+        check_rate(client_key(request), scope)
+
+
+def rate_limit(scope: str):
+    """FastAPI dependency enforcing the per-client rate limit of `scope`."""
+    from fastapi import Request
+
+    async def dependency(request: Request):
+        await enforce_rate(request, scope)
+
+    return dependency
+
+
+# --- Concurrency ---
+
+def _limit(workload: str) -> int:
+    return {
+        "decode": settings.CONCURRENCY_DECODE,
+        "vision": settings.CONCURRENCY_VISION,
+        "chat": settings.CONCURRENCY_CHAT,
+        "embedding": settings.CONCURRENCY_EMBEDDING,
+    }[workload]
+
+
+@contextmanager
+def slot(workload: str):
+    """
+    Holds one of the workload's global slots (blocking). Waits at most ADMISSION_MAX_WAIT_SECONDS,
+    with at most ADMISSION_MAX_QUEUE waiters, then raises AdmissionRejected.
+    Call from worker threads, not the event loop.
+    """
+    limit = _limit(workload)
+    if not settings.ADMISSION_ENABLED or limit <= 0:
+        yield
+        return
+    backend = get_backend()
+    with metrics.span("admission_wait", workload=workload):
+        token = backend.acquire(workload, limit, settings.ADMISSION_MAX_WAIT_SECONDS, settings.ADMISSION_MAX_QUEUE)
+    if token is None:
+        raise AdmissionRejected(
+            f"Server busy ({workload}), please retry",
+            max(1.0, math.ceil(settings.ADMISSION_MAX_WAIT_SECONDS))
+        )
+    try:
+        yield
+    finally:
+        backend.release(workload, token)
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """Active (and, in memory, waiting) slots per workload."""
+    return get_backend().stats()
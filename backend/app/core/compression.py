@@ -0,0 +1,174 @@
+import gzip
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Only text-like payloads are worth compressing; media is already compressed and must keep Range semantics
+_COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+_EXCLUDED_TYPES = ("text/event-stream",)
+
+
+def _encoded_etag(etag: str, encoding: str) -> str:
+    """
+    ETag of the encoded representation: a strong tag gets an encoding suffix ("<tag>-br"), so
+    identity and encoded bodies never share a strong validator. Weak tags are left as they are.
+    """
+    if etag.startswith("W/"):
+        return etag
+    return f'{etag[:-1]}-{encoding}"' if etag.endswith('"') else f"{etag}-{encoding}"
+
+
+def strip_encoding_suffix(etag: str) -> str:
+    """The endpoint's own ETag for a tag this middleware suffixed (for If-None-Match checks)."""
+    for encoding in ("br", "gzip"):
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def _choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._impl = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._impl = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._impl.process(data)
+        return self._impl.compress(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == "br":
+            return self._impl.flush()
+        return self._impl.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._impl.finish()
+        return self._impl.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """
+    Brotli (when the optional `brotli` package is installed) or gzip response compression.
+
+    Unlike Starlette's GZipMiddleware it only touches text-like content types and full (200)
+    responses, so media served with Range/206 passes through untouched. Bodies smaller than
+    `minimum_size` are sent as is; streamed bodies are compressed chunk by chunk.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = _choose_encoding(request_headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(send, encoding, self, request_headers.get("if-none-match", ""))
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send: Send, encoding: str, config: CompressionMiddleware, if_none_match: str = ""):
+        self._send = send
+        self.if_none_match = if_none_match
+        self.encoding = encoding
+        self.config = config
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    def _compressible(self, message: Message) -> bool:
+        headers = Headers(raw=message["headers"])
+        content_type = headers.get("content-type", "")
+        return (
+            message["status"] == 200
+            and "content-encoding" not in headers
+            and content_type.startswith(_COMPRESSIBLE_TYPES)
+            and not content_type.startswith(_EXCLUDED_TYPES)
+        )
+
+    def _mark_encoded(self, headers: MutableHeaders):
+        headers["content-encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if "etag" in headers:
+            headers["etag"] = _encoded_etag(headers["etag"], self.encoding)
+
+    def _revalidated(self, headers: MutableHeaders):
+        # A 304 for the client's encoded copy carries that copy's tag
+        etag = headers.get("etag")
+        if etag and _encoded_etag(etag, self.encoding) in self.if_none_match:
+            headers["etag"] = _encoded_etag(etag, self.encoding)
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            self.passthrough = not self._compressible(message)
+            if self.passthrough:
+                if message["status"] == 304:
+                    self._revalidated(MutableHeaders(raw=message["headers"]))
+                await self._send(message)
+            return
+
+        if self.passthrough or message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(raw=self.start_message["headers"])
+
+        if self.compressor is None:
+            if not more_body:
+                # Whole body in one message
+                if len(body) < self.config.minimum_size:
+                    await self._send(self.start_message)
+                    await self._send(message)
+                    return
+                if self.encoding == "br":
+                    compressed = brotli.compress(body, quality=self.config.brotli_quality)
+                else:
+                    compressed = gzip.compress(body, compresslevel=self.config.gzip_level, mtime=0)
+                self._mark_encoded(headers)
+                headers["content-length"] = str(len(compressed))
+                await self._send(self.start_message)
+                await self._send({"type": "http.response.body", "body": compressed, "more_body": False})
+                return
+
+            # Streaming body: compress incrementally
+            self.compressor = _Compressor(self.encoding, self.config.gzip_level, self.config.brotli_quality)
+            self._mark_encoded(headers)
+            if "content-length" in headers:
+                del headers["content-length"]
+            await self._send(self.start_message)
+
+        chunk = self.compressor.compress(body)
+        chunk += self.compressor.flush() if more_body else self.compressor.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
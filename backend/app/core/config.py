@@ -14,6 +14,187 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./sql_app.db"
 
+    # Reference data (documentation, technical guides) is cached in memory; files are re-stat'ed this often
+    REFDATA_POLL_SECONDS: float = 2.0
+
+    # Qwen (DashScope) calls: timeouts, retries with jittered exponential backoff, hedged chat requests
+    # and a per-model circuit breaker that fails fast (503 + Retry-After) while the provider is degraded
+    QWEN_TIMEOUT_SECONDS: float = 60.0
+    QWEN_VIDEO_TIMEOUT_SECONDS: float = 180.0
+    QWEN_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    QWEN_MAX_RETRIES: int = 2
+    QWEN_BACKOFF_BASE_SECONDS: float = 0.5
+    QWEN_BACKOFF_MAX_SECONDS: float = 8.0
+    QWEN_HEDGE_CHAT: bool = True
+    QWEN_HEDGE_DELAY_SECONDS: float = 0.0  # fixed hedge delay; 0 = p95 of recent latencies
+    QWEN_HEDGE_INITIAL_DELAY_SECONDS: float = 3.0  # until enough latency samples exist
+    QWEN_HEDGE_MIN_DELAY_SECONDS: float = 1.0
+    QWEN_BREAKER_FAILURES: int = 5
+    QWEN_BREAKER_COOLDOWN_SECONDS: float = 30.0
+
+    # Model routing per task. Tiers are ordered fastest/cheapest -> best; the default tier serves normal
+    # inputs, small/large inputs (chat: characters, video: frames; 0 = off) go to the fastest/best tier.
+    # Tiers over their latency SLO (recent p95) or with an open circuit are tried last; failures fall back
+    # at once (retries are for the last candidate). *_DEADLINE_SECONDS caps a whole routed call (0 = none).
+    MODEL_ROUTING_ENABLED: bool = True
+    MODEL_CHAT_TIERS: str = "qwen-flash-character,qwen-plus-character"
+    MODEL_CHAT_DEFAULT_TIER: int = 0
+    MODEL_CHAT_SLO_SECONDS: float = 8.0
+    MODEL_CHAT_SMALL_INPUT: int = 200
+    MODEL_CHAT_LARGE_INPUT: int = 0
+    MODEL_CHAT_DEADLINE_SECONDS: float = 90.0
+    MODEL_VIDEO_TIERS: str = "qwen-vl-plus,qwen-omni-turbo,qwen-vl-max"
+    MODEL_VIDEO_DEFAULT_TIER: int = 1
+    MODEL_VIDEO_SLO_SECONDS: float = 90.0
+    MODEL_VIDEO_LARGE_INPUT: int = 0
+    MODEL_VIDEO_DEADLINE_SECONDS: float = 420.0
+    MODEL_STYLE_TIERS: str = "qwen-vl-plus,qwen-vl-max"
+    MODEL_STYLE_DEFAULT_TIER: int = 0
+    MODEL_STYLE_SLO_SECONDS: float = 30.0
+    MODEL_STYLE_DEADLINE_SECONDS: float = 150.0
+    MODEL_EMBEDDING: str = "text-embedding-v3"
+    MODEL_EMBEDDING_DEADLINE_SECONDS: float = 30.0
+
+    # Structured output of the analysis calls: JSON mode (or the report's JSON schema) for the listed
+    # models, others rely on the prompt. Responses are streamed and parsed incrementally by a repairing
+    # parser, so report sections can be forwarded early (POST /analyze/video/stream).
+    QWEN_JSON_MODE: bool = True
+    QWEN_JSON_MODE_MODELS: str = "qwen-vl-max,qwen-vl-plus,qwen-max,qwen-plus,qwen-flash,qwen-turbo"
+    QWEN_JSON_SCHEMA_MODELS: str = ""
+    QWEN_STREAM_ANALYSIS: bool = True
+
+    # Admission control: per-client token buckets (requests per minute + burst) on the analysis and chat
+    # endpoints, global concurrency per workload class; waits are bounded, then 429 with Retry-After.
+    # The memory backend is per process; "redis" (ADMISSION_REDIS_URL) shares limits across instances.
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_BACKEND: str = "memory"
+    ADMISSION_REDIS_URL: str = ""
+    # Reverse proxies in front of the app that append to X-Forwarded-For (Vercel: 1). 0 = use the peer
+    # address; a client can put anything in X-Forwarded-For, so only trusted hops are read from it.
+    TRUSTED_PROXY_HOPS: int = 0
+    RATE_LIMIT_ANALYSIS_PER_MINUTE: float = 6.0
+    RATE_LIMIT_ANALYSIS_BURST: int = 3
+    RATE_LIMIT_CHAT_PER_MINUTE: float = 30.0
+    RATE_LIMIT_CHAT_BURST: int = 10
+    CONCURRENCY_DECODE: int = 2
+    CONCURRENCY_VISION: int = 4
+    CONCURRENCY_CHAT: int = 16
+    CONCURRENCY_EMBEDDING: int = 8
+    ADMISSION_MAX_WAIT_SECONDS: float = 10.0
+    ADMISSION_MAX_QUEUE: int = 32  # waiters per workload (memory backend)
+    ADMISSION_LEASE_SECONDS: float = 600.0  # redis slot lease, frees slots of crashed workers
+
+    # Latency spans, counters and per-endpoint histograms, served in the Prometheus format at
+    # {API_V1_STR}/metrics (per process). Off: no middleware, spans are a shared no-op.
+    METRICS_ENABLED: bool = True
+
+    # Per-request traces (app/core/tracing.py): a root span per request with the metrics spans as children,
+    # trace id returned in X-Trace-Id. Exporter "file" (OTLP/JSON lines in TRACING_FILE, default
+    # <data dir>/traces.jsonl), "otlp" (OTLP/HTTP JSON; TRACING_OTLP_HEADERS as "k=v,k2=v2") or "none"
+    # (the default: nothing is written until an exporter is chosen).
+    TRACING_ENABLED: bool = True
+    TRACING_EXPORTER: str = "none"
+    TRACING_FILE: str = ""
+    TRACING_FILE_MAX_BYTES: int = 50 * 1024 * 1024
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_OTLP_HEADERS: str = ""
+    TRACING_EXPORT_TIMEOUT_SECONDS: float = 2.0
+    # Requests that fail, or take at least TRACING_MIN_DURATION_MS (when > 0), are always exported;
+    # the rest only when sampled
+    TRACING_SAMPLE_RATE: float = 0.1
+    TRACING_MIN_DURATION_MS: float = 0.0
+    TRACING_SERVICE_NAME: str = "badminton-ai-coach"
+
+    # Ops-only switches (sent as X-Admin-Key); empty disables them
+    ADMIN_KEY: str = ""
+    # On-demand request profiling (app/core/profiling.py): X-Profile: store|inline (or ?profile=) plus
+    # X-Admin-Key on one of PROFILE_ROUTES. Stored profiles go to PROFILE_DIR (default <data dir>/profiles).
+    PROFILE_ROUTES: str = "/chat,/dashboard/stats,/knowledge/search,/archives"
+    PROFILE_DIR: str = ""
+    PROFILE_KEEP: int = 50
+    PROFILE_INTERVAL_SECONDS: float = 0.001  # pyinstrument sampling interval
+
+    # Read-only data snapshot (scripts/build_snapshot.py) under the data dir; defaults to backend/snapshot
+    SNAPSHOT_ENABLED: bool = True
+    SNAPSHOT_DIR: str = ""
+
+    # Response compression (brotli when the optional package is installed, else gzip)
+    COMPRESSION_MIN_BYTES: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+
+    # JSON stores: batch writes arriving within this window into one commit (0 disables)
+    STORAGE_GROUP_COMMIT_MS: int = 0
+
+    # Session store write-behind (disabled on serverless, where containers freeze after a response)
+    SESSION_WRITE_BEHIND: bool = True
+    SESSION_FLUSH_INTERVAL_SECONDS: float = 2.0
+    SESSION_FLUSH_MAX_DIRTY: int = 20
+
+    # Knowledge embeddings sidecar (.npy) dtype: float32 or float16
+    EMBEDDING_DTYPE: str = "float32"
+
+    # Knowledge search: int8 approximate pass + exact float32 re-rank of the top candidates
+    KNOWLEDGE_QUANTIZED_SEARCH: bool = False
+    KNOWLEDGE_QUANTIZED_MIN_ROWS: int = 1000
+    KNOWLEDGE_RERANK_K: int = 50
+
+    # Video frames sent to the vision model (longest side keeps the aspect ratio)
+    FRAME_MAX_SIDE: int = 640
+    FRAME_FORMAT: str = "jpeg"  # jpeg or webp
+    FRAME_PAYLOAD_BUDGET_BYTES: int = 1_500_000  # total base64 bytes per request, 0 = unlimited
+    FRAME_TOKEN_BUDGET: int = 0  # estimated vision tokens per request, 0 = unlimited
+
+    # Crop frames to the detected player region before sending them (motion, hog or auto)
+    FRAME_CROP_PLAYER: bool = True
+    FRAME_ROI_METHOD: str = "auto"
+    FRAME_ROI_PADDING: float = 0.3
+
+    # Resumable chunked uploads (keep chunks under the platform request body limit, e.g. 4.5 MB on Vercel)
+    UPLOAD_CHUNK_MAX_BYTES: int = 4 * 1024 * 1024
+    UPLOAD_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    UPLOAD_EXPIRE_SECONDS: int = 24 * 3600
+
+    # Base URL clients use to reach this API (media links stored in archives and sessions)
+    PUBLIC_BASE_URL: str = "http://localhost:8000"
+
+    # Content-addressed media store (static/media): unreferenced files are evicted LRU above this size
+    MEDIA_MAX_BYTES: int = 5 * 1024 * 1024 * 1024
+    MEDIA_SWEEP_INTERVAL_SECONDS: float = 600.0
+    MEDIA_EVICT_GRACE_SECONDS: float = 3600.0
+
+    # Report previews built from the frames decoded for analysis (poster, sprite sheet, optional proxy MP4)
+    PREVIEW_ENABLED: bool = True
+    PREVIEW_THUMB_WIDTH: int = 160
+    PREVIEW_SPRITE_COLUMNS: int = 5
+    PREVIEW_PROXY: bool = False  # decodes every frame instead of seeking to the sampled ones
+    PREVIEW_PROXY_HEIGHT: int = 360
+    PREVIEW_PROXY_FPS: float = 15.0
+    PREVIEW_PROXY_FOURCC: str = "avc1"
+
+    # Perceptual (dHash) frame dedup within a request and reuse of per-frame work across requests
+    FRAME_DEDUP: bool = True
+    FRAME_DEDUP_OVERSAMPLE: int = 2  # decode this many times the frame budget, then drop near-duplicates
+    FRAME_HASH_THRESHOLD: int = 4  # max Hamming distance (of 64 bits) for two frames to count as the same
+    FRAME_DEDUP_MIN_FRAMES: int = 4  # keep at least this many frames for time coverage
+    FRAME_INDEX_ENABLED: bool = True
+    FRAME_INDEX_MAX_ENTRIES: int = 5000
+
+    # Optional local pose estimation (OpenCV DNN, OpenPose COCO-format model). Disabled when no model path is set.
+    POSE_MODEL_PATH: str = ""
+    POSE_CONFIG_PATH: str = ""  # e.g. the .prototxt for Caffe models
+    POSE_INPUT_SIZE: int = 368
+    POSE_CONFIDENCE: float = 0.1
+    POSE_SAMPLE_FRAMES: int = 24  # frames decoded for pose estimation
+    VIDEO_FRAMES_WITH_POSE: int = 6  # frames sent to the model when a motion summary is attached
+
+    # Long-video mode: per-segment analysis reduced into one report
+    LONG_VIDEO_THRESHOLD_SECONDS: float = 180.0
+    LONG_VIDEO_SEGMENT_SECONDS: float = 60.0
+    LONG_VIDEO_MAX_SEGMENTS: int = 30
+    LONG_VIDEO_FRAMES_PER_SEGMENT: int = 6
+    LONG_VIDEO_MAX_PARALLEL: int = 3
+
     model_config = SettingsConfigDict(env_file=".env", env_ignore_empty=True)
 
 @lru_cache
@@ -0,0 +1,49 @@
+import os
+import threading
+import time
+
+# Crockford base32 (no I, L, O, U) - lexicographic order matches numeric order
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+_TIME_LEN = 10   # 48-bit millisecond timestamp
+_RANDOM_LEN = 16  # 80-bit randomness
+_RANDOM_MAX = (1 << 80) - 1
+
+_lock = threading.Lock()
+_last_ms = 0
+_last_random = 0
+
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def new_id(prefix: str = "") -> str:
+    """
+    Returns a time-sortable, collision-free ID (ULID format).
+    IDs generated later always sort after earlier ones, even within the same millisecond,
+    so they can be used directly as range query bounds and pagination cursors.
+    """
+    global _last_ms, _last_random
+
+    with _lock:
+        now_ms = int(time.time() * 1000)
+        if now_ms <= _last_ms:
+            # Same millisecond (or clock stepped back): bump the random part to stay monotonic
+            now_ms = _last_ms
+            random_part = _last_random + 1
+            if random_part > _RANDOM_MAX:
+                now_ms += 1
+                random_part = int.from_bytes(os.urandom(10), "big") >> 1
+        else:
+            # Keep the top bit clear so the in-millisecond increment never overflows
+            random_part = int.from_bytes(os.urandom(10), "big") >> 1
+        _last_ms = now_ms
+        _last_random = random_part
+
+    return prefix + _encode(now_ms, _TIME_LEN) + _encode(random_part, _RANDOM_LEN)
+
@@ -0,0 +1,109 @@
+"""
+Startup import profiler for the serverless entry point (api/index.py, IMPORT_PROFILE=1).
+
+Works like `python -X importtime` for platforms where the interpreter flags cannot be set:
+a meta path finder wraps each module's loader and records its self and cumulative import
+time. Standard library only, so it can be enabled before anything else is imported.
+"""
+import logging
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# module name -> (self seconds, cumulative seconds)
+_records: Dict[str, Tuple[float, float]] = {}
+# Time spent in nested imports, one accumulator per module being executed
+_child_time: List[float] = []
+_finder: Optional["_TimingFinder"] = None
+_started_at = 0.0
+_elapsed = 0.0
+
+
+class _TimedLoader:
+    """Delegates to the real loader; only exec_module (the module body) is timed."""
+
+    def __init__(self, loader, name: str):
+        self._loader = loader
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # The module only ever sees its real loader
+        module.__loader__ = self._loader
+        if getattr(module, "__spec__", None) is not None:
+            module.__spec__.loader = self._loader
+
+        _child_time.append(0.0)
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = _child_time.pop()
+            if _child_time:
+                _child_time[-1] += elapsed
+            _records[self._name] = (elapsed - children, elapsed)
+
+
+class _TimingFinder:
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader, name)
+            return spec
+        return None
+
+
+def enable():
+    """Starts recording; modules imported before this call are not measured."""
+    global _finder, _started_at
+    if _finder is not None:
+        return
+    _records.clear()
+    _finder = _TimingFinder()
+    sys.meta_path.insert(0, _finder)
+    _started_at = time.perf_counter()
+
+
+def disable():
+    global _finder, _elapsed
+    if _finder is None:
+        return
+    _elapsed = time.perf_counter() - _started_at
+    sys.meta_path.remove(_finder)
+    _finder = None
+
+
+def results(top: int = 25) -> Dict:
+    """Total time and the `top` slowest modules by self time (milliseconds)."""
+    slowest = sorted(_records.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+        "total_ms": round(_elapsed * 1000, 1),
+        "modules": len(_records),
+        "slowest": [
+            {"module": name, "self_ms": round(own * 1000, 1), "cumulative_ms": round(cum * 1000, 1)}
+            for name, (own, cum) in slowest
+        ],
+        "heavy_loaded": [m for m in ("cv2", "numpy", "openai") if m in sys.modules]
+    }
+
+
+def log_report(top: int = 25):
+    report = results(top)
+    lines = [f"Startup imports: {report['total_ms']} ms, {report['modules']} modules; "
+             f"heavy modules loaded: {', '.join(report['heavy_loaded']) or 'none'}"]
+    lines += [f"  {m['self_ms']:8.1f} ms self {m['cumulative_ms']:8.1f} ms cumulative  {m['module']}"
+              for m in report["slowest"]]
+    logger.warning("\n".join(lines))
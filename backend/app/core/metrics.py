@@ -0,0 +1,258 @@
+"""
+In-process latency and counter instrumentation, exposed in the Prometheus text format at
+GET {API_V1_STR}/metrics.
+
+- span(stage) times a block into the stage histogram
+- observe(name, seconds, **labels) / inc(name, value, **labels) record histograms and counters
+- MetricsMiddleware times every request per route template
+
+With METRICS_ENABLED off every call returns immediately (span() hands out one shared no-op
+context manager outside traced requests) and the middleware is not installed. Values are per
+process: on serverless each instance reports its own, and Prometheus aggregates what it scrapes.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.core import tracing
+from app.core.config import get_settings
+
+settings = get_settings()
+
+PREFIX = "coach_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# name -> (type, help); metrics recorded under other names are exported as untyped
+METRICS = {
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by method, route template and status"),
+    "http_response_bytes_total": ("counter", "Response body bytes by route template (before compression)"),
+    "stage_duration_seconds": ("histogram", "Latency of request stages (upload, decode, encode, model call, parse, writes)"),
+    "model_call_duration_seconds": ("histogram", "Latency of single model call attempts by model and outcome (streams: until the response starts)"),
+    "model_tokens_total": ("counter", "Model tokens by model and kind (prompt, completion)"),
+    "model_request_bytes_total": ("counter", "Request payload bytes sent to the model (text and base64 frames)"),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result (hit, miss)"),
+}
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_lock = threading.Lock()
+_counters: Dict[_Key, float] = {}
+_histograms: Dict[_Key, List[float]] = {}  # bucket counts..., +Inf count, sum
+
+
+def enabled() -> bool:
+    return settings.METRICS_ENABLED
+
+
+def _key(name: str, labels: Dict[str, object]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    """Adds `value` to a counter."""
+    if not settings.METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def observe(name: str, value: float, **labels):
+    """Records one histogram observation (seconds for latencies)."""
+    if not settings.METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    position = bisect.bisect_left(_BUCKETS, value)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0.0] * (len(_BUCKETS) + 2)
+        histogram[position] += 1
+        histogram[-1] += value
+
+
+def cache_lookup(cache: str, hit: bool):
+    result = "hit" if hit else "miss"
+    inc("cache_requests_total", cache=cache, result=result)
+    tracing.set_attribute(f"cache.{cache}", result)
+
+
+class _Span:
+    __slots__ = ("stage", "labels", "start", "trace")
+
+    def __init__(self, stage: str, labels: Dict[str, object]):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.trace = tracing.start_span(self.stage, self.labels)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        tracing.end_span(self.trace, exc)
+        observe(
+            "stage_duration_seconds", time.perf_counter() - self.start,
+            stage=self.stage, outcome="error" if exc_type else "ok", **self.labels
+        )
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(stage: str, **labels):
+    """
+    Context manager timing a stage into stage_duration_seconds{stage, outcome}; inside a traced
+    request it is also a child span of the current trace span.
+    """
+    if not settings.METRICS_ENABLED and tracing.current_span() is None:
+        return _NOOP
+    return _Span(stage, labels)
+
+
+def record_usage(model: str, usage) -> None:
+    """Counts the tokens of an OpenAI-style `usage` object (no-op when absent); also set on the trace span."""
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", None) or 0
+    completion = getattr(usage, "completion_tokens", None) or 0
+    if not prompt and not completion:
+        prompt = getattr(usage, "total_tokens", None) or 0  # embeddings only report totals
+    tracing.set_attribute("llm.usage.prompt_tokens", prompt)
+    tracing.set_attribute("llm.usage.completion_tokens", completion)
+    if prompt:
+        inc("model_tokens_total", prompt, model=model, kind="prompt")
+    if completion:
+        inc("model_tokens_total", completion, model=model, kind="completion")
+
+
+# --- Exposition ---
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _gauges() -> List[Tuple[str, str, Dict[str, object], float]]:
+    """Point-in-time state of admission slots and circuit breakers: (name, help, labels, value)."""
+    from app.core import admission
+    from app.services import model_client
+
+    gauges = []
+    try:
+        for workload, stats in admission.stats().items():
+            for field, value in stats.items():
+                gauges.append((f"admission_slots_{field}", f"Admission slots {field} per workload", {"workload": workload}, value))
+    except Exception:  # remote backend unreachable: skip, the scrape should not fail
+        pass
+    states = {"closed": 0, "half_open": 1, "open": 2}
+    for model, breaker in model_client.breakers().items():
+        gauges.append(("circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", {"model": model}, states[breaker.state]))
+    return gauges
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(values) for key, values in _histograms.items()}
+
+    lines: List[str] = []
+    described = set()
+
+    def describe(name: str, kind: str, help_text: str):
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        kind, help_text = METRICS.get(name, ("untyped", name))
+        describe(name, kind, help_text)
+        lines.append(f"{PREFIX}{name}{_labels(labels)} {_number(value)}")
+
+    for (name, labels), values in sorted(histograms.items()):
+        kind, help_text = METRICS.get(name, ("histogram", name))
+        describe(name, "histogram", help_text)
+        cumulative = 0.0
+        for bound, count in zip(_BUCKETS + (float("inf"),), values):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            lines.append(f"{PREFIX}{name}_bucket{_labels(labels, ('le', le))} {_number(cumulative)}")
+        lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {values[-1]!r}")
+        lines.append(f"{PREFIX}{name}_count{_labels(labels)} {_number(cumulative)}")
+
+    for name, help_text, labels, value in sorted(_gauges(), key=lambda g: (g[0], sorted(g[2].items()))):
+        describe(name, "gauge", help_text)
+        lines.append(f"{PREFIX}{name}{_labels(_key(name, labels)[1])} {_number(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+# --- Middleware ---
+
+class MetricsMiddleware:
+    """Records http_request_duration_seconds (until the last body chunk) and response bytes per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                status["bytes"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    self._record(scope, status, start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            self._record(scope, status, start)
+            raise
+
+    @staticmethod
+    def _record(scope, status, start):
+        if status.get("recorded"):
+            return
+        status["recorded"] = True
+        # Route template, not the raw path: ids in paths would make a series per resource
+        route = getattr(scope.get("route"), "path", None) or "unmatched"
+        observe(
+            "http_request_duration_seconds", time.perf_counter() - start,
+            method=scope["method"], route=route, status=status["code"]
+        )
+        inc("http_response_bytes_total", status["bytes"], route=route)
@@ -0,0 +1,222 @@
+"""
+On-demand profiling of single requests, for ops: shows where a hot endpoint spends its time on
+production data (e.g. an O(n) history scan) without copying that data anywhere.
+
+A request to one of PROFILE_ROUTES with `X-Profile: store|inline` (or `?profile=store|inline`)
+and `X-Admin-Key: <ADMIN_KEY>` runs under a profiler:
+- "store": the normal response; the profile is written to PROFILE_DIR (name in X-Profile-File)
+- "inline": the profile as text instead of the response (its status in X-Profiled-Status)
+
+pyinstrument (sampling, async-aware; stored as HTML) is used when installed, else cProfile
+(stored as .prof for pstats/snakeviz). Work the request hands to asyncio.to_thread is profiled
+in its worker thread and merged into the same report (see install_executor). One request is
+profiled at a time; with cProfile, other requests served by the event loop meanwhile show up too.
+Without ADMIN_KEY nothing is installed.
+"""
+import asyncio
+import contextvars
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.core.config import get_settings, get_data_dir
+
+try:
+    import pyinstrument
+    from pyinstrument.renderers import ConsoleRenderer, HTMLRenderer
+    from pyinstrument.session import Session as PyinstrumentSession
+except ImportError:
+    pyinstrument = None
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+PROFILE_HEADER = "X-Profile"
+ADMIN_KEY_HEADER = "X-Admin-Key"
+_MODES = ("store", "inline")
+_EXTENSION = ".html" if pyinstrument is not None else ".prof"
+_TOP_FUNCTIONS = 60  # rows of the cProfile text report
+
+_session: contextvars.ContextVar[Optional["_Session"]] = contextvars.ContextVar("profile_session", default=None)
+_busy = threading.Lock()
+
+
+def _profiler(async_mode: bool = False):
+    if pyinstrument is not None:
+        return pyinstrument.Profiler(
+            interval=settings.PROFILE_INTERVAL_SECONDS, async_mode="enabled" if async_mode else "disabled"
+        )
+    return cProfile.Profile()
+
+
+def _start(profiler):
+    if pyinstrument is not None:
+        profiler.start()
+    else:
+        profiler.enable()
+
+
+def _stop(profiler):
+    if pyinstrument is not None:
+        profiler.stop()
+    else:
+        profiler.disable()
+
+
+class _Session:
+    """Profilers of one request: the event loop's, plus one per worker thread call."""
+
+    def __init__(self):
+        self.main = _profiler(async_mode=True)
+        self.threads: List = []
+        self.lock = threading.Lock()
+
+    def wrap(self, fn):
+        def run(*args, **kwargs):
+            profiler = _profiler()
+            _start(profiler)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _stop(profiler)
+                with self.lock:
+                    self.threads.append(profiler)
+        return run
+
+    def _profilers(self) -> List:
+        with self.lock:
+            return [self.main] + self.threads
+
+    def text(self) -> str:
+        profilers = self._profilers()
+        if pyinstrument is not None:
+            session = reduce(PyinstrumentSession.combine, [p.last_session for p in profilers])
+            return ConsoleRenderer(unicode=True, color=False).render(session)
+        buffer = io.StringIO()
+        pstats.Stats(*profilers, stream=buffer).sort_stats("cumulative").print_stats(_TOP_FUNCTIONS)
+        return buffer.getvalue()
+
+    def save(self, path: str):
+        profilers = self._profilers()
+        if pyinstrument is not None:
+            session = reduce(PyinstrumentSession.combine, [p.last_session for p in profilers])
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(HTMLRenderer().render(session))
+        else:
+            pstats.Stats(*profilers).dump_stats(path)
+
+
+class _ProfilingExecutor(ThreadPoolExecutor):
+    """Default executor that profiles the work a profiled request submits (asyncio.to_thread)."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        # Called on the event loop inside the submitting request's context
+        session = _session.get()
+        if session is not None:
+            fn = session.wrap(fn)
+        return super().submit(fn, *args, **kwargs)
+
+
+def install_executor():
+    """Replaces the running loop's default executor so to_thread work joins request profiles."""
+    asyncio.get_running_loop().set_default_executor(_ProfilingExecutor(thread_name_prefix="asyncio"))
+
+
+def profile_dir() -> str:
+    return settings.PROFILE_DIR or os.path.join(get_data_dir(), "profiles")
+
+
+def _save(session: _Session, name: str):
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    session.save(os.path.join(directory, name))
+    # Keep the newest PROFILE_KEEP (names start with a timestamp)
+    stored = sorted(f for f in os.listdir(directory) if f.endswith(_EXTENSION))
+    for old in stored[:max(0, len(stored) - settings.PROFILE_KEEP)]:
+        try:
+            os.remove(os.path.join(directory, old))
+        except OSError:
+            pass
+
+
+def _requested_mode(scope, headers) -> Optional[str]:
+    value = headers.get(PROFILE_HEADER.lower())
+    if value is None:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        value = (query.get("profile") or [None])[0]
+    if not value or value.lower() in ("0", "false", "off"):
+        return None
+    value = value.lower()
+    return value if value in _MODES else "store"
+
+
+class ProfilingMiddleware:
+    """Runs requests that ask for it (with the admin key) under a profiler; see the module docstring."""
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = {r.strip() for r in settings.PROFILE_ROUTES.split(",") if r.strip()}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(settings.API_V1_STR):
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        mode = _requested_mode(scope, headers)
+        route = scope["path"][len(settings.API_V1_STR):]
+        if mode is None or route not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        key = headers.get(ADMIN_KEY_HEADER.lower(), "")
+        if not hmac.compare_digest(key.encode(), settings.ADMIN_KEY.encode()):
+            await JSONResponse({"detail": "Invalid admin key"}, status_code=403)(scope, receive, send)
+            return
+        if not _busy.acquire(blocking=False):
+            await JSONResponse({"detail": "Another request is being profiled"}, status_code=409)(scope, receive, send)
+            return
+
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{route.strip('/').replace('/', '_')}-{os.urandom(3).hex()}{_EXTENSION}"
+        response = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                if mode == "inline":
+                    return
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-file", name.encode())]}
+            elif mode == "inline":
+                return  # the profile replaces the body
+            await send(message)
+
+        session = _Session()
+        try:
+            token = _session.set(session)
+            _start(session.main)
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                _stop(session.main)
+                _session.reset(token)
+            if mode == "inline":
+                text = await asyncio.to_thread(session.text)
+            else:
+                await asyncio.to_thread(_save, session, name)
+        finally:
+            _busy.release()
+
+        logger.info(f"Profiled {scope['method']} {route} ({mode}, status {response['status']})")
+        if mode == "inline":
+            await PlainTextResponse(text, headers={"X-Profiled-Status": str(response["status"])})(scope, receive, send)
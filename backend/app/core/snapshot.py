@@ -0,0 +1,65 @@
+"""
+Read-only data snapshot built at deploy time (scripts/build_snapshot.py) and used as the
+lower layer under the data dir.
+
+On serverless the data dir is an empty /tmp on every cold container. Reads of a store file
+that is missing from the data dir fall through to the snapshot copy; the first write goes
+through update_json, which reads the snapshot copy and writes the result to the data dir
+(copy-on-write). Nothing ever writes to the snapshot.
+"""
+import json
+import logging
+import os
+from functools import lru_cache
+from typing import Dict, Optional
+
+from app.core.config import get_settings, get_data_dir
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "snapshot")
+MANIFEST = "manifest.json"
+
+
+def get_snapshot_dir() -> str:
+    return os.path.abspath(get_settings().SNAPSHOT_DIR or DEFAULT_SNAPSHOT_DIR)
+
+
+@lru_cache
+def get_manifest() -> Dict:
+    """The snapshot manifest ({} when snapshots are disabled or none was built)."""
+    if not get_settings().SNAPSHOT_ENABLED:
+        return {}
+    path = os.path.join(get_snapshot_dir(), MANIFEST)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error(f"Ignoring unreadable data snapshot manifest {path}: {e}")
+        return {}
+    logger.info(f"Data snapshot built at {manifest.get('built_at')} ({len(manifest.get('files', {}))} files)")
+    return manifest
+
+
+def snapshot_file(name: str) -> Optional[str]:
+    """Path of a file in the snapshot, or None if the snapshot does not have it."""
+    if name not in get_manifest().get("files", {}):
+        return None
+    return os.path.join(get_snapshot_dir(), name)
+
+
+def fallback_path(path: str) -> Optional[str]:
+    """Snapshot copy of a data dir file, or None (files outside the data dir have none)."""
+    directory, name = os.path.split(os.path.abspath(path))
+    if directory != os.path.abspath(get_data_dir()):
+        return None
+    return snapshot_file(name)
+
+
+def read_path(path: str) -> str:
+    """`path` if it exists, else its snapshot copy when there is one (else `path`)."""
+    if os.path.exists(path):
+        return path
+    return fallback_path(path) or path
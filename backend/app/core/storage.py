@@ -0,0 +1,246 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class StorageError(Exception):
+    """Raised when a JSON store cannot be read safely (e.g. the file is corrupted)."""
+
+
+_path_locks: Dict[str, threading.Lock] = {}
+_path_locks_guard = threading.Lock()
+
+
+def _thread_lock(path: str) -> threading.Lock:
+    with _path_locks_guard:
+        lock = _path_locks.get(path)
+        if lock is None:
+            lock = _path_locks[path] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Exclusive write lock for a store file.
+    A per-path thread lock serializes writers inside this process, and an fcntl lock on a
+    sidecar `.lock` file serializes writers across processes (e.g. multiple uvicorn workers).
+    Not re-entrant: do not nest two locks on the same path.
+    """
+    path = os.path.abspath(path)
+    with _thread_lock(path):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _read(path: str, default: Any) -> Any:
+    # Data dir files missing on a fresh container are read from the build-time snapshot;
+    # writers then save the result to `path` (copy-on-write)
+    from app.core.snapshot import read_path
+
+    source = read_path(path)
+    if not os.path.exists(source):
+        return copy.deepcopy(default)
+    try:
+        with open(source, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise StorageError(f"Failed to read {source}: {e}") from e
+
+
+def load_json(path: str, default: Any = None) -> Any:
+    """
+    Reads a JSON store. Missing files return a copy of `default`.
+    A corrupted file is logged and also returns `default` so read endpoints stay up;
+    writers go through update_json, which refuses to overwrite it.
+    """
+    try:
+        return _read(path, default)
+    except StorageError as e:
+        logger.error(str(e))
+        return copy.deepcopy(default)
+
+
+def _fsync_dir(directory: str):
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_file(path: str, mode: str = "w", encoding: Optional[str] = "utf-8"):
+    """
+    Yields a temp file next to `path`; on success it is fsynced and atomically renamed over `path`.
+    Callers are responsible for holding the file's write lock.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600 files; keep the permissions a plain open() would have given
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+        _fsync_dir(directory)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _atomic_write(path: str, data: Any):
+    with atomic_file(path) as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def save_json(path: str, data: Any):
+    """Atomically replaces a JSON store (temp file + fsync + rename) under its write lock."""
+    with file_lock(path):
+        _atomic_write(path, data)
+
+
+# --- Group commit ---
+
+class _PendingUpdate:
+    __slots__ = ("mutate", "on_commit", "done", "result", "error")
+
+    def __init__(self, mutate: Callable[[Any], Any], on_commit: Optional[Callable[[], Any]] = None):
+        self.mutate = mutate
+        self.on_commit = on_commit
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Batch:
+    __slots__ = ("updates",)
+
+    def __init__(self):
+        self.updates: List[_PendingUpdate] = []
+
+
+_batches: Dict[str, _Batch] = {}
+_batches_guard = threading.Lock()
+
+
+def _group_commit_window() -> float:
+    from app.core.config import get_settings
+    return get_settings().STORAGE_GROUP_COMMIT_MS / 1000.0
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def _clone(data: Any) -> Any:
+    # Stores hold plain JSON, and a JSON round trip copies it much faster than deepcopy
+    return json.loads(json.dumps(data, ensure_ascii=False))
+
+
+def _apply(path: str, updates: List[_PendingUpdate], default: Any):
+    with file_lock(path):
+        data = _read(path, default)
+        committed = []
+        for update in updates:
+            # In a batch each mutate works on a copy, so one that raises halfway through
+            # leaves nothing behind for the others' write
+            target = _clone(data) if len(updates) > 1 else data
+            try:
+                update.result = update.mutate(target)
+            except Exception as e:
+                update.error = e
+                continue
+            data = target
+            committed.append(update)
+        if committed:
+            _atomic_write(path, data)
+            for update in committed:
+                if update.on_commit is not None:
+                    update.on_commit()
+
+
+def update_json(
+    path: str,
+    mutate: Callable[[Any], Any],
+    default: Any = None,
+    on_commit: Optional[Callable[[], Any]] = None
+) -> Any:
+    """
+    Locked read-modify-write of a JSON store. `mutate` edits the loaded data in place and
+    its return value is passed back to the caller; if it raises, its changes are not written.
+    `on_commit` runs after the write while the lock is still held (e.g. to stat the result).
+
+    With STORAGE_GROUP_COMMIT_MS > 0, updates from worker threads that arrive within the
+    window are applied to a single load and written once. Calls made on the event loop
+    thread never wait for the window; async code runs this through asyncio.to_thread, which
+    keeps the lock and fsync off the loop and lets the write join a batch.
+    """
+    path = os.path.abspath(path)
+    window = _group_commit_window()
+
+    if window <= 0 or _in_event_loop():
+        update = _PendingUpdate(mutate, on_commit)
+        _apply(path, [update], default)
+    else:
+        update = _PendingUpdate(mutate, on_commit)
+        with _batches_guard:
+            batch = _batches.get(path)
+            is_leader = batch is None
+            if is_leader:
+                batch = _batches[path] = _Batch()
+            batch.updates.append(update)
+
+        if is_leader:
+            time.sleep(window)
+            with _batches_guard:
+                _batches.pop(path, None)
+            try:
+                _apply(path, batch.updates, default)
+            except Exception as e:
+                for pending in batch.updates:
+                    pending.error = pending.error or e
+            finally:
+                for pending in batch.updates:
+                    pending.done.set()
+        else:
+            update.done.wait()
+
+    if update.error is not None:
+        raise update.error
+    return update.result
@@ -0,0 +1,322 @@
+"""
+Per-request traces in the OpenTelemetry data model (trace/span ids, parent links, attributes,
+status), without the OpenTelemetry SDK.
+
+TracingMiddleware opens a root span per request (continuing an incoming W3C `traceparent`)
+and returns its trace id in X-Trace-Id. Every metrics.span() inside the request becomes a child
+span, so one /chat video upload yields upload -> decode -> frame_encode -> model_call ->
+model_request -> json_parse -> archive_write -> session_write. The current span lives in a
+contextvar, which asyncio.to_thread copies into worker threads.
+
+Finished traces go to the exporter after the response is sent:
+- "file": one OTLP/JSON ExportTraceServiceRequest per line (the OpenTelemetry Collector file
+  exporter format; replayable to any OTLP/HTTP endpoint) in TRACING_FILE
+- "otlp": POST to an OTLP/HTTP collector (TRACING_OTLP_ENDPOINT)
+- "none" (default): trace ids and headers only
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.config import get_settings, get_data_dir
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+TRACE_HEADER = "X-Trace-Id"
+_MAX_SPANS_PER_TRACE = 1000
+# Metrics scrapes and static files would only add noise to the trace store
+_UNTRACED = ("/static/", f"{settings.API_V1_STR}/metrics")
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Trace:
+    """Spans of one request, collected until the root span ends."""
+
+    __slots__ = ("trace_id", "recording", "spans", "lock", "dropped")
+
+    def __init__(self, trace_id: str, recording: bool):
+        self.trace_id = trace_id
+        self.recording = recording  # collects child spans; export is decided when the root ends
+        self.spans: List["Span"] = []
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def add(self, span: "Span"):
+        with self.lock:
+            if len(self.spans) < _MAX_SPANS_PER_TRACE:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str] = None, kind: str = "internal"):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self, error: Optional[BaseException] = None):
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.end_ns = time.time_ns()
+        self.trace.add(self)
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    span = _current.get()
+    return span if span is not None and span.trace.recording else None
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace.trace_id if span is not None else None
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None):
+    """
+    Opens a child of the current span and makes it current. Returns (span, token) for end_span,
+    or None outside a recording trace.
+    """
+    parent = current_span()
+    if parent is None:
+        return None
+    span = Span(parent.trace, name, parent.span_id)
+    if attributes:
+        span.attributes.update(attributes)
+    return span, _current.set(span)
+
+
+def end_span(handle, error: Optional[BaseException] = None):
+    if handle is None:
+        return
+    span, token = handle
+    span.end(error)
+    try:
+        _current.reset(token)
+    except ValueError:  # ended in another context (e.g. a generator finalized elsewhere)
+        pass
+
+
+def set_attribute(key: str, value: Any):
+    """Sets an attribute on the current span (no-op outside a trace)."""
+    span = current_span()
+    if span is not None:
+        span.set(key, value)
+
+
+def record_span(
+    name: str,
+    start_ns: int,
+    end_ns: int,
+    attributes: Optional[Dict[str, Any]] = None,
+    error: Optional[BaseException] = None
+):
+    """Adds an already finished child span of the current span (e.g. work interleaved with a stream)."""
+    parent = current_span()
+    if parent is None:
+        return
+    span = Span(parent.trace, name, parent.span_id)
+    span.start_ns, span.end_ns = start_ns, end_ns
+    if attributes:
+        span.attributes.update(attributes)
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    parent.trace.add(span)
+
+
+def run_in_context(func):
+    """Wraps `func` to run in a copy of the caller's context (for executors that do not copy it)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+# --- Export ---
+
+def _attribute(key: str, value: Any) -> Dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def _otlp_span(span: Span) -> Dict:
+    otlp = {
+        "traceId": span.trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 2 if span.kind == "server" else 1,  # SPAN_KIND_SERVER / SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [_attribute(k, v) for k, v in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+def to_otlp(spans: List[Span]) -> Dict:
+    """An OTLP/JSON ExportTraceServiceRequest body (ids hex-encoded, as OTLP/JSON requires)."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", settings.TRACING_SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "app.core.tracing"}, "spans": [_otlp_span(s) for s in spans]}],
+        }]
+    }
+
+
+def trace_file() -> str:
+    return settings.TRACING_FILE or os.path.join(get_data_dir(), "traces.jsonl")
+
+
+_file_lock = threading.Lock()
+
+
+def _export_file(body: Dict):
+    path = trace_file()
+    line = json.dumps(body, ensure_ascii=False, separators=(",", ":")) + "\n"
+    with _file_lock:
+        try:
+            if os.path.getsize(path) > settings.TRACING_FILE_MAX_BYTES:
+                os.replace(path, path + ".1")  # keep one rotated file
+        except OSError:
+            pass
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def _otlp_headers() -> Dict[str, str]:
+    headers = {"Content-Type": "application/json"}
+    for pair in settings.TRACING_OTLP_HEADERS.split(","):
+        if "=" in pair:
+            key, value = pair.split("=", 1)
+            headers[key.strip()] = value.strip()
+    return headers
+
+
+def _export_otlp(body: Dict):
+    import httpx
+
+    response = httpx.post(
+        settings.TRACING_OTLP_ENDPOINT, content=json.dumps(body), headers=_otlp_headers(),
+        timeout=settings.TRACING_EXPORT_TIMEOUT_SECONDS
+    )
+    response.raise_for_status()
+
+
+def export(trace: Trace):
+    """Exports a finished trace (blocking; never raises)."""
+    if not trace.spans or settings.TRACING_EXPORTER == "none":
+        return
+    if trace.dropped:
+        logger.warning(f"Trace {trace.trace_id}: {trace.dropped} spans over the per-trace limit were dropped")
+    try:
+        body = to_otlp(trace.spans)
+        if settings.TRACING_EXPORTER == "otlp":
+            _export_otlp(body)
+        else:
+            _export_file(body)
+    except Exception as e:
+        logger.warning(f"Trace export failed ({settings.TRACING_EXPORTER}): {e}")
+
+
+# --- Middleware ---
+
+def _parse_traceparent(value: Optional[str]):
+    match = _TRACEPARENT.match(value.strip().lower()) if value else None
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+class TracingMiddleware:
+    """
+    Root span per HTTP request. Returns X-Trace-Id and traceparent; exports the trace after the
+    response has been sent when the request failed, took at least TRACING_MIN_DURATION_MS (if
+    set), or, for other requests, was sampled (TRACING_SAMPLE_RATE or the incoming traceparent
+    flag). Spans are collected for every request, so the decision is made when the root ends.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(_UNTRACED):
+            await self.app(scope, receive, send)
+            return
+        import asyncio
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        parent = _parse_traceparent(headers.get("traceparent"))
+        if parent:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = random.random() < settings.TRACING_SAMPLE_RATE
+
+        trace = Trace(trace_id, settings.TRACING_EXPORTER != "none")
+        root = Span(trace, scope["method"], parent_id, kind="server")
+        root.attributes.update({"http.method": scope["method"], "http.target": scope.get("path", "")})
+        token = _current.set(root)
+        trace_headers = [
+            (TRACE_HEADER.lower().encode(), trace_id.encode()),
+            (b"traceparent", f"00-{trace_id}-{root.span_id}-{'01' if sampled else '00'}".encode()),
+        ]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set("http.status_code", message["status"])
+                message = {**message, "headers": list(message.get("headers", [])) + trace_headers}
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            root.name = f"{scope['method']} {route}" if route else scope["method"]
+            if route:
+                root.set("http.route", route)
+            status = root.attributes.get("http.status_code", 500)
+            root.end(error if error is not None else (RuntimeError(f"HTTP {status}") if status >= 500 else None))
+            duration_ms = (root.end_ns - root.start_ns) / 1e6
+            slow = settings.TRACING_MIN_DURATION_MS > 0 and duration_ms >= settings.TRACING_MIN_DURATION_MS
+            # Tail decision: failed and slow requests are kept whether or not they were sampled
+            keep = root.error or slow or (sampled and duration_ms >= settings.TRACING_MIN_DURATION_MS)
+            if keep and settings.TRACING_EXPORTER != "none":
+                if error is None:
+                    await asyncio.to_thread(export, trace)
+                else:
+                    # Not awaited while the request is failing (or being cancelled); still off the loop
+                    asyncio.get_running_loop().run_in_executor(None, export, trace)
@@ -4,6 +4,8 @@
 AI 在生成分析报告和标签时，优先从以下分类中选取术语。
 """
 
+from functools import lru_cache
+
 STANDARD_TERMINOLOGY = {
     "基础技术类 (Basic Techniques)": [
         "正手握拍 (Forehand Grip)",
@@ -50,6 +52,7 @@ STANDARD_TERMINOLOGY = {
     ]
 }
 
+@lru_cache(maxsize=1)
 def get_terminology_string():
     """
     将术语库转换为 Prompt 友好的字符串格式
@@ -1,16 +1,86 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.core.admission import AdmissionRejected
+from app.core import metrics
 from app.core.config import get_settings
+from app.core.compression import CompressionMiddleware
+from app.core.metrics import MetricsMiddleware
+from app.core.tracing import TRACE_HEADER, TracingMiddleware
 from app.api import routers
+from app.api.responses import ORJSONResponse, orjson
+import logging
+import math
 import os
 
+logging.basicConfig(level=logging.INFO)
+
 settings = get_settings()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from app.services.history import start_session_flusher, stop_session_flusher
+    from app.services.media import start_media_sweeper, stop_media_sweeper
+    from app.services.reference_data import start_reference_watcher, stop_reference_watcher
+
+    # Background threads do not survive serverless container freezes
+    serverless = bool(os.environ.get("VERCEL"))
+    write_behind = settings.SESSION_WRITE_BEHIND and not serverless
+    if write_behind:
+        start_session_flusher()
+    if not serverless:
+        start_media_sweeper()
+        start_reference_watcher()
+    if settings.ADMIN_KEY:
+        from app.core.profiling import install_executor
+        install_executor()
+    try:
+        yield
+    finally:
+        if not serverless:
+            stop_reference_watcher()
+            stop_media_sweeper()
+        if write_behind:
+            stop_session_flusher()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse
+)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    # Rate limited or no capacity within the wait budget: tell the client when to come back
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+# Admin-triggered request profiling (innermost: profiles the endpoint only)
+if settings.ADMIN_KEY:
+    from app.core.profiling import ProfilingMiddleware
+    app.add_middleware(ProfilingMiddleware)
+
+# Per-route request latency (inside compression, so it times the endpoint alone)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Root span per request, trace id in X-Trace-Id (outside the metrics middleware so it covers it)
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
+# Compress JSON/text responses (brotli if installed, else gzip); media and small bodies pass through
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_BYTES,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY
 )
 
 # Set all CORS enabled origins
@@ -20,6 +90,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[TRACE_HEADER],
 )
 
 # Mount static files
@@ -30,6 +101,13 @@ app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
 app.include_router(routers.api_router, prefix=settings.API_V1_STR)
 
+@app.get(f"{settings.API_V1_STR}/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Prometheus scrape endpoint (404 when METRICS_ENABLED is off)."""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/")
 def root():
     return {"message": "Welcome to Badminton AI Coach API"}
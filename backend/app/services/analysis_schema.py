@@ -0,0 +1,174 @@
+"""
+Pydantic schemas of the analysis reports the prompts ask for (prompts.get_video_analysis_prompt,
+get_style_analysis_prompt).
+
+Validation normalizes the types the UI relies on (lists stay lists, severities are high/medium/low,
+scores are numbers) but does not invent content: fields the model left out stay out, and keys
+outside the schema are kept.
+"""
+import re
+from typing import Annotated, Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, field_validator
+
+_SEVERITIES = {
+    "high": "high", "critical": "high", "severe": "high", "major": "high", "高": "high", "严重": "high",
+    "medium": "medium", "moderate": "medium", "中": "medium", "中等": "medium",
+    "low": "low", "minor": "low", "低": "low", "轻微": "low",
+}
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "\n".join(_text(v) for v in value)
+    if isinstance(value, dict):
+        return "\n".join(f"{k}: {_text(v)}" for k, v in value.items())
+    return str(value)
+
+
+def _text_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        value = list(value.values())
+    if not isinstance(value, list):
+        value = [value]
+    return [_text(v) for v in value if v not in (None, "")]
+
+
+def _entries(value: Any, text_field: str) -> List[Dict]:
+    """A list of objects; a lone object is wrapped, bare strings become {text_field: ...}."""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    return [v if isinstance(v, dict) else {text_field: _text(v)} for v in value if v not in (None, "")]
+
+
+def _object(text_field: str):
+    """Validator for a nested section: a bare value becomes {text_field: ...}."""
+    def coerce(value: Any) -> Dict:
+        if isinstance(value, dict):
+            return value
+        return {} if value in (None, "") else {text_field: _text(value)}
+    return BeforeValidator(coerce)
+
+
+def _score(value: Any) -> Optional[Union[int, float]]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    match = re.search(r"-?\d+(?:\.\d+)?", str(value))  # "88分", "18/20"
+    if not match:
+        return None
+    number = float(match.group())
+    return int(number) if number.is_integer() else number
+
+
+Text = Annotated[str, BeforeValidator(_text)]
+TextList = Annotated[List[str], BeforeValidator(_text_list)]
+Score = Annotated[Optional[Union[int, float]], BeforeValidator(_score)]
+
+
+class _Section(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+
+class AnalysisReport(_Section):
+    video_info: Text = ""
+    action_description: Text = ""
+    pros: TextList = []
+    cons: TextList = []
+
+
+class CoachAdvice(_Section):
+    coach_hu: Text = ""
+    coach_li: Text = ""
+    coach_an: Text = ""
+
+
+class TimelineEntry(_Section):
+    timestamp: Text = ""
+    content: Text = ""
+
+
+class TopIssue(_Section):
+    tag_name: Text = ""
+    severity: str = "medium"
+    color_code: Text = ""
+    diagnosis: Text = ""
+    principle: Text = ""
+    drill_recommendation: Text = ""
+    resource_link: Text = ""
+
+    @field_validator("severity", mode="before")
+    @classmethod
+    def _severity(cls, value: Any) -> str:
+        return _SEVERITIES.get(_text(value).strip().lower(), "medium")
+
+
+class VideoAnalysis(_Section):
+    analysis_report: Annotated[AnalysisReport, _object("action_description")] = AnalysisReport()
+    coach_advice: Annotated[CoachAdvice, _object("coach_hu")] = CoachAdvice()
+    timeline_commentary: List[TimelineEntry] = []
+    top_issues: List[TopIssue] = []
+
+    @field_validator("timeline_commentary", mode="before")
+    @classmethod
+    def _timeline(cls, value: Any) -> List[Dict]:
+        return _entries(value, "content")
+
+    @field_validator("top_issues", mode="before")
+    @classmethod
+    def _issues(cls, value: Any) -> List[Dict]:
+        return _entries(value, "tag_name")
+
+
+class DetailedReview(_Section):
+    highlights: Text = ""
+    suggestions: Text = ""
+
+
+class StyleAnalysis(_Section):
+    total_score: Score = None
+    radar_chart: Dict[str, Score] = {}
+    style_tags: TextList = []
+    one_line_summary: Text = ""
+    detailed_review: Annotated[DetailedReview, _object("highlights")] = DetailedReview()
+    coach_an_comment: Text = ""
+
+    @field_validator("radar_chart", mode="before")
+    @classmethod
+    def _radar(cls, value: Any) -> Dict:
+        return value if isinstance(value, dict) else {}
+
+
+SCHEMAS = {"video": VideoAnalysis, "style": StyleAnalysis}
+
+
+def json_schema(kind: str) -> Dict:
+    """JSON schema of a report kind, for providers that accept one."""
+    return SCHEMAS[kind].model_json_schema()
+
+
+def validate_report(kind: str, data: Any) -> Dict:
+    """
+    Validates and normalizes a parsed model report ("video" or "style"). A list holding the
+    report is unwrapped. Raises ValueError (pydantic's ValidationError) when it is not a report.
+    """
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        data = data[0]
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    return SCHEMAS[kind].model_validate(data).model_dump(exclude_unset=True)
+
+
+def validate_section(kind: str, key: str, value: Any) -> Any:
+    """Validates one top-level member of a report as it streams in (unchanged if invalid)."""
+    try:
+        return SCHEMAS[kind].model_validate({key: value}).model_dump(exclude_unset=True).get(key, value)
+    except ValueError:
+        return value
@@ -1,24 +1,21 @@
-import json
 import os
+from app.core import metrics
 from app.core.config import get_data_dir
+from app.core.storage import save_json, update_json
 from typing import List, Dict, Optional
 
 def get_docs_file():
     return os.path.join(get_data_dir(), "documentation.json")
 
 def load_documentation():
-    file_path = get_docs_file()
-    if not os.path.exists(file_path):
-        return []
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return []
+    # Served from the in-memory reference cache (read-only: copy before modifying)
+    from app.services.reference_data import documentation
+    return documentation.get()
 
 def save_documentation(docs):
-    with open(get_docs_file(), "w", encoding="utf-8") as f:
-        json.dump(docs, f, ensure_ascii=False, indent=2)
+    from app.services.reference_data import documentation
+    save_json(get_docs_file(), docs)
+    documentation.invalidate()
 
 def get_all_docs():
     return load_documentation()
@@ -31,57 +28,86 @@ def get_doc_by_id(doc_id: str):
     return None
 
 def update_doc_section(doc_id: str, section_title: str, new_content: str, append: bool = True):
-    docs = load_documentation()
-    updated = False
+    def mutate(docs):
+        updated = False
     
-    for doc in docs:
-        if doc["id"] == doc_id:
-            # Find section
-            if "sections" not in doc:
-                doc["sections"] = []
+        for doc in docs:
+            if doc["id"] == doc_id:
+                # Find section
+                if "sections" not in doc:
+                    doc["sections"] = []
             
-            section_found = False
-            for section in doc["sections"]:
-                if section["title"] == section_title:
-                    if append:
-                        # Append with a newline if content exists
-                        if section["content"]:
-                            section["content"] += "\n\n" + new_content
+                section_found = False
+                for section in doc["sections"]:
+                    if section["title"] == section_title:
+                        if append:
+                            # Append with a newline if content exists
+                            if section["content"]:
+                                section["content"] += "\n\n" + new_content
+                            else:
+                                section["content"] = new_content
                         else:
                             section["content"] = new_content
-                    else:
-                        section["content"] = new_content
-                    section_found = True
-                    break
+                        section_found = True
+                        break
             
-            if not section_found:
-                # Create new section if not found
-                doc["sections"].append({
-                    "title": section_title,
-                    "content": new_content
-                })
+                if not section_found:
+                    # Create new section if not found
+                    doc["sections"].append({
+                        "title": section_title,
+                        "content": new_content
+                    })
             
-            updated = True
-            break
+                updated = True
+                break
     
+        return updated
+
+    from app.services.reference_data import documentation
+    updated = update_json(get_docs_file(), mutate, [])
     if updated:
-        save_documentation(docs)
-        return True
-    return False
+        documentation.invalidate()
+    return updated
+
+def doc_search_text(doc: Dict) -> str:
+    """Lowercased text a doc is matched against (title, content, tags)."""
+    return (doc.get("title", "") + str(doc.get("content", "")) + str(doc.get("tags", ""))).lower()
+
+_search_index_cache: Dict[str, object] = {"etag": None, "texts": None}
+
+def _search_texts(docs: List[Dict]) -> List[str]:
+    """
+    Search text per doc, rebuilt only when the documentation changes. A fresh process
+    takes it from the build-time snapshot's docs_search_index.json when that was built
+    from the same documentation (same ETag).
+    """
+    from app.core.snapshot import snapshot_file
+    from app.core.storage import load_json
+    from app.services.reference_data import documentation
+
+    _, etag = documentation.body()
+    metrics.cache_lookup("docs_search_index", _search_index_cache["etag"] == etag)
+    if _search_index_cache["etag"] != etag:
+        texts = None
+        prebuilt = snapshot_file("docs_search_index.json")
+        if prebuilt:
+            index = load_json(prebuilt, {})
+            if index.get("source_etag") == etag and len(index.get("texts", [])) == len(docs):
+                texts = index["texts"]
+        _search_index_cache["texts"] = texts or [doc_search_text(doc) for doc in docs]
+        _search_index_cache["etag"] = etag
+    texts = _search_index_cache["texts"]
+    # The docs may have been reloaded between the two reads
+    return texts if len(texts) == len(docs) else [doc_search_text(doc) for doc in docs]
 
 def search_docs(query: str):
     docs = load_documentation()
     if not query:
         return docs
     
-    results = []
     query = query.lower()
-    for doc in docs:
-        # Simple search in title, content, tags
-        text = (doc.get("title", "") + str(doc.get("content", "")) + str(doc.get("tags", ""))).lower()
-        if query in text:
-            results.append(doc)
-    return results
+    # Simple search in title, content, tags
+    return [doc for doc, text in zip(docs, _search_texts(docs)) if query in text]
 
 def find_matching_doc(topic: str):
     """
@@ -0,0 +1,157 @@
+import io
+import os
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import get_settings, get_data_dir
+from app.core.snapshot import read_path
+from app.core.storage import atomic_file, file_lock
+
+# Knowledge embeddings live in a 2-D .npy matrix next to knowledge_base.json.
+# Each knowledge entry stores only its row index ("embedding_row").
+# Until the first append, a fresh data dir maps the build-time snapshot's matrix instead.
+
+_cache_lock = threading.Lock()
+_cache: Dict[str, object] = {"sig": None, "matrix": None}
+
+
+def get_embeddings_file() -> str:
+    return os.path.join(get_data_dir(), "knowledge_embeddings.npy")
+
+
+def _dtype():
+    return np.dtype(get_settings().EMBEDDING_DTYPE)
+
+
+def _signature(path: str):
+    try:
+        st = os.stat(path)
+        return (path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def embeddings_signature():
+    """Changes whenever the sidecar file is replaced (used to invalidate derived indexes)."""
+    return _signature(read_path(get_embeddings_file()))
+
+
+def load_matrix() -> Optional[np.ndarray]:
+    """
+    Returns the embedding matrix memory-mapped read-only, or None if there is none yet.
+    The mapping is reused until the file is replaced.
+    """
+    path = read_path(get_embeddings_file())
+    sig = _signature(path)
+    if sig is None:
+        return None
+    with _cache_lock:
+        if _cache["sig"] != sig:
+            _cache["matrix"] = np.load(path, mmap_mode="r")
+            _cache["sig"] = sig
+        return _cache["matrix"]
+
+
+def _write_matrix(path: str, matrix: np.ndarray):
+    with atomic_file(path, "wb") as f:
+        np.save(f, matrix)
+
+
+def _append_in_place(path: str, new_rows: np.ndarray) -> Optional[int]:
+    """
+    Appends rows to an existing .npy file without rewriting it: the rows go after the last
+    row, then the header's row count is updated in place (np.save pads the header so the
+    count can grow). Returns the first new row index, or None when the file has to be
+    rewritten instead (no file yet, another layout, or a header that cannot grow).
+    Callers hold the file lock.
+    """
+    fmt = np.lib.format
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        return None
+    with f:
+        version = fmt.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = fmt.read_array_header_1_0(f)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = fmt.read_array_header_2_0(f)
+        else:
+            return None
+        data_offset = f.tell()
+        if fortran_order or len(shape) != 2 or dtype != new_rows.dtype or shape[0] == 0:
+            return None
+        if shape[1] != new_rows.shape[1]:
+            raise ValueError(f"Embedding dimension {new_rows.shape[1]} does not match store dimension {shape[1]}")
+
+        header = io.BytesIO()
+        new_shape = (shape[0] + new_rows.shape[0], shape[1])
+        header_fields = {"descr": fmt.dtype_to_descr(dtype), "fortran_order": False, "shape": new_shape}
+        if version == (1, 0):
+            fmt.write_array_header_1_0(header, header_fields)
+        else:
+            fmt.write_array_header_2_0(header, header_fields)
+        if header.tell() != data_offset:
+            return None
+
+        # Rows first, header last: a crash in between leaves the old row count, and the
+        # unreferenced tail is overwritten by the next append
+        f.seek(data_offset + shape[0] * shape[1] * dtype.itemsize)
+        f.write(np.ascontiguousarray(new_rows).tobytes())
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.write(header.getvalue())
+        f.flush()
+        os.fsync(f.fileno())
+    return shape[0]
+
+
+def append_embeddings(vectors: Sequence[Sequence[float]]) -> List[int]:
+    """
+    Appends embeddings to the sidecar matrix and returns their row indices. Only the new rows
+    and the header are written; the matrix is rewritten when it is first copied from the
+    snapshot or its layout changes.
+    """
+    if not vectors:
+        return []
+
+    path = get_embeddings_file()
+    new_rows = np.asarray(vectors, dtype=_dtype())
+    if new_rows.ndim != 2:
+        raise ValueError("Embeddings must all have the same dimension")
+
+    with file_lock(path):
+        start = _append_in_place(path, new_rows)
+        if start is None:
+            source = read_path(path)
+            existing = np.load(source) if os.path.exists(source) else None
+            if existing is not None and existing.shape[0] == 0:
+                existing = None
+            if existing is not None and existing.shape[1] != new_rows.shape[1]:
+                raise ValueError(
+                    f"Embedding dimension {new_rows.shape[1]} does not match store dimension {existing.shape[1]}"
+                )
+            start = 0 if existing is None else existing.shape[0]
+            matrix = new_rows if existing is None else np.concatenate([existing.astype(new_rows.dtype), new_rows])
+            _write_matrix(path, matrix)
+
+    return list(range(start, start + new_rows.shape[0]))
+
+
+def get_embeddings(rows: Sequence[int]) -> np.ndarray:
+    """Returns the given rows as a float32 array (only those rows are read from disk)."""
+    matrix = load_matrix()
+    if matrix is None or not len(rows):
+        return np.empty((0, 0), dtype=np.float32)
+    return np.asarray(matrix[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+
+
+def rewrite_embeddings(vectors: np.ndarray):
+    """Replaces the whole matrix (used by compaction and migration scripts)."""
+    path = get_embeddings_file()
+    with file_lock(path):
+        _write_matrix(path, np.asarray(vectors, dtype=_dtype()))
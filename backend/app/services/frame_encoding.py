@@ -0,0 +1,139 @@
+import base64
+import logging
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]  # x, y, w, h
+
+# Vision models bill roughly one token per 28x28 pixel patch
+_PATCH_PIXELS = 28 * 28
+
+# (scale, quality) attempts in order of preference: first trade JPEG quality,
+# then resolution, so small budgets still keep the frames legible.
+_QUALITY_STEPS = (85, 75, 65, 55)
+_SCALE_STEPS = (1.0, 0.85, 0.7, 0.55, 0.45)
+
+_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+def _crop(frame: np.ndarray, box: Optional[Box]) -> np.ndarray:
+    if box is None:
+        return frame
+    x, y, w, h = box
+    height, width = frame.shape[:2]
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(width, x + w), min(height, y + h)
+    if x1 <= x0 or y1 <= y0:
+        return frame
+    return frame[y0:y1, x0:x1]
+
+
+def _fit_scale(frame: np.ndarray, max_side: int) -> float:
+    # Never upscale; keep the original aspect ratio (portrait phone videos stay portrait)
+    return min(1.0, max_side / max(frame.shape[:2]))
+
+
+def _resize(frame: np.ndarray, scale: float) -> np.ndarray:
+    if scale >= 1.0:
+        return frame
+    height, width = frame.shape[:2]
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def _b64_len(n_bytes: int) -> int:
+    return 4 * math.ceil(n_bytes / 3)
+
+
+def estimate_tokens(width: int, height: int) -> int:
+    return max(1, math.ceil(width * height / _PATCH_PIXELS))
+
+
+def encode_frames(
+    frames: Sequence[np.ndarray],
+    budget_bytes: Optional[int] = None,
+    token_budget: Optional[int] = None,
+    max_side: Optional[int] = None,
+    image_format: Optional[str] = None,
+    crops: Optional[Sequence[Optional[Box]]] = None
+) -> Dict:
+    """
+    Encodes decoded BGR frames for a vision model request.
+
+    Frames are optionally cropped (one box per frame), scaled to fit `max_side` without
+    changing their aspect ratio, and then encoded at the highest quality/resolution step whose
+    total base64 payload fits `budget_bytes` (and whose estimated vision tokens fit
+    `token_budget`, if set). Unset arguments fall back to the FRAME_* settings.
+
+    Returns {"frames": [base64...], "mime_type", "width", "height", "quality",
+    "payload_bytes", "estimated_tokens", "within_budget"}.
+    """
+    settings = get_settings()
+    budget_bytes = budget_bytes if budget_bytes is not None else settings.FRAME_PAYLOAD_BUDGET_BYTES
+    token_budget = token_budget if token_budget is not None else settings.FRAME_TOKEN_BUDGET
+    max_side = max_side or settings.FRAME_MAX_SIDE
+    image_format = (image_format or settings.FRAME_FORMAT).lower()
+    if image_format not in _FORMATS:
+        raise ValueError(f"Unsupported frame format: {image_format}")
+    ext, mime_type, quality_flag = _FORMATS[image_format]
+
+    if not frames:
+        return {"frames": [], "mime_type": mime_type, "width": 0, "height": 0, "quality": 0,
+                "payload_bytes": 0, "estimated_tokens": 0, "within_budget": True}
+
+    crops = crops or [None] * len(frames)
+    base_frames = []
+    for frame, box in zip(frames, crops):
+        frame = _crop(frame, box)
+        base_frames.append(_resize(frame, _fit_scale(frame, max_side)))
+
+    best = None
+    for scale in _SCALE_STEPS:
+        scaled = [_resize(f, scale) for f in base_frames]
+        tokens = sum(estimate_tokens(f.shape[1], f.shape[0]) for f in scaled)
+        if token_budget and tokens > token_budget and scale != _SCALE_STEPS[-1]:
+            continue
+
+        for quality in _QUALITY_STEPS:
+            encoded = []
+            for f in scaled:
+                ok, buffer = cv2.imencode(ext, f, [quality_flag, quality])
+                if ok:
+                    encoded.append(buffer)
+            payload = sum(_b64_len(len(b)) for b in encoded)
+            best = (encoded, scaled, quality, payload, tokens)
+            if not budget_bytes or payload <= budget_bytes:
+                break
+        if not budget_bytes or best[3] <= budget_bytes:
+            break
+
+    encoded, scaled, quality, payload, tokens = best
+    within_budget = (not budget_bytes or payload <= budget_bytes) and (not token_budget or tokens <= token_budget)
+    if not within_budget:
+        logger.warning(f"Frame payload {payload} bytes / ~{tokens} tokens exceeds budget; sending smallest encoding")
+
+    return {
+        "frames": [base64.b64encode(b).decode("utf-8") for b in encoded],
+        "mime_type": mime_type,
+        "width": scaled[0].shape[1],
+        "height": scaled[0].shape[0],
+        "quality": quality,
+        "payload_bytes": payload,
+        "estimated_tokens": tokens,
+        "within_budget": within_budget
+    }
+
+
+def payload_stats(encoded: Dict) -> Dict:
+    """The encode_frames summary without the frame data (for logs and result metadata)."""
+    return {key: value for key, value in encoded.items() if key != "frames"} | {"frame_count": len(encoded["frames"])}
@@ -0,0 +1,195 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from app.core.config import get_settings, get_data_dir
+from app.core.storage import load_json, update_json
+
+logger = logging.getLogger(__name__)
+
+# Index files: one per leading hash byte, so a flush only rewrites the shards it touched
+_SHARDS = 256
+
+
+def dhash(frame: np.ndarray, box: Optional[Tuple[int, int, int, int]] = None) -> int:
+    """
+    64-bit difference hash: sign of horizontal gradients on a 9x8 grayscale thumbnail
+    of the frame, or of its (x, y, w, h) `box` region.
+    """
+    if box is not None:
+        x, y, w, h = box
+        frame = frame[y:y + h, x:x + w]
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _popcount64(values: np.ndarray) -> np.ndarray:
+    """Vectorized popcount of a uint64 array."""
+    as_bytes = values.view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(as_bytes, axis=1).sum(axis=1)
+
+
+def dedupe_frames(hashes: Sequence[int], threshold: int, min_keep: int = 0) -> List[int]:
+    """
+    Returns indices of frames to keep: a frame is dropped when it is within `threshold`
+    bits of any frame already kept (static serve setups, paused rallies).
+    If fewer than `min_keep` survive, evenly spaced dropped frames are added back for time coverage.
+    """
+    kept: List[int] = []
+    kept_hashes = np.empty(0, dtype=np.uint64)
+    for i, h in enumerate(hashes):
+        if len(kept_hashes):
+            distances = _popcount64(np.bitwise_xor(kept_hashes, np.uint64(h)))
+            if distances.min() <= threshold:
+                continue
+        kept.append(i)
+        kept_hashes = np.append(kept_hashes, np.uint64(h))
+
+    missing = min(min_keep, len(hashes)) - len(kept)
+    if missing > 0:
+        dropped = sorted(set(range(len(hashes))) - set(kept))
+        picks = np.linspace(0, len(dropped) - 1, missing).round().astype(int)
+        kept = sorted(set(kept) | {dropped[i] for i in picks})
+    return kept
+
+
+class FrameHashIndex:
+    """
+    Cross-request cache of per-frame work (e.g. pose keypoints) keyed by frame dHash.
+
+    Lookups match the nearest stored hash within `threshold` bits, so a re-uploaded or
+    trimmed clip reuses the work for frames it shares with an earlier upload. Entries live
+    in memory (LRU, `max_entries`) and are persisted in `directory`, sharded by the first
+    byte of the hash (00.json ... ff.json). Keep stored work small: large results belong in
+    their own files, with a reference in the index.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 5000, threshold: int = 4):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._keys: List[int] = []
+        self._loaded = False
+        self._pending: Dict[int, Dict[str, Any]] = {}
+
+    def _shard_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key[:2]}.json")
+
+    def _load(self):
+        if self._loaded:
+            return
+        items = []
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    items.extend(load_json(os.path.join(self.directory, name), []))
+        # Oldest first, so the LRU order survives a restart
+        for item in sorted(items, key=lambda i: i["work"].get("seen_at", 0)):
+            self._entries[int(item["hash"], 16)] = item["work"]
+        self._trim()
+        self._rebuild()
+        self._loaded = True
+
+    def _rebuild(self):
+        self._keys = list(self._entries)
+        self._hashes = np.array(self._keys, dtype=np.uint64)
+
+    def _trim(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _nearest(self, h: int) -> Optional[int]:
+        if not len(self._hashes):
+            return None
+        if h in self._entries:
+            return h
+        distances = _popcount64(np.bitwise_xor(self._hashes, np.uint64(h)))
+        i = int(np.argmin(distances))
+        return self._keys[i] if distances[i] <= self.threshold else None
+
+    def get(self, h: int, kind: str) -> Optional[Any]:
+        with self._lock:
+            self._load()
+            key = self._nearest(h)
+            if key is None:
+                return None
+            work = self._entries[key]
+            if kind not in work:
+                return None
+            self._entries.move_to_end(key)
+            return work[kind]
+
+    def put(self, h: int, kind: str, value: Any):
+        with self._lock:
+            self._load()
+            work = self._entries.setdefault(h, {})
+            work[kind] = value
+            work["seen_at"] = time.time()
+            self._entries.move_to_end(h)
+            self._pending.setdefault(h, {})[kind] = value
+            self._trim()
+            self._rebuild()
+
+    def flush(self):
+        """Merges entries added since the last flush into their shard files."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        shards: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for h, work in pending.items():
+            key = f"{h:016x}"
+            shards.setdefault(self._shard_path(key), {})[key] = work
+        # Hashes do not spread perfectly evenly over the shards: allow each twice its share
+        per_shard = max(1, math.ceil(2 * self.max_entries / _SHARDS))
+
+        for path, updates in shards.items():
+            def merge(items, updates=updates):
+                by_hash = {item["hash"]: item for item in items}
+                for key, work in updates.items():
+                    item = by_hash.get(key)
+                    if item is None:
+                        item = by_hash[key] = {"hash": key, "work": {}}
+                    item["work"].update(work)
+                    item["work"]["seen_at"] = time.time()
+                merged = sorted(by_hash.values(), key=lambda i: i["work"].get("seen_at", 0))
+                items[:] = merged[-per_shard:]
+
+            try:
+                update_json(path, merge, [])
+            except Exception as e:
+                logger.warning(f"Failed to persist frame hash index shard {os.path.basename(path)}: {e}")
+
+
+_index: Optional[FrameHashIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_frame_index() -> FrameHashIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            settings = get_settings()
+            _index = FrameHashIndex(
+                os.path.join(get_data_dir(), "frame_index"),
+                max_entries=settings.FRAME_INDEX_MAX_ENTRIES,
+                threshold=settings.FRAME_HASH_THRESHOLD
+            )
+        return _index
@@ -1,9 +1,10 @@
-import json
 import os
-import numpy as np
 from typing import List, Dict, Optional
 from datetime import datetime
-from app.core.config import get_data_dir
+from app.core import metrics
+from app.core.config import get_settings, get_data_dir
+from app.core.ids import new_id
+from app.core.storage import load_json, save_json, update_json
 import logging
 
 # We will import get_embedding inside functions to avoid circular imports if needed
@@ -11,110 +12,167 @@ import logging
 # However, qwen.py imports knowledge to use search_knowledge, so we have a circular import.
 # To resolve this, we will pass the embedding function or import it inside the method.
 # For now, let's use local import inside methods.
+# NumPy-backed modules (embedding_store, vector_index) are also imported on first use,
+# so listing or editing entries does not pay for importing NumPy.
 
 logger = logging.getLogger(__name__)
 
+settings = get_settings()
+
 KNOWLEDGE_FILE = os.path.join(get_data_dir(), "knowledge_base.json")
 
 def load_knowledge_base() -> List[Dict]:
-    if not os.path.exists(KNOWLEDGE_FILE):
-        return []
-    try:
-        with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return []
+    return load_json(KNOWLEDGE_FILE, [])
 
 def save_knowledge_base(data: List[Dict]):
-    with open(KNOWLEDGE_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    save_json(KNOWLEDGE_FILE, data)
+
+def _update_knowledge_base(mutate):
+    def apply(kb):
+        result = mutate(kb)
+        _move_inline_embeddings(kb)
+        return result
+
+    return update_json(KNOWLEDGE_FILE, apply, [])
+
+def _has_embedding(item: Dict) -> bool:
+    return item.get("embedding_row") is not None or bool(item.get("embedding"))
+
+def _move_inline_embeddings(kb: List[Dict]):
+    """
+    Moves any inline "embedding" float lists into the .npy sidecar, leaving only "embedding_row".
+    Also migrates legacy entries the first time the knowledge base is written.
+    """
+    pending = []
+    for item in kb:
+        if "embedding" not in item:
+            continue
+        vector = item.pop("embedding")
+        if vector:
+            pending.append((item, vector))
+
+    if pending:
+        from app.services.embedding_store import append_embeddings
+        rows = append_embeddings([vector for _, vector in pending])
+        for (item, _), row in zip(pending, rows):
+            item["embedding_row"] = row
+
+def compact_embeddings() -> int:
+    """
+    Rewrites the embedding sidecar keeping only rows still referenced by an entry
+    (rows are orphaned when entries are deleted or re-embedded). Returns the number of rows kept.
+    """
+    from app.services.embedding_store import get_embeddings, rewrite_embeddings
+
+    def mutate(kb):
+        _move_inline_embeddings(kb)
+        referenced = [item for item in kb if item.get("embedding_row") is not None]
+        vectors = get_embeddings([item["embedding_row"] for item in referenced])
+        rewrite_embeddings(vectors)
+        for new_row, item in enumerate(referenced):
+            item["embedding_row"] = new_row
+        return len(referenced)
+
+    return update_json(KNOWLEDGE_FILE, mutate, [])
+
+def _find_entry(kb: List[Dict], id: str) -> Optional[Dict]:
+    for item in kb:
+        if item["id"] == id:
+            return item
+    return None
 
 def add_knowledge_candidate(content: str, tags: List[str] = [], source: str = "AI_CHAT") -> str:
-    kb = load_knowledge_base()
-    
-    # Generate ID
-    new_id = f"KB_{len(kb) + 1:04d}"
+    # Time-sortable ID: never reused after deletes, no need to count existing entries
+    entry_id = new_id("KB_")
     
     entry = {
-        "id": new_id,
+        "id": entry_id,
         "content": content,
         "tags": tags,
         "status": "pending", # pending, approved, rejected
         "source": source,
         "created_at": datetime.now().isoformat(),
-        "embedding": None # Will be generated upon approval to save costs/time or can be done now.
+        "embedding_row": None # Will be generated upon approval to save costs/time or can be done now.
     }
     
-    kb.insert(0, entry)
-    save_knowledge_base(kb)
-    return new_id
+    _update_knowledge_base(lambda kb: kb.insert(0, entry))
+    return entry_id
 
 def approve_knowledge_entry(id: str, reviewer: str = "Admin"):
     from app.services.qwen import get_embedding
     
-    kb = load_knowledge_base()
-    for item in kb:
-        if item["id"] == id:
+    # Generate the embedding before taking the write lock (network call)
+    current = _find_entry(load_knowledge_base(), id)
+    embedding = None
+    if current and not _has_embedding(current):
+        embedding = get_embedding(current["content"])
+
+    def mutate(kb):
+        item = _find_entry(kb, id)
+        if item:
             item["status"] = "approved"
             item["reviewed_by"] = reviewer
             item["reviewed_at"] = datetime.now().isoformat()
-            # Generate embedding
-            if not item.get("embedding"):
-                item["embedding"] = get_embedding(item["content"])
-            break
-            
-    save_knowledge_base(kb)
+            if not _has_embedding(item) and embedding:
+                item["embedding"] = embedding
+
+    _update_knowledge_base(mutate)
 
 def reject_knowledge_entry(id: str):
-    kb = load_knowledge_base()
     # Filter out or mark rejected
     # Ideally mark rejected to keep history
-    for item in kb:
-        if item["id"] == id:
+    def mutate(kb):
+        item = _find_entry(kb, id)
+        if item:
             item["status"] = "rejected"
-            break
-    save_knowledge_base(kb)
+
+    _update_knowledge_base(mutate)
 
 def delete_knowledge_entry(id: str):
-    kb = load_knowledge_base()
-    initial_len = len(kb)
-    kb = [item for item in kb if item["id"] != id]
-    if len(kb) == initial_len:
-        raise Exception("Knowledge entry not found")
-    save_knowledge_base(kb)
+    def mutate(kb):
+        initial_len = len(kb)
+        kb[:] = [item for item in kb if item["id"] != id]
+        if len(kb) == initial_len:
+            raise Exception("Knowledge entry not found")
+
+    _update_knowledge_base(mutate)
 
 def update_knowledge_entry(id: str, content: Optional[str] = None, tags: Optional[List[str]] = None, status: Optional[str] = None):
     from app.services.qwen import get_embedding
 
-    kb = load_knowledge_base()
-    updated = False
-    
-    for item in kb:
-        if item["id"] == id:
-            if content is not None:
-                item["content"] = content
-                # If content changes, invalidate embedding unless it's just a small fix? 
-                # Better to re-generate if approved.
-                if item["status"] == "approved":
-                    item["embedding"] = get_embedding(content)
-            
-            if tags is not None:
-                item["tags"] = tags
-                
-            if status is not None:
-                item["status"] = status
-                # If moving to approved, ensure embedding
-                if status == "approved" and not item.get("embedding"):
-                    item["embedding"] = get_embedding(item["content"])
-                    
-            item["updated_at"] = datetime.now().isoformat()
-            updated = True
-            break
-            
-    if not updated:
+    current = _find_entry(load_knowledge_base(), id)
+    if not current:
         raise Exception("Knowledge entry not found")
-        
-    save_knowledge_base(kb)
+
+    # Work out the new embedding before taking the write lock (network call)
+    embedding = None
+    new_status = status if status is not None else current["status"]
+    if content is not None and new_status == "approved":
+        # If content changes, invalidate embedding unless it's just a small fix? 
+        # Better to re-generate if approved.
+        embedding = get_embedding(content)
+    elif status == "approved" and not _has_embedding(current):
+        # If moving to approved, ensure embedding
+        embedding = get_embedding(current["content"])
+
+    def mutate(kb):
+        item = _find_entry(kb, id)
+        if not item:
+            raise Exception("Knowledge entry not found")
+
+        if content is not None:
+            item["content"] = content
+        if tags is not None:
+            item["tags"] = tags
+        if status is not None:
+            item["status"] = status
+        if embedding:
+            # Moved to the sidecar (new row) by _update_knowledge_base
+            item["embedding"] = embedding
+
+        item["updated_at"] = datetime.now().isoformat()
+
+    _update_knowledge_base(mutate)
     return True
 
 def get_knowledge_entries(status: Optional[str] = None) -> List[Dict]:
@@ -123,31 +181,85 @@ def get_knowledge_entries(status: Optional[str] = None) -> List[Dict]:
         return [item for item in kb if item.get("status") == status]
     return kb
 
+def _embedding_matrix(items: List[Dict]) -> "np.ndarray":
+    """Stacks the embeddings of `items` (sidecar rows, or inline lists for not-yet-migrated entries)."""
+    import numpy as np
+    from app.services.embedding_store import get_embeddings
+
+    row_items = [i for i, item in enumerate(items) if item.get("embedding_row") is not None]
+    inline_items = [i for i, item in enumerate(items) if item.get("embedding_row") is None]
+    if not inline_items:
+        return get_embeddings([items[i]["embedding_row"] for i in row_items])
+
+    vectors = [None] * len(items)
+    if row_items:
+        for i, vec in zip(row_items, get_embeddings([items[i]["embedding_row"] for i in row_items])):
+            vectors[i] = vec
+    for i in inline_items:
+        vectors[i] = np.asarray(items[i]["embedding"], dtype=np.float32)
+    return np.vstack(vectors)
+
+_quantized_cache: Dict[str, object] = {"key": None, "index": None}
+
+def _use_quantized_search(approved_kb: List[Dict]) -> bool:
+    if not settings.KNOWLEDGE_QUANTIZED_SEARCH or len(approved_kb) < settings.KNOWLEDGE_QUANTIZED_MIN_ROWS:
+        return False
+    # Entries not yet migrated to the sidecar are only searchable exactly
+    return all(item.get("embedding_row") is not None for item in approved_kb)
+
+def _quantized_index(rows: List[int]) -> "QuantizedIndex":
+    """int8 index over the given sidecar rows, rebuilt only when the rows or the sidecar change."""
+    from app.services.embedding_store import embeddings_signature, get_embeddings
+    from app.services.vector_index import QuantizedIndex
+
+    key = (embeddings_signature(), hash(tuple(rows)))
+    metrics.cache_lookup("quantized_index", _quantized_cache["key"] == key)
+    if _quantized_cache["key"] != key:
+        _quantized_cache["index"] = QuantizedIndex(get_embeddings(rows))
+        _quantized_cache["key"] = key
+    return _quantized_cache["index"]
+
 def search_knowledge(query: str, top_k: int = 3) -> List[Dict]:
     """
     Search knowledge base using vector similarity (cosine) + keyword matching (simple).
     """
+    import numpy as np
     from app.services.qwen import get_embedding
+    from app.services.embedding_store import get_embeddings
+    from app.services.vector_index import cosine_scores
     
     kb = load_knowledge_base()
-    approved_kb = [item for item in kb if item.get("status") == "approved" and item.get("embedding")]
+    approved_kb = [item for item in kb if item.get("status") == "approved" and _has_embedding(item)]
     
     if not approved_kb:
         return []
 
     # 1. Get query embedding
-    query_embedding = get_embedding(query)
+    with metrics.span("embed_query"):
+        query_embedding = get_embedding(query)
     if not query_embedding:
         return []
         
-    query_vec = np.array(query_embedding)
+    query_vec = np.asarray(query_embedding, dtype=np.float32)
     
-    # 2. Calculate similarities
+    # 2. Calculate similarities (rows come from the memory-mapped sidecar)
+    with metrics.span("vector_search"):
+        if _use_quantized_search(approved_kb):
+            rows = [item["embedding_row"] for item in approved_kb]
+            index = _quantized_index(rows)
+            hits = index.search(
+                query_vec,
+                top_k=top_k,
+                rerank_k=settings.KNOWLEDGE_RERANK_K,
+                fetch_rows=lambda positions: get_embeddings([rows[p] for p in positions])
+            )
+            scored = [(approved_kb[position], score) for position, score in hits]
+        else:
+            similarities = cosine_scores(_embedding_matrix(approved_kb), query_vec)
+            scored = list(zip(approved_kb, similarities))
+
     results = []
-    for item in approved_kb:
-        doc_vec = np.array(item["embedding"])
-        # Cosine similarity
-        similarity = np.dot(query_vec, doc_vec) / (np.linalg.norm(query_vec) * np.linalg.norm(doc_vec))
+    for item, similarity in scored:
         results.append({
             "id": item["id"],
             "content": item["content"],
@@ -0,0 +1,291 @@
+import asyncio
+import json
+import logging
+import math
+import os
+from collections import Counter
+from typing import Dict, List, Optional
+
+from app.core import metrics
+from app.core.config import get_settings, get_data_dir
+from app.core.storage import atomic_file, load_json
+from app.services.frame_encoding import payload_stats
+from app.services.frame_hash import get_frame_index, hamming
+from app.services.prompts import get_video_analysis_prompt
+from app.services import pose
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+_SEVERITY_RANK = {"high": 3, "medium": 2, "low": 1}
+# Videos whose segment analyses are kept for reuse (the frame index points into these)
+_MAX_SEGMENT_RECORDS = 500
+
+
+def plan_segments(duration: float) -> List[Dict]:
+    """
+    Splits the video into LONG_VIDEO_SEGMENT_SECONDS windows, widening them if needed
+    so there are never more than LONG_VIDEO_MAX_SEGMENTS model requests.
+    """
+    if duration <= 0:
+        return []
+    length = max(settings.LONG_VIDEO_SEGMENT_SECONDS, duration / settings.LONG_VIDEO_MAX_SEGMENTS)
+    count = math.ceil(duration / length)
+    segments = []
+    for i in range(count):
+        start = i * length
+        end = min(duration, start + length)
+        segments.append({"index": i, "start": round(start, 2), "end": round(end, 2)})
+    return segments
+
+
+def _segments_dir() -> str:
+    return os.path.join(get_data_dir(), "segment_analyses")
+
+
+def _cached_segment(hashes: List[int], kind: str) -> Optional[Dict]:
+    """A previous analysis of a segment whose frames all match `hashes` (e.g. a re-uploaded clip)."""
+    if not settings.FRAME_INDEX_ENABLED or not hashes:
+        return None
+    analysis = None
+    ref = get_frame_index().get(hashes[0], kind)
+    if ref:
+        stored = [int(h, 16) for h in ref["hashes"]]
+        if len(stored) == len(hashes) and all(hamming(a, b) <= settings.FRAME_HASH_THRESHOLD for a, b in zip(stored, hashes)):
+            record = load_json(os.path.join(_segments_dir(), f"{ref['ref']}.json"), {})
+            analysis = record.get(str(ref["segment"]))
+    metrics.cache_lookup("segment_analysis", analysis is not None)
+    return analysis
+
+
+def _remember_segments(ref: str, segments: List[Dict], kind: str):
+    """
+    Stores the new segment analyses of one video in a single file named after `ref` (its
+    history entry id) and points the frame index at them, with one index flush per video.
+    """
+    analyzed = [s for s in segments if "analysis" in s and s.get("hashes") and not s.get("reused")]
+    if not analyzed:
+        return
+    directory = _segments_dir()
+    # Written once, under a fresh id: no lock needed
+    with atomic_file(os.path.join(directory, f"{ref}.json")) as f:
+        json.dump({str(s["index"]): s["analysis"] for s in analyzed}, f, ensure_ascii=False)
+    index = get_frame_index()
+    for s in analyzed:
+        index.put(s["hashes"][0], kind, {"hashes": [f"{h:016x}" for h in s["hashes"]], "ref": ref, "segment": s["index"]})
+    index.flush()
+
+    # Oldest records go first; index entries pointing at them become misses
+    records = sorted(
+        (os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json")),
+        key=os.path.getmtime
+    )
+    for path in records[:max(0, len(records) - _MAX_SEGMENT_RECORDS)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _segment_kind(severity: int, style: str) -> str:
+    return f"segment:{severity}:{style}"
+
+
+def _preview_frame(prepared: Dict) -> Optional[tuple]:
+    """(frame, timestamp) of the segment's middle sent frame, for the report sprite sheet."""
+    frames = prepared["preview_frames"]
+    if not frames:
+        return None
+    i = len(frames) // 2
+    return frames[i], prepared["timestamps"][i]
+
+
+def _segment_label(segment: Dict) -> str:
+    from app.services.qwen import format_duration
+    return f"{format_duration(segment['start'])} - {format_duration(segment['end'])}"
+
+
+async def _analyze_segment(
+    video_path: str,
+    segment: Dict,
+    total: int,
+    duration: float,
+    severity: int,
+    style: str,
+    semaphore: asyncio.Semaphore
+) -> Dict:
+    from app.services.qwen import prepare_video_frames, call_video_model
+
+    async with semaphore:
+        prepared = await asyncio.to_thread(
+            prepare_video_frames, video_path, settings.LONG_VIDEO_FRAMES_PER_SEGMENT, segment["start"], segment["end"]
+        )
+        encoded, motion, hashes = prepared["encoded"], prepared["motion"], prepared["hashes"]
+        if not encoded["frames"]:
+            return {**segment, "error": "Could not extract frames from segment."}
+
+        label = _segment_label(segment)
+        cached = _cached_segment(hashes, _segment_kind(severity, style))
+        if cached is not None:
+            logger.info(f"Reusing previous analysis for long-video segment {segment['index'] + 1}/{total} ({label})")
+            return {**segment, "timestamp": label, "payload": payload_stats(encoded), "analysis": cached, "reused": True,
+                    "preview": _preview_frame(prepared)}
+
+        prompt = get_video_analysis_prompt(strictness=severity, style=style, motion_summary=pose.format_motion_summary(motion))
+        prompt = (
+            f"Video Duration: {duration:.2f} seconds. "
+            f"These frames are segment {segment['index'] + 1}/{total} ({label}) of a longer match video; "
+            f"analyze this segment only.\n" + prompt
+        )
+        logger.info(f"Analyzing long-video segment {segment['index'] + 1}/{total} ({label})")
+        response = await asyncio.to_thread(call_video_model, encoded, prompt)
+
+    result = {
+        **segment, "timestamp": label, "payload": payload_stats(encoded), "preview": _preview_frame(prepared), "hashes": hashes
+    }
+    if "error" in response:
+        result["error"] = response["error"]
+        if "retry_after" in response:
+            result["retry_after"] = response["retry_after"]
+    else:
+        result["analysis"] = response["result"]
+        result["model_meta"] = response.get("model_meta")
+        if motion:
+            result["analysis"]["motion_summary"] = motion
+    return result
+
+
+def _ranked(items: List[str], limit: int) -> List[str]:
+    """Deduplicates, most frequent across segments first (ties keep first-seen order)."""
+    counts = Counter(item.strip() for item in items if isinstance(item, str) and item.strip())
+    return [item for item, _ in counts.most_common(limit)]
+
+
+def reduce_segments(segments: List[Dict], duration: float) -> Dict:
+    """Merges per-segment reports into one analysis in the single-video report shape."""
+    from app.services.qwen import format_duration
+
+    ok = [s for s in segments if "analysis" in s]
+    duration_str = format_duration(duration)
+
+    pros, cons, timeline = [], [], []
+    coach_advice = {"coach_hu": [], "coach_li": [], "coach_an": []}
+    issues: Dict[str, Dict] = {}
+
+    for seg in ok:
+        analysis = seg["analysis"]
+        report = analysis.get("analysis_report", {})
+        pros.extend(report.get("pros", []))
+        cons.extend(report.get("cons", []))
+        timeline.append({
+            "timestamp": seg["timestamp"],
+            "content": report.get("action_description", "")
+        })
+        for coach, lines in coach_advice.items():
+            advice = analysis.get("coach_advice", {}).get(coach)
+            if advice:
+                lines.append(f"[{seg['timestamp']}] {advice}")
+
+        for issue in analysis.get("top_issues", []):
+            tag = issue.get("tag_name", "").strip()
+            if not tag:
+                continue
+            key = tag.split("(")[0].strip()
+            merged = issues.get(key)
+            if merged is None:
+                merged = issues[key] = {**issue, "occurrences": 0, "segments": []}
+            elif _SEVERITY_RANK.get(issue.get("severity"), 0) > _SEVERITY_RANK.get(merged.get("severity"), 0):
+                # Keep the most severe diagnosis as the representative one
+                merged.update(issue)
+            merged["occurrences"] += 1
+            merged["segments"].append(seg["timestamp"])
+
+    top_issues = sorted(
+        issues.values(),
+        key=lambda i: (i["occurrences"], _SEVERITY_RANK.get(i.get("severity"), 0)),
+        reverse=True
+    )[:3]
+
+    return {
+        "analysis_report": {
+            "video_info": f"Match Video ({duration_str}, {len(ok)} segments)",
+            "video_duration": duration_str,
+            "action_description": "\n".join(f"[{t['timestamp']}] {t['content']}" for t in timeline if t["content"]),
+            "pros": _ranked(pros, 5),
+            "cons": _ranked(cons, 5)
+        },
+        "coach_advice": {coach: "\n".join(lines) for coach, lines in coach_advice.items()},
+        "timeline_commentary": timeline,
+        "top_issues": top_issues,
+        "segments": [
+            {
+                "index": s["index"],
+                "timestamp": s.get("timestamp", _segment_label(s)),
+                "start": s["start"],
+                "end": s["end"],
+                **({"analysis_report": s["analysis"].get("analysis_report", {}),
+                    "top_issues": s["analysis"].get("top_issues", [])} if "analysis" in s else {"error": s.get("error")})
+            }
+            for s in segments
+        ]
+    }
+
+
+async def analyze_long_video(
+    video_path: str,
+    duration: float,
+    severity: int = 5,
+    style: str = "conservative",
+    media_sha: Optional[str] = None
+) -> Dict:
+    """
+    Long-video mode: analyzes time segments concurrently (at most LONG_VIDEO_MAX_PARALLEL
+    decodes + model requests at once) and reduces them into one analysis_report.
+    For stored media, the poster and sprite sheet use one frame per segment (no proxy video).
+    """
+    from app.services.qwen import save_analysis_history
+    from app.services.previews import build_previews
+
+    plan = plan_segments(duration)
+    if not plan:
+        return {"error": "Could not determine video duration for long-video analysis."}
+
+    logger.info(f"Long-video mode: {len(plan)} segments over {duration:.0f}s")
+    semaphore = asyncio.Semaphore(settings.LONG_VIDEO_MAX_PARALLEL)
+    segments = await asyncio.gather(*[
+        _analyze_segment(video_path, segment, len(plan), duration, severity, style, semaphore)
+        for segment in plan
+    ])
+
+    failed = [s for s in segments if "error" in s]
+    if len(failed) == len(segments):
+        error = {"error": f"All {len(segments)} segments failed: {failed[0]['error']}"}
+        if "retry_after" in failed[0]:
+            error["retry_after"] = failed[0]["retry_after"]
+        return error
+    if failed:
+        logger.warning(f"Long-video mode: {len(failed)}/{len(segments)} segments failed")
+
+    result_json = reduce_segments(segments, duration)
+    history_id = await asyncio.to_thread(save_analysis_history, result_json, type="video")
+    if settings.FRAME_INDEX_ENABLED:
+        await asyncio.to_thread(_remember_segments, history_id, segments, _segment_kind(severity, style))
+
+    payload = {
+        "segments": len(segments),
+        "failed_segments": len(failed),
+        "reused_segments": sum(1 for s in segments if s.get("reused")),
+        "frame_count": sum(s.get("payload", {}).get("frame_count", 0) for s in segments),
+        "payload_bytes": sum(s.get("payload", {}).get("payload_bytes", 0) for s in segments),
+        "estimated_tokens": sum(s.get("payload", {}).get("estimated_tokens", 0) for s in segments)
+    }
+    result = {"analysis": result_json, "payload": payload}
+    preview_frames = [s["preview"] for s in segments if s.get("preview") is not None]
+    if media_sha and settings.PREVIEW_ENABLED and preview_frames:
+        previews = await asyncio.to_thread(
+            build_previews, media_sha, [f for f, _ in preview_frames], [t for _, t in preview_frames]
+        )
+        if previews:
+            result["previews"] = previews
+    return result
@@ -0,0 +1,303 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional, Set
+
+from app.core.config import get_settings, get_data_dir
+from app.core.storage import atomic_file, load_json, update_json
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+MEDIA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "static", "media")
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.webm')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# Derived files stored next to the media, generated once (see get_poster and previews.py)
+ASSET_SUFFIXES = {"poster": ".poster.jpg", "sprite": ".sprite.jpg", "proxy": ".proxy.mp4"}
+
+_SHA_RE = re.compile(r"\b[0-9a-f]{64}\b")
+# last_access is persisted at most this often per file, so serving media does not rewrite the index
+_TOUCH_INTERVAL_SECONDS = 300
+
+
+def get_media_index_file() -> str:
+    return os.path.join(get_data_dir(), "media.json")
+
+
+def _relative_path(sha: str, suffix: str) -> str:
+    return os.path.join(sha[:2], f"{sha}{suffix}")
+
+
+def media_path(record: Dict) -> str:
+    return os.path.join(MEDIA_DIR, _relative_path(record["sha256"], record["ext"]))
+
+
+def media_url(record: Dict) -> str:
+    """Public URL of the media-serving endpoint for this file (Range, ETag and immutable caching)."""
+    return f"{settings.PUBLIC_BASE_URL.rstrip('/')}{settings.API_V1_STR}/media/{record['sha256']}{record['ext']}"
+
+
+def asset_path(sha: str, asset: str) -> str:
+    return os.path.join(MEDIA_DIR, _relative_path(sha, ASSET_SUFFIXES[asset]))
+
+
+def asset_url(sha: str, asset: str) -> str:
+    """URL of a derived asset; versioned by mtime so it can be cached as immutable."""
+    try:
+        version = int(os.path.getmtime(asset_path(sha, asset)))
+    except OSError:
+        version = 0
+    return f"{settings.PUBLIC_BASE_URL.rstrip('/')}{settings.API_V1_STR}/media/{sha}/{asset}?v={version}"
+
+
+def get_media(sha: str) -> Optional[Dict]:
+    return load_json(get_media_index_file(), {}).get(sha)
+
+
+def _register(tmp_path: str, sha: str, ext: str, size: int, content_type: Optional[str]) -> Dict:
+    """
+    Moves a hashed file to its content address and records it. Both happen under the index
+    lock, so a sweep cannot evict the same content in between.
+    """
+    now = time.time()
+
+    def mutate(index):
+        if not _place(tmp_path, sha, ext):
+            logger.info(f"Media {sha[:12]} already stored, reusing it")
+        record = index.get(sha)
+        if record is None:
+            record = index[sha] = {
+                "sha256": sha,
+                "ext": ext,
+                "size": size,
+                "content_type": content_type,
+                "created_at": datetime.now().isoformat(),
+                "refs": 0
+            }
+        record["last_access"] = now
+        return dict(record)
+
+    return update_json(get_media_index_file(), mutate, {})
+
+
+def _place(tmp_path: str, sha: str, ext: str) -> bool:
+    """Moves a hashed temp file to its content address. Returns False if the content was already stored."""
+    target = os.path.join(MEDIA_DIR, _relative_path(sha, ext))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target):
+        os.remove(tmp_path)
+        return False
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, target)
+    return True
+
+
+async def store_stream(chunks: AsyncIterator[bytes], filename: str, content_type: Optional[str] = None) -> Dict:
+    """
+    Streams an upload into the media store, hashing while writing.
+    Identical content is stored once: a repeat upload just returns the existing record.
+    """
+    import aiofiles
+
+    ext = os.path.splitext(filename.lower())[1]
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".incoming.", suffix=ext, dir=MEDIA_DIR)
+    os.close(fd)
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out_file:
+            async for data in chunks:
+                digest.update(data)
+                size += len(data)
+                await out_file.write(data)
+        return await asyncio.to_thread(_register, tmp_path, digest.hexdigest(), ext, size, content_type)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def adopt_file(path: str, filename: str, content_type: Optional[str] = None) -> Dict:
+    """Hashes an existing file (e.g. a finished resumable upload) and moves it into the media store."""
+    ext = os.path.splitext(filename.lower())[1]
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+            size += len(block)
+    return _register(path, digest.hexdigest(), ext, size, content_type)
+
+
+def touch(sha: str):
+    """Records an access for LRU eviction (throttled to one index write per _TOUCH_INTERVAL_SECONDS)."""
+    record = get_media(sha)
+    if record is None or time.time() - record.get("last_access", 0) < _TOUCH_INTERVAL_SECONDS:
+        return
+
+    def mutate(index):
+        if sha in index:
+            index[sha]["last_access"] = time.time()
+
+    update_json(get_media_index_file(), mutate, {})
+
+
+def get_poster(sha: str) -> Optional[str]:
+    """
+    Path of a JPEG poster for the media (middle frame of a video, or a downscaled image).
+    Generated on first request and cached next to the file.
+    """
+    import cv2
+
+    record = get_media(sha)
+    if record is None:
+        return None
+    poster = asset_path(sha, "poster")
+    if os.path.exists(poster):
+        return poster
+
+    source = media_path(record)
+    frame = None
+    if record["ext"] in VIDEO_EXTENSIONS:
+        cap = cv2.VideoCapture(source)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, total // 2)
+        ret, frame = cap.read()
+        cap.release()
+        if not ret:
+            frame = None
+    elif record["ext"] in IMAGE_EXTENSIONS:
+        frame = cv2.imread(source)
+    if frame is None:
+        return None
+
+    height, width = frame.shape[:2]
+    scale = min(1.0, 640 / max(height, width))
+    if scale < 1.0:
+        frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    if not ok:
+        return None
+    with atomic_file(poster, "wb") as f:
+        f.write(buffer.tobytes())
+    return poster
+
+
+# --- References & eviction ---
+
+def _collect_hashes(value, found: Set[str]):
+    if isinstance(value, str):
+        if "/media/" in value:
+            found.update(_SHA_RE.findall(value))
+    elif isinstance(value, dict):
+        if isinstance(value.get("media_sha"), str):
+            found.add(value["media_sha"])
+        for item in value.values():
+            _collect_hashes(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_hashes(item, found)
+
+
+def reference_counts() -> Dict[str, int]:
+    """How many archives and sessions link to each media hash."""
+    from app.services.history import get_all_archives, get_all_sessions
+
+    counts: Dict[str, int] = {}
+    for owner in list(get_all_archives()) + list(get_all_sessions()):
+        found: Set[str] = set()
+        _collect_hashes(owner, found)
+        for sha in found:
+            counts[sha] = counts.get(sha, 0) + 1
+    return counts
+
+
+def _remove_files(sha: str, ext: str):
+    for suffix in (ext, *ASSET_SUFFIXES.values()):
+        try:
+            os.remove(os.path.join(MEDIA_DIR, _relative_path(sha, suffix)))
+        except FileNotFoundError:
+            pass
+
+
+def sweep(max_bytes: Optional[int] = None) -> Dict:
+    """
+    Refreshes reference counts and, while the store is over `max_bytes` (MEDIA_MAX_BYTES),
+    deletes unreferenced files least recently used first. Files younger than
+    MEDIA_EVICT_GRACE_SECONDS are kept: their analysis may still be running.
+    """
+    max_bytes = settings.MEDIA_MAX_BYTES if max_bytes is None else max_bytes
+    counts = reference_counts()
+    grace_cutoff = time.time() - settings.MEDIA_EVICT_GRACE_SECONDS
+    evicted = []
+
+    def mutate(index):
+        for sha, record in index.items():
+            record["refs"] = counts.get(sha, 0)
+        total = sum(record["size"] for record in index.values())
+        candidates = sorted(
+            (r for r in index.values() if r["refs"] == 0 and r.get("last_access", 0) < grace_cutoff),
+            key=lambda r: r.get("last_access", 0)
+        )
+        for record in candidates:
+            if total <= max_bytes:
+                break
+            evicted.append((record["sha256"], record["ext"]))
+            total -= record["size"]
+            del index[record["sha256"]]
+        return total
+
+    total = update_json(get_media_index_file(), mutate, {})
+    if evicted:
+        def remove(index):
+            # Under the index lock: content uploaded again since the first pass is kept
+            for sha, ext in evicted:
+                if sha not in index:
+                    _remove_files(sha, ext)
+
+        update_json(get_media_index_file(), remove, {})
+    if evicted:
+        logger.info(f"Media sweep: evicted {len(evicted)} unreferenced files, {total} bytes stored")
+    return {"evicted": len(evicted), "total_bytes": total}
+
+
+_sweeper: Optional[threading.Thread] = None
+_sweeper_stop = threading.Event()
+
+
+def _sweep_loop():
+    while not _sweeper_stop.wait(settings.MEDIA_SWEEP_INTERVAL_SECONDS):
+        try:
+            sweep()
+        except Exception as e:
+            logger.error(f"Media sweep failed: {e}")
+
+
+def start_media_sweeper():
+    """Starts the background eviction thread (called from the app lifespan)."""
+    global _sweeper
+    if _sweeper is not None and _sweeper.is_alive():
+        return
+    _sweeper_stop.clear()
+    _sweeper = threading.Thread(target=_sweep_loop, name="media-sweeper", daemon=True)
+    _sweeper.start()
+
+
+def stop_media_sweeper():
+    global _sweeper
+    _sweeper_stop.set()
+    if _sweeper is not None:
+        _sweeper.join(timeout=5)
+        _sweeper = None
@@ -0,0 +1,342 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from app.core import metrics, tracing
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# HTTP statuses worth another attempt (timeouts, throttling, provider-side failures)
+_RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+_LATENCY_SAMPLES = 200
+_MIN_SAMPLES_FOR_P95 = 20
+# Older samples are ignored, so a model routed around for being slow gets tried again later
+_LATENCY_WINDOW_SECONDS = 300
+
+
+class ModelCallError(Exception):
+    """Base class for model-call failures raised by this module."""
+
+
+class CircuitOpenError(ModelCallError):
+    """The model's circuit breaker is open: the call was not attempted."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"{model} is temporarily unavailable, retry in {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(ModelCallError):
+    """The overall deadline of a call (see budget()) passed before the model answered."""
+
+
+# (deadline on the time.monotonic() clock or None, retry cap or None) set by budget()
+_budget: contextvars.ContextVar[Tuple[Optional[float], Optional[int]]] = contextvars.ContextVar(
+    "model_call_budget", default=(None, None)
+)
+
+
+@contextmanager
+def budget(deadline: Optional[float] = None, max_retries: Optional[int] = None):
+    """
+    Limits the calls made inside the block: no attempt starts, waits or runs past `deadline`
+    (a time.monotonic() value), and at most `max_retries` retries (capped by QWEN_MAX_RETRIES).
+    """
+    token = _budget.set((deadline, max_retries))
+    try:
+        yield
+    finally:
+        _budget.reset(token)
+
+
+@lru_cache
+def get_client():
+    """Shared OpenAI-compatible DashScope client (connection pool reused across calls; retries are ours)."""
+    import httpx
+    from openai import OpenAI
+
+    return OpenAI(
+        api_key=settings.QWEN_API_KEY,
+        base_url=DASHSCOPE_BASE_URL,
+        timeout=httpx.Timeout(settings.QWEN_TIMEOUT_SECONDS, connect=settings.QWEN_CONNECT_TIMEOUT_SECONDS),
+        max_retries=0
+    )
+
+
+def _timeout(seconds: Optional[float]):
+    import httpx
+    return httpx.Timeout(seconds or settings.QWEN_TIMEOUT_SECONDS, connect=settings.QWEN_CONNECT_TIMEOUT_SECONDS)
+
+
+def is_retryable(err: Exception) -> bool:
+    import httpx
+    import openai
+
+    if isinstance(err, openai.APIConnectionError):  # includes timeouts
+        return True
+    if isinstance(err, httpx.TransportError):  # raised as is while a stream is being read
+        return True
+    return getattr(err, "status_code", None) in _RETRYABLE_STATUSES
+
+
+def _retry_after(err: Exception) -> Optional[float]:
+    """Server-provided Retry-After (seconds), if any."""
+    response = getattr(err, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, err: Optional[Exception] = None) -> float:
+    """Exponential backoff with full jitter; a Retry-After from the server wins (within the cap)."""
+    server_delay = _retry_after(err) if err is not None else None
+    if server_delay is not None:
+        return min(server_delay, settings.QWEN_BACKOFF_MAX_SECONDS)
+    ceiling = min(settings.QWEN_BACKOFF_MAX_SECONDS, settings.QWEN_BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """
+    Per-model breaker. After QWEN_BREAKER_FAILURES consecutive provider-side failures the
+    circuit opens and calls fail fast for QWEN_BREAKER_COOLDOWN_SECONDS; then one probe call
+    is let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, model: str, failure_threshold: int, cooldown: float):
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if self._probing or time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(self.model, max(remaining, 1.0))
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"Circuit for {self.model} closed")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    logger.warning(f"Circuit for {self.model} opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, Deque[Tuple[float, float]]] = {}
+_state_lock = threading.Lock()
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="model-hedge")
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    with _state_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = _breakers[model] = CircuitBreaker(
+                model, settings.QWEN_BREAKER_FAILURES, settings.QWEN_BREAKER_COOLDOWN_SECONDS
+            )
+        return breaker
+
+
+def breakers() -> Dict[str, CircuitBreaker]:
+    with _state_lock:
+        return dict(_breakers)
+
+
+def _record_latency(model: str, seconds: float):
+    with _state_lock:
+        _latencies.setdefault(model, deque(maxlen=_LATENCY_SAMPLES)).append((time.monotonic(), seconds))
+
+
+def latency_p95(model: str) -> Optional[float]:
+    """p95 of successful call latencies over the last few minutes (None until enough samples)."""
+    cutoff = time.monotonic() - _LATENCY_WINDOW_SECONDS
+    with _state_lock:
+        samples = sorted(seconds for at, seconds in _latencies.get(model, ()) if at >= cutoff)
+    if len(samples) < _MIN_SAMPLES_FOR_P95:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def hedge_delay(model: str) -> float:
+    if settings.QWEN_HEDGE_DELAY_SECONDS > 0:
+        return settings.QWEN_HEDGE_DELAY_SECONDS
+    p95 = latency_p95(model)
+    if p95 is None:
+        return settings.QWEN_HEDGE_INITIAL_DELAY_SECONDS
+    return max(p95, settings.QWEN_HEDGE_MIN_DELAY_SECONDS)
+
+
+def _hedged(model: str, attempt: Callable[[], Any], delay: float) -> Any:
+    """
+    Runs `attempt`; if it has not finished after `delay`, starts a second identical request
+    and returns whichever succeeds first. The slower request is not cancelled, only ignored.
+    """
+    # Pool threads do not inherit the caller's context: pass it on so attempts join the trace
+    first = _hedge_pool.submit(tracing.run_in_context(attempt))
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    logger.info(f"Hedging {model} request after {delay:.2f}s")
+    pending = {first, _hedge_pool.submit(tracing.run_in_context(attempt))}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            # Prefer a real provider error over "circuit open" from the hedge
+            if error is None or isinstance(error, CircuitOpenError):
+                error = future.exception()
+    raise error
+
+
+def call(model: str, request: Callable[[Any, Any], Any], timeout: Optional[float] = None, hedge: bool = False) -> Any:
+    """
+    Calls `request(client, timeout)` (blocking) with the model's circuit breaker, retries on
+    retryable errors with jittered exponential backoff (QWEN_MAX_RETRIES), and, with `hedge`,
+    a second request once the first is slower than the model's recent p95.
+    Raises CircuitOpenError without calling the provider while the circuit is open.
+    """
+    breaker = get_breaker(model)
+    client = get_client()
+    deadline, retry_cap = _budget.get()
+    max_retries = settings.QWEN_MAX_RETRIES if retry_cap is None else min(retry_cap, settings.QWEN_MAX_RETRIES)
+
+    def remaining() -> Optional[float]:
+        if deadline is None:
+            return None
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise DeadlineExceeded(f"{model} call did not finish within its deadline")
+        return left
+
+    def attempt():
+        left = remaining()
+        request_timeout = _timeout(min(timeout or settings.QWEN_TIMEOUT_SECONDS, left) if left else timeout)
+        breaker.before_call()
+        span = tracing.start_span("model_request", {"model": model})
+        start = time.monotonic()
+        try:
+            response = request(client, request_timeout)
+        except Exception as e:
+            if is_retryable(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()  # the provider answered; the request itself was bad
+            metrics.observe("model_call_duration_seconds", time.monotonic() - start, model=model, outcome="error")
+            tracing.set_attribute("http.status_code", getattr(e, "status_code", None) or 0)
+            tracing.end_span(span, e)
+            raise
+        breaker.record_success()
+        elapsed = time.monotonic() - start
+        _record_latency(model, elapsed)
+        metrics.observe("model_call_duration_seconds", elapsed, model=model, outcome="ok")
+        usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+        metrics.record_usage(model, usage)
+        tracing.end_span(span)
+        return response
+
+    for attempt_no in range(max_retries + 1):
+        try:
+            return _hedged(model, attempt, hedge_delay(model)) if hedge else attempt()
+        except (CircuitOpenError, DeadlineExceeded):
+            raise
+        except Exception as e:
+            if not is_retryable(e) or attempt_no == max_retries:
+                raise
+            delay = backoff_delay(attempt_no, e)
+            left = remaining()
+            if left is not None and delay >= left:
+                raise
+            logger.warning(f"{model} call failed ({e}); retry {attempt_no + 1}/{max_retries} in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def payload_bytes(messages: list) -> int:
+    """Size of the text and inline (base64 data URL) images in chat messages."""
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"text": content or ""}]
+        for part in parts:
+            total += len(part.get("text") or "") + len((part.get("image_url") or {}).get("url") or "")
+    return total
+
+
+def chat_completion(
+    model: str,
+    messages: list,
+    timeout: Optional[float] = None,
+    hedge: bool = False,
+    read: Optional[Callable[[Any], Any]] = None,
+    **kwargs
+):
+    """
+    A chat completion through call(). With `read`, the result is read(completion), consumed within
+    the attempt: a stream that fails midway is retried (or fails over) like any failed request, and
+    the latency covers the whole response.
+    """
+    size = payload_bytes(messages) if metrics.enabled() else 0
+
+    def request(client, t):
+        metrics.inc("model_request_bytes_total", size, model=model)  # every attempt sends it again
+        completion = client.chat.completions.create(model=model, messages=messages, timeout=t, **kwargs)
+        return read(completion) if read is not None else completion
+
+    return call(model, request, timeout=timeout, hedge=hedge)
+
+
+def embedding(model: str, text: str) -> list:
+    response = call(model, lambda client, t: client.embeddings.create(model=model, input=text, timeout=t))
+    return response.data[0].embedding
+
+
+def error_result(err: Exception) -> dict:
+    """The error dict services return for a failed call ("retry_after" while the circuit is open)."""
+    from app.core.admission import AdmissionRejected
+
+    if isinstance(err, AdmissionRejected):
+        return err.to_result()
+    if isinstance(err, CircuitOpenError):
+        return {"error": str(err), "retry_after": err.retry_after}
+    return {"error": f"API Call Failed: {str(err)}"}
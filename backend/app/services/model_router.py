@@ -0,0 +1,155 @@
+import logging
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.core import admission, tracing
+from app.core.config import get_settings
+from app.services import model_client
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# HTTP statuses after which another tier is tried (besides retryable errors and an open circuit):
+# 404 = model not available to this account
+_FALLBACK_STATUSES = {404}
+
+# Admission workload class (global concurrency slot) held for the whole call, fallbacks included
+_WORKLOADS = {"chat": "chat", "video": "vision", "style": "vision", "embedding": "embedding"}
+
+
+def _tiers(value: str) -> List[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def get_route(task: str) -> Dict:
+    """
+    Routing config of a task. Tiers are ordered fastest/cheapest first, best last;
+    `default_tier` serves normal inputs, inputs up to `small_input` go to the fastest tier
+    and inputs from `large_input` to the best one (0 disables either rule).
+    """
+    routes = {
+        "chat": {
+            "tiers": _tiers(settings.MODEL_CHAT_TIERS),
+            "default_tier": settings.MODEL_CHAT_DEFAULT_TIER,
+            "slo_seconds": settings.MODEL_CHAT_SLO_SECONDS,
+            "small_input": settings.MODEL_CHAT_SMALL_INPUT,
+            "large_input": settings.MODEL_CHAT_LARGE_INPUT,
+            "deadline_seconds": settings.MODEL_CHAT_DEADLINE_SECONDS,
+        },
+        "video": {
+            "tiers": _tiers(settings.MODEL_VIDEO_TIERS),
+            "default_tier": settings.MODEL_VIDEO_DEFAULT_TIER,
+            "slo_seconds": settings.MODEL_VIDEO_SLO_SECONDS,
+            "small_input": 0,
+            "large_input": settings.MODEL_VIDEO_LARGE_INPUT,
+            "deadline_seconds": settings.MODEL_VIDEO_DEADLINE_SECONDS,
+        },
+        "style": {
+            "tiers": _tiers(settings.MODEL_STYLE_TIERS),
+            "default_tier": settings.MODEL_STYLE_DEFAULT_TIER,
+            "slo_seconds": settings.MODEL_STYLE_SLO_SECONDS,
+            "small_input": 0,
+            "large_input": 0,
+            "deadline_seconds": settings.MODEL_STYLE_DEADLINE_SECONDS,
+        },
+        # Vectors from different models are not comparable: embeddings never fall back
+        "embedding": {
+            "tiers": _tiers(settings.MODEL_EMBEDDING)[:1],
+            "default_tier": 0,
+            "slo_seconds": 0,
+            "small_input": 0,
+            "large_input": 0,
+            "deadline_seconds": settings.MODEL_EMBEDDING_DEADLINE_SECONDS,
+        },
+    }
+    return routes[task]
+
+
+def plan(task: str, input_size: int = 0) -> Tuple[List[str], str]:
+    """
+    Candidate models in the order they will be tried, and why the first one was picked
+    (default, small_input, large_input, slo or circuit_open).
+    """
+    route = get_route(task)
+    tiers = route["tiers"]
+    chosen, reason = min(max(route["default_tier"], 0), len(tiers) - 1), "default"
+    if route["small_input"] and input_size <= route["small_input"]:
+        chosen, reason = 0, "small_input"
+    elif route["large_input"] and input_size >= route["large_input"]:
+        chosen, reason = len(tiers) - 1, "large_input"
+
+    if not settings.MODEL_ROUTING_ENABLED:
+        return [tiers[chosen]], reason
+
+    # Fall back to faster/cheaper tiers first, then better ones
+    order = [tiers[chosen]] + tiers[:chosen][::-1] + tiers[chosen + 1:]
+
+    def slow(model: str) -> bool:
+        p95 = model_client.latency_p95(model)
+        return bool(route["slo_seconds"]) and p95 is not None and p95 > route["slo_seconds"]
+
+    def tripped(model: str) -> bool:
+        return model_client.get_breaker(model).state == "open"
+
+    # Stable: healthy tiers keep their order, slow ones move back, tripped ones go last
+    candidates = sorted(order, key=lambda m: (tripped(m), slow(m)))
+    if candidates[0] != order[0]:
+        reason = "circuit_open" if tripped(order[0]) else "slo"
+    return candidates, reason
+
+
+def _should_fall_back(err: Exception) -> bool:
+    return (
+        isinstance(err, model_client.CircuitOpenError)
+        or model_client.is_retryable(err)
+        or getattr(err, "status_code", None) in _FALLBACK_STATUSES
+    )
+
+
+def route_call(task: str, request: Callable[[str], Any], input_size: int = 0) -> Tuple[Any, Dict]:
+    """
+    Runs `request(model)` on the task's planned models until one succeeds (falling back on
+    provider failures and open circuits, not on bad requests). Only the last candidate retries,
+    and the task's deadline bounds the whole call. Returns (response, model_meta),
+    where model_meta records the choice for the result metadata. Raises the last error, or
+    AdmissionRejected when the task's workload has no free slot within the wait budget.
+    """
+    with admission.slot(_WORKLOADS[task]):
+        return _call_candidates(task, request, input_size)
+
+
+def _call_candidates(task: str, request: Callable[[str], Any], input_size: int) -> Tuple[Any, Dict]:
+    candidates, reason = plan(task, input_size)
+    deadline_seconds = get_route(task)["deadline_seconds"]
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+    failed = []
+    for i, model in enumerate(candidates):
+        start = time.monotonic()
+        try:
+            # A failing tier falls back at once; retries would only delay the next one
+            with model_client.budget(deadline, None if i == len(candidates) - 1 else 0):
+                response = request(model)
+        except Exception as e:
+            failed.append({"model": model, "error": str(e)[:200]})
+            if i == len(candidates) - 1 or not _should_fall_back(e):
+                raise
+            logger.warning(f"{task}: {model} failed ({e}), falling back to {candidates[i + 1]}")
+            continue
+        tracing.set_attribute("model", model)
+        tracing.set_attribute("model.reason", reason if not failed else "fallback")
+        meta = {
+            "task": task,
+            "model": model,
+            "reason": reason if not failed else "fallback",
+            "latency_ms": round((time.monotonic() - start) * 1000),
+            "input_size": input_size
+        }
+        if failed:
+            meta["failed"] = failed
+        return response, meta
+
+
+def chat_completion(task: str, messages: list, input_size: int = 0, **kwargs) -> Tuple[Any, Dict]:
+    """model_client.chat_completion on the model the router picks for `task`."""
+    return route_call(task, lambda model: model_client.chat_completion(model, messages, **kwargs), input_size)
@@ -0,0 +1,145 @@
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]  # x, y, w, h
+
+# Detection runs on downscaled copies; boxes are mapped back to full resolution
+_WORK_WIDTH = 320
+# Foreground blobs smaller than this fraction of the frame are noise (shuttle, net wobble)
+_MIN_BLOB_FRACTION = 0.004
+_DIFF_THRESHOLD = 30
+_SMOOTH_WINDOW = 3
+
+_hog = None
+
+
+def _get_hog() -> cv2.HOGDescriptor:
+    global _hog
+    if _hog is None:
+        _hog = cv2.HOGDescriptor()
+        _hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+    return _hog
+
+
+def _union(boxes: Sequence[Box]) -> Optional[Box]:
+    if not boxes:
+        return None
+    x0 = min(b[0] for b in boxes)
+    y0 = min(b[1] for b in boxes)
+    x1 = max(b[0] + b[2] for b in boxes)
+    y1 = max(b[1] + b[3] for b in boxes)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def _motion_boxes(small_bgr: List[np.ndarray]) -> List[Optional[Box]]:
+    """Foreground against the median of the sampled frames (static camera assumed)."""
+    if len(small_bgr) < 3:
+        return [None] * len(small_bgr)
+
+    background = np.median(np.stack(small_bgr), axis=0).astype(np.uint8)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    boxes = []
+    for frame in small_bgr:
+        # Largest per-channel difference: shirts and court can have similar brightness
+        diff = cv2.absdiff(frame, background).max(axis=2)
+        _, mask = cv2.threshold(diff, _DIFF_THRESHOLD, 255, cv2.THRESH_BINARY)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+        mask = cv2.dilate(mask, kernel, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_area = _MIN_BLOB_FRACTION * frame.shape[0] * frame.shape[1]
+        blobs = [cv2.boundingRect(c) for c in contours if cv2.contourArea(c) >= min_area]
+        boxes.append(_union(blobs))
+    return boxes
+
+
+def _hog_box(small_bgr: np.ndarray) -> Optional[Box]:
+    rects, weights = _get_hog().detectMultiScale(small_bgr, winStride=(8, 8), padding=(8, 8), scale=1.05)
+    if len(rects) == 0:
+        return None
+    confident = [tuple(int(v) for v in r) for r, w in zip(rects, np.ravel(weights)) if w > 0.3]
+    return _union(confident or [tuple(int(v) for v in rects[int(np.argmax(weights))])])
+
+
+def _fill_and_smooth(boxes: List[Optional[Box]]) -> List[Optional[Box]]:
+    """Fills frames without a detection from the nearest detected frame, then smooths centers and sizes."""
+    detected = [i for i, b in enumerate(boxes) if b is not None]
+    if not detected:
+        return boxes
+
+    filled = []
+    for i in range(len(boxes)):
+        nearest = min(detected, key=lambda j: abs(j - i))
+        filled.append(boxes[nearest])
+
+    arr = np.array([[x + w / 2, y + h / 2, w, h] for x, y, w, h in filled], dtype=np.float32)
+    half = _SMOOTH_WINDOW // 2
+    smoothed = []
+    for i in range(len(arr)):
+        window = arr[max(0, i - half):i + half + 1]
+        cx, cy, _, _ = window.mean(axis=0)
+        # Use the largest size in the window so the player never gets clipped mid-swing
+        w, h = window[:, 2].max(), window[:, 3].max()
+        smoothed.append((cx, cy, w, h))
+    return smoothed
+
+
+def detect_player_regions(
+    frames: Sequence[np.ndarray],
+    padding: float = 0.3,
+    min_fraction: float = 0.4,
+    method: str = "auto"
+) -> List[Optional[Box]]:
+    """
+    Finds the player region in each sampled frame and returns crop boxes (x, y, w, h)
+    in frame coordinates, or None for frames that should be sent uncropped.
+
+    `method` is "motion" (background subtraction against the median frame), "hog"
+    (OpenCV's HOG person detector) or "auto" (motion, with HOG for frames where motion
+    finds nothing). Boxes are smoothed across frames, padded by `padding` of their size
+    on each side and never smaller than `min_fraction` of the frame in either dimension.
+    """
+    if not frames:
+        return []
+
+    height, width = frames[0].shape[:2]
+    ratio = min(1.0, _WORK_WIDTH / width)
+    small = [cv2.resize(f, (max(1, int(width * ratio)), max(1, int(height * ratio)))) for f in frames]
+
+    try:
+        if method in ("motion", "auto"):
+            boxes = _motion_boxes(small)
+        else:
+            boxes = [None] * len(frames)
+        if method in ("hog", "auto"):
+            boxes = [b if b is not None else _hog_box(f) for b, f in zip(boxes, small)]
+    except cv2.error as e:
+        logger.warning(f"Player ROI detection failed, sending full frames: {e}")
+        return [None] * len(frames)
+
+    smoothed = _fill_and_smooth(boxes)
+
+    crops = []
+    for box in smoothed:
+        if box is None:
+            crops.append(None)
+            continue
+        cx, cy, w, h = (v / ratio for v in box)
+        w = max(w * (1 + 2 * padding), width * min_fraction)
+        h = max(h * (1 + 2 * padding), height * min_fraction)
+        if w >= width * 0.9 and h >= height * 0.9:
+            # Nothing to gain from cropping
+            crops.append(None)
+            continue
+        w, h = min(w, width), min(h, height)
+        x = int(round(min(max(0, cx - w / 2), width - w)))
+        y = int(round(min(max(0, cy - h / 2), height - h)))
+        crops.append((x, y, int(round(w)), int(round(h))))
+
+    found = sum(1 for c in crops if c is not None)
+    logger.info(f"Player ROI: cropping {found}/{len(frames)} frames")
+    return crops
@@ -0,0 +1,209 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]  # x, y, w, h
+
+# OpenPose COCO keypoint order (first 18 heatmaps of the OpenPose / lightweight OpenPose nets)
+KEYPOINTS = [
+    "nose", "neck", "r_shoulder", "r_elbow", "r_wrist", "l_shoulder", "l_elbow", "l_wrist",
+    "r_hip", "r_knee", "r_ankle", "l_hip", "l_knee", "l_ankle", "r_eye", "l_eye", "r_ear", "l_ear"
+]
+_K = {name: i for i, name in enumerate(KEYPOINTS)}
+
+# Joint angles as (a, vertex, b): angle at `vertex` between the segments to `a` and `b`
+ANGLES = {
+    "r_elbow": ("r_shoulder", "r_elbow", "r_wrist"),
+    "l_elbow": ("l_shoulder", "l_elbow", "l_wrist"),
+    "r_shoulder": ("r_hip", "r_shoulder", "r_elbow"),
+    "l_shoulder": ("l_hip", "l_shoulder", "l_elbow"),
+    "r_knee": ("r_hip", "r_knee", "r_ankle"),
+    "l_knee": ("l_hip", "l_knee", "l_ankle"),
+    "r_hip": ("neck", "r_hip", "r_knee"),
+    "l_hip": ("neck", "l_hip", "l_knee"),
+}
+
+_net = None
+_net_lock = threading.Lock()
+
+
+def is_available() -> bool:
+    """True when a pose model is configured and present on disk."""
+    path = get_settings().POSE_MODEL_PATH
+    return bool(path) and os.path.exists(path)
+
+
+def _get_net():
+    global _net
+    with _net_lock:
+        if _net is None:
+            settings = get_settings()
+            config = settings.POSE_CONFIG_PATH or ""
+            _net = cv2.dnn.readNet(settings.POSE_MODEL_PATH, config)
+            _net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            _net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        return _net
+
+
+def estimate_keypoints(frame: np.ndarray, box: Optional[Box] = None) -> np.ndarray:
+    """
+    Runs the pose net on one frame (or on the `box` crop of it) for a single player.
+    Returns an (18, 3) array of x, y in frame pixels and confidence; low-confidence points are NaN.
+    """
+    settings = get_settings()
+    x0, y0 = 0, 0
+    if box is not None:
+        x0, y0, w, h = box
+        frame = frame[y0:y0 + h, x0:x0 + w]
+    height, width = frame.shape[:2]
+
+    size = settings.POSE_INPUT_SIZE
+    blob = cv2.dnn.blobFromImage(frame, 1.0 / 255, (size, size), (0, 0, 0), swapRB=False, crop=False)
+    net = _get_net()
+    with _net_lock:
+        net.setInput(blob)
+        output = net.forward()
+
+    heatmaps = output[0, :len(KEYPOINTS)]
+    out_h, out_w = heatmaps.shape[1:]
+    points = np.full((len(KEYPOINTS), 3), np.nan, dtype=np.float32)
+    for i, heatmap in enumerate(heatmaps):
+        _, confidence, _, (px, py) = cv2.minMaxLoc(heatmap)
+        if confidence >= settings.POSE_CONFIDENCE:
+            points[i] = (x0 + px * width / out_w, y0 + py * height / out_h, confidence)
+    return points
+
+
+def _angle(points: np.ndarray, a: str, vertex: str, b: str) -> float:
+    pa, pv, pb = points[_K[a], :2], points[_K[vertex], :2], points[_K[b], :2]
+    v1, v2 = pa - pv, pb - pv
+    denom = np.linalg.norm(v1) * np.linalg.norm(v2)
+    if not np.isfinite(denom) or denom == 0:
+        return float("nan")
+    return float(np.degrees(np.arccos(np.clip(np.dot(v1, v2) / denom, -1.0, 1.0))))
+
+
+def joint_angle_series(keypoints: Sequence[np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Per-frame joint angles in degrees (NaN where a joint was not detected), plus:
+    - trunk_lean: neck -> mid-hip vs vertical (0 = upright)
+    - r_wrist_height / l_wrist_height: wrist above the neck in torso lengths (contact point proxy)
+    - stance_width: ankle distance in hip widths
+    """
+    series = {name: [] for name in list(ANGLES) + ["trunk_lean", "r_wrist_height", "l_wrist_height", "stance_width"]}
+    for points in keypoints:
+        for name, (a, vertex, b) in ANGLES.items():
+            series[name].append(_angle(points, a, vertex, b))
+
+        neck = points[_K["neck"], :2]
+        hips = points[[_K["r_hip"], _K["l_hip"]], :2]
+        hips = hips[np.isfinite(hips[:, 0])]
+        mid_hip = hips.mean(axis=0) if len(hips) else np.array([np.nan, np.nan])
+        torso = mid_hip - neck
+        torso_len = float(np.linalg.norm(torso))
+        if np.isfinite(torso_len) and torso_len > 0:
+            series["trunk_lean"].append(float(np.degrees(np.arctan2(abs(torso[0]), torso[1]))))
+            for side in ("r", "l"):
+                wrist = points[_K[f"{side}_wrist"], :2]
+                series[f"{side}_wrist_height"].append(float((neck[1] - wrist[1]) / torso_len))
+        else:
+            series["trunk_lean"].append(float("nan"))
+            series["r_wrist_height"].append(float("nan"))
+            series["l_wrist_height"].append(float("nan"))
+
+        hip_width = float(np.linalg.norm(points[_K["r_hip"], :2] - points[_K["l_hip"], :2]))
+        ankle_dist = float(np.linalg.norm(points[_K["r_ankle"], :2] - points[_K["l_ankle"], :2]))
+        series["stance_width"].append(ankle_dist / hip_width if np.isfinite(hip_width) and hip_width > 0 else float("nan"))
+
+    return {name: np.asarray(values, dtype=np.float32) for name, values in series.items()}
+
+
+def summarize_motion(series: Dict[str, np.ndarray], timestamps: Sequence[float]) -> Dict:
+    """Compact numeric summary: per-metric min/max/mean and the pose at the highest-wrist frame."""
+    summary = {"frames": len(timestamps), "metrics": {}, "contact_estimate": None}
+    for name, values in series.items():
+        valid = values[np.isfinite(values)]
+        if len(valid) == 0:
+            continue
+        summary["metrics"][name] = {
+            "min": round(float(valid.min()), 1),
+            "max": round(float(valid.max()), 1),
+            "mean": round(float(valid.mean()), 1),
+            "detected": int(len(valid)),
+        }
+
+    # Likely contact: the frame where the hitting wrist is highest
+    wrist = np.fmax(series.get("r_wrist_height", np.array([])), series.get("l_wrist_height", np.array([])))
+    if len(wrist) and np.isfinite(wrist).any():
+        i = int(np.nanargmax(wrist))
+        summary["contact_estimate"] = {
+            "timestamp": round(float(timestamps[i]), 2),
+            **{name: round(float(values[i]), 1) for name, values in series.items() if np.isfinite(values[i])}
+        }
+    return summary
+
+
+def format_motion_summary(summary: Dict) -> str:
+    """Renders the summary as a few compact prompt lines."""
+    if not summary or not summary.get("metrics"):
+        return ""
+    lines = [f"Pose estimation over {summary['frames']} frames (angles in degrees, heights in torso lengths):"]
+    for name, m in summary["metrics"].items():
+        lines.append(f"- {name}: min {m['min']}, max {m['max']}, mean {m['mean']} ({m['detected']} frames)")
+    contact = summary.get("contact_estimate")
+    if contact:
+        values = ", ".join(f"{k} {v}" for k, v in contact.items() if k != "timestamp")
+        lines.append(f"- estimated contact at {contact['timestamp']}s: {values}")
+    return "\n".join(lines)
+
+
+def analyze_motion(
+    frames: Sequence[np.ndarray],
+    timestamps: Sequence[float],
+    crops: Optional[Sequence[Optional[Box]]] = None,
+    hashes: Optional[Sequence[int]] = None
+) -> Optional[Dict]:
+    """
+    Runs pose estimation on the sampled frames and returns summarize_motion output,
+    or None when no pose model is configured or inference fails.
+    With frame `hashes`, keypoints of frames seen in an earlier upload come from the frame index.
+    """
+    if not frames or not is_available():
+        return None
+    crops = crops or [None] * len(frames)
+
+    index = None
+    if hashes is not None and get_settings().FRAME_INDEX_ENABLED:
+        from app.services.frame_hash import get_frame_index
+        index = get_frame_index()
+
+    keypoints = []
+    reused = 0
+    try:
+        for i, (frame, box) in enumerate(zip(frames, crops)):
+            cached = index.get(hashes[i], "pose") if index else None
+            if cached is not None:
+                keypoints.append(np.array(cached, dtype=np.float32))
+                reused += 1
+                continue
+            points = estimate_keypoints(frame, box)
+            keypoints.append(points)
+            if index:
+                index.put(hashes[i], "pose", [[None if np.isnan(v) else round(float(v), 2) for v in p] for p in points])
+    except cv2.error as e:
+        logger.warning(f"Pose estimation failed, continuing without motion data: {e}")
+        return None
+
+    if index:
+        if reused:
+            logger.info(f"Pose: reused keypoints for {reused}/{len(frames)} frames from the frame index")
+        index.flush()
+    return summarize_motion(joint_angle_series(keypoints), timestamps)
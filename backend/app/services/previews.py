@@ -0,0 +1,172 @@
+import logging
+import math
+import os
+import tempfile
+from typing import Dict, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.storage import atomic_file
+from app.services.media import asset_path, asset_url
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+POSTER = "poster"
+SPRITE = "sprite"
+PROXY = "proxy"
+
+
+def _resize_to_width(frame: np.ndarray, width: int) -> np.ndarray:
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def _write_jpeg(path: str, image: np.ndarray, quality: int = 80) -> bool:
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        return False
+    # A unique temp file: two analyses of the same media may write the same asset at once
+    with atomic_file(path, "wb") as f:
+        f.write(buffer.tobytes())
+    return True
+
+
+def write_poster(sha: str, frame: np.ndarray) -> Optional[str]:
+    """Poster JPEG (at most 640 px wide) from an already decoded frame."""
+    if frame.shape[1] > 640:
+        frame = _resize_to_width(frame, 640)
+    return asset_url(sha, POSTER) if _write_jpeg(asset_path(sha, POSTER), frame) else None
+
+
+def write_sprite(sha: str, frames: Sequence[np.ndarray], timestamps: Sequence[float]) -> Optional[Dict]:
+    """
+    Thumbnail sprite sheet of the analyzed frames, left to right then top to bottom.
+    Returns the layout the frontend needs to slice it (tile size, columns, per-tile timestamps).
+    """
+    if not frames:
+        return None
+    width = settings.PREVIEW_THUMB_WIDTH
+    thumbs = [_resize_to_width(f, width) for f in frames]
+    height = max(t.shape[0] for t in thumbs)
+    columns = min(settings.PREVIEW_SPRITE_COLUMNS, len(thumbs))
+    rows = math.ceil(len(thumbs) / columns)
+
+    sheet = np.zeros((rows * height, columns * width, 3), dtype=np.uint8)
+    for i, thumb in enumerate(thumbs):
+        r, c = divmod(i, columns)
+        sheet[r * height:r * height + thumb.shape[0], c * width:(c + 1) * width] = thumb
+
+    if not _write_jpeg(asset_path(sha, SPRITE), sheet, quality=75):
+        return None
+    return {
+        "url": asset_url(sha, SPRITE),
+        "columns": columns,
+        "rows": rows,
+        "tile_width": width,
+        "tile_height": height,
+        "timestamps": [round(float(t), 2) for t in timestamps]
+    }
+
+
+class ProxyWriter:
+    """
+    Low-resolution proxy MP4 written from frames as they are decoded (see qwen.sample_frames'
+    `on_frame`), so the proxy costs no extra decode pass. Frames are downscaled to
+    PREVIEW_PROXY_HEIGHT and dropped down to PREVIEW_PROXY_FPS.
+
+    PREVIEW_PROXY_FOURCC (default avc1/H.264) falls back to mp4v when the OpenCV build has
+    no H.264 encoder; mp4v plays in fewer browsers.
+    """
+
+    def __init__(self, sha: str):
+        self.sha = sha
+        self.path = asset_path(sha, PROXY)
+        self._tmp_path: Optional[str] = None
+        self._writer = None
+        self._failed = False
+        self._step = 1.0
+        self._next = 0.0
+        self._size = None
+
+    def _open(self, frame: np.ndarray, fps: float):
+        height = min(settings.PREVIEW_PROXY_HEIGHT, frame.shape[0])
+        width = round(frame.shape[1] * height / frame.shape[0] / 2) * 2  # even sizes for the encoder
+        self._size = (width, height)
+        out_fps = min(fps, settings.PREVIEW_PROXY_FPS) if fps > 0 else settings.PREVIEW_PROXY_FPS
+        self._step = fps / out_fps if fps > 0 else 1.0
+
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        # Unique per writer, so concurrent analyses of the same media never share a temp file
+        fd, self._tmp_path = tempfile.mkstemp(
+            prefix=f".{os.path.basename(self.path)}.", suffix=".tmp.mp4", dir=directory
+        )
+        os.close(fd)
+        for fourcc in dict.fromkeys([settings.PREVIEW_PROXY_FOURCC, "mp4v"]):
+            writer = cv2.VideoWriter(self._tmp_path, cv2.VideoWriter_fourcc(*fourcc), out_fps, self._size)
+            if writer.isOpened():
+                self._writer = writer
+                return
+            writer.release()
+        logger.warning("Proxy video disabled: no usable VideoWriter codec")
+        os.remove(self._tmp_path)
+        self._failed = True
+
+    def write(self, frame: np.ndarray, index: int, fps: float):
+        if self._failed:
+            return
+        if self._writer is None:
+            self._open(frame, fps)
+            if self._failed:
+                return
+            self._next = index
+        if index < self._next:
+            return
+        self._next += self._step
+        try:
+            self._writer.write(cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA))
+        except cv2.error as e:
+            # Never let the proxy break frame extraction for the analysis
+            logger.warning(f"Proxy video disabled: {e}")
+            self._failed = True
+
+    def close(self) -> Optional[str]:
+        """Finishes the file and returns its URL (None if nothing was written)."""
+        if self._writer is None:
+            return None
+        self._writer.release()
+        self._writer = None
+        if os.path.exists(self._tmp_path) and os.path.getsize(self._tmp_path) > 0:
+            os.replace(self._tmp_path, self.path)
+            return asset_url(self.sha, PROXY)
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        return None
+
+
+def build_previews(
+    sha: str,
+    frames: Sequence[np.ndarray],
+    timestamps: Sequence[float],
+    proxy_url: Optional[str] = None
+) -> Optional[Dict]:
+    """
+    Poster (middle analyzed frame) and sprite sheet from frames the analysis already decoded.
+    Returns the `previews` block stored on the archive record, or None if nothing could be written.
+    """
+    if not frames:
+        return None
+    try:
+        previews = {
+            POSTER: write_poster(sha, frames[len(frames) // 2]),
+            SPRITE: write_sprite(sha, frames, timestamps),
+            PROXY: proxy_url
+        }
+    except (cv2.error, OSError) as e:
+        logger.warning(f"Preview generation failed: {e}")
+        return None
+    return previews
@@ -102,7 +102,19 @@ def get_style_analysis_prompt():
     }}
     """
 
-def get_video_analysis_prompt(strictness: int = 5, style: str = "conservative"):
+def get_motion_data_section(motion_summary: str = ""):
+    """
+    本地姿态估计的量化数据段落 (无数据时为空)
+    """
+    if not motion_summary:
+        return ""
+    return f"""
+    **本地姿态估计数据 (Pose Estimation Data)**:
+    以下数据由本地姿态估计模型从更多帧中计算得出，比画面本身更精确。请优先依据这些数值判断关节角度、击球点高度和发力顺序：
+    {motion_summary}
+    """
+
+def get_video_analysis_prompt(strictness: int = 5, style: str = "conservative", motion_summary: str = ""):
     """
     生成视频技术分析的完整 Prompt
     """
@@ -117,7 +129,7 @@ def get_video_analysis_prompt(strictness: int = 5, style: str = "conservative"):
     {COACH_AN_PROMPT}
     
     {get_terminology_string()}
-
+    {get_motion_data_section(motion_summary)}
     **核心要求：**
     1. **精准诊断**：不要说空话，指出具体的关节角度和发力顺序错误。
     2. **术语规范**：请严格使用上述核心术语库中的标准术语。
@@ -1,14 +1,24 @@
-from openai import OpenAI
+from __future__ import annotations
+
+from app.core import admission, metrics
 from app.core.config import get_settings, get_data_dir
+from app.core.ids import new_id
+from app.core.storage import update_json
 from app.services.prompts import get_video_analysis_prompt, get_style_analysis_prompt, get_chat_prompt
+from app.services import analysis_schema, model_client, model_router, structured_output
+import asyncio
 import logging
 import json
 import os
-import cv2
-import numpy as np
 import base64
 import tempfile
 from datetime import datetime
+from typing import Any, Callable, TYPE_CHECKING
+
+# openai, OpenCV, NumPy and the frame pipeline are imported on first use: text chat and the
+# non-AI endpoints should not pay their import time on a serverless cold start.
+if TYPE_CHECKING:
+    import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,43 +30,42 @@ if not settings.QWEN_API_KEY:
         logger.warning("QWEN_API_KEY is not set. Qwen API calls will fail.")
 
 def get_client():
-    return OpenAI(
-        api_key=settings.QWEN_API_KEY,
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-    )
+    return model_client.get_client()
 
-def save_analysis_history(data: dict, type: str = "video"):
-    """Saves the analysis result to a local JSON file."""
+def save_analysis_history(data: dict, type: str = "video") -> str:
+    """Saves the analysis result to a local JSON file. Returns the entry id."""
     # Use a unified history file
     history_file = os.path.join(get_data_dir(), "history.json")
-    os.makedirs(os.path.dirname(history_file), exist_ok=True)
-    
-    history = []
-    if os.path.exists(history_file):
-        try:
-            with open(history_file, "r", encoding="utf-8") as f:
-                history = json.load(f)
-        except Exception:
-            history = []
     
     # Add metadata
     entry = {
-        "id": str(len(history) + 1),
+        "id": new_id(),
         "created_at": datetime.now().isoformat(),
         "type": type,
         "data": data
     }
     
     # Prepend to list (newest first)
-    history.insert(0, entry)
-    
-    with open(history_file, "w", encoding="utf-8") as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
+    with metrics.span("history_write"):
+        update_json(history_file, lambda history: history.insert(0, entry), [])
+    return entry["id"]
 
-def extract_frames_from_video(video_source: str | bytes, num_frames: int = 10) -> tuple[list[str], float]:
+def sample_frames(
+    video_source: str | bytes,
+    num_frames: int = 10,
+    start_sec: float | None = None,
+    end_sec: float | None = None,
+    on_frame: Callable[[np.ndarray, int, float], None] | None = None
+) -> tuple[list[np.ndarray], list[float], float]:
     """
-    Extracts evenly spaced frames from video (bytes or file path) and returns them as base64 strings.
+    Decodes evenly spaced frames from video (bytes or file path), optionally only from
+    the [start_sec, end_sec) window.
+    With `on_frame`, the window is decoded sequentially and every frame is passed to
+    on_frame(frame, index, fps) (e.g. to write a proxy video) in the same pass.
+    Returns (frames as BGR arrays, their timestamps in seconds, video duration in seconds).
     """
+    import cv2
+
     temp_video_path = None
     
     if isinstance(video_source, bytes):
@@ -66,7 +75,8 @@ def extract_frames_from_video(video_source: str | bytes, num_frames: int = 10) -
     else:
         temp_video_path = video_source
 
-    frames_base64 = []
+    frames = []
+    timestamps = []
     duration = 0.0
     try:
         cap = cv2.VideoCapture(temp_video_path)
@@ -85,20 +95,32 @@ def extract_frames_from_video(video_source: str | bytes, num_frames: int = 10) -
              pass
 
         if total_frames > 0:
-            step = max(1, total_frames // num_frames)
+            first = int(start_sec * fps) if start_sec and fps > 0 else 0
+            last = min(total_frames, int(end_sec * fps)) if end_sec and fps > 0 else total_frames
+            step = max(1, (last - first) // num_frames)
             
-            for i in range(0, total_frames, step):
-                if len(frames_base64) >= num_frames:
-                    break
-                    
-                cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-                ret, frame = cap.read()
-                if ret:
-                    # Resize to reduce payload size (optional, but good for speed)
-                    frame = cv2.resize(frame, (640, 360)) 
-                    _, buffer = cv2.imencode('.jpg', frame)
-                    b64_str = base64.b64encode(buffer).decode('utf-8')
-                    frames_base64.append(b64_str)
+            if on_frame is None:
+                for i in range(first, last, step):
+                    if len(frames) >= num_frames:
+                        break
+                        
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, i)
+                    ret, frame = cap.read()
+                    if ret:
+                        frames.append(frame)
+                        timestamps.append(i / fps if fps > 0 else 0.0)
+            else:
+                wanted = set(list(range(first, last, step))[:num_frames])
+                if first > 0:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+                for i in range(first, last):
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    on_frame(frame, i, fps)
+                    if i in wanted:
+                        frames.append(frame)
+                        timestamps.append(i / fps if fps > 0 else 0.0)
         
         cap.release()
     except Exception as e:
@@ -108,119 +130,317 @@ def extract_frames_from_video(video_source: str | bytes, num_frames: int = 10) -
         if isinstance(video_source, bytes) and temp_video_path and os.path.exists(temp_video_path):
             os.remove(temp_video_path)
             
-    return frames_base64, duration
+    return frames, timestamps, duration
+
+def _pick_evenly(items: list, count: int) -> list:
+    import numpy as np
+
+    if count <= 0 or len(items) <= count:
+        return list(items)
+    indices = np.linspace(0, len(items) - 1, count).round().astype(int)
+    return [items[i] for i in indices]
+
+def prepare_video_frames(
+    video_source: str | bytes,
+    num_frames: int = 10,
+    start_sec: float | None = None,
+    end_sec: float | None = None,
+    proxy_key: str | None = None
+) -> dict:
+    """
+    Decodes, crops and encodes the frames sent to the vision model.
+    With a pose model configured, more frames are decoded for local pose estimation
+    and fewer (VIDEO_FRAMES_WITH_POSE) are sent, since the model also gets the numeric motion summary.
+    With FRAME_DEDUP, extra frames are decoded and near-duplicates (by dHash) dropped,
+    so the frame budget goes to distinct moments.
+    With `proxy_key` (a media hash), a low-res proxy MP4 is written during the same decode.
+    Returns {"encoded": encode_frames result, "duration", "timestamps", "hashes", "motion",
+    "preview_frames" (the sent frames, uncropped), "proxy" (proxy URL or None)}.
+    """
+    from app.services import pose
+    from app.services.frame_encoding import encode_frames
+    from app.services.frame_hash import dhash, dedupe_frames
+    from app.services.player_roi import detect_player_regions
+    from app.services.previews import ProxyWriter
+
+    use_pose = pose.is_available()
+    sample_count = max(num_frames, settings.POSE_SAMPLE_FRAMES) if use_pose else num_frames
+    if settings.FRAME_DEDUP:
+        sample_count *= max(1, settings.FRAME_DEDUP_OVERSAMPLE)
+
+    proxy = ProxyWriter(proxy_key) if proxy_key else None
+    # Decodes hold a global "decode" slot (bounded wait, then AdmissionRejected)
+    with admission.slot("decode"), metrics.span("decode"):
+        frames, timestamps, duration = sample_frames(
+            video_source, sample_count, start_sec, end_sec, on_frame=proxy.write if proxy else None
+        )
+    proxy_url = proxy.close() if proxy else None
+
+    crops = [None] * len(frames)
+    if settings.FRAME_CROP_PLAYER and frames:
+        with metrics.span("player_roi"):
+            crops = detect_player_regions(frames, padding=settings.FRAME_ROI_PADDING, method=settings.FRAME_ROI_METHOD)
+
+    # Hash the player region: on a wide court shot the player is too small to move a full-frame hash
+    with metrics.span("frame_hash"):
+        hashes = [dhash(f, box) for f, box in zip(frames, crops)]
+    if settings.FRAME_DEDUP and len(frames) > 1:
+        keep = dedupe_frames(hashes, settings.FRAME_HASH_THRESHOLD, settings.FRAME_DEDUP_MIN_FRAMES)
+        if len(keep) < len(frames):
+            logger.info(f"Frame dedup: kept {len(keep)}/{len(frames)} distinct frames")
+        frames, timestamps, crops, hashes = ([items[i] for i in keep] for items in (frames, timestamps, crops, hashes))
+
+    motion = None
+    if use_pose:
+        with metrics.span("pose"):
+            motion = pose.analyze_motion(frames, timestamps, crops, hashes)
+    send_count = settings.VIDEO_FRAMES_WITH_POSE if motion else num_frames
 
-async def analyze_video(video_source: str | bytes, mime_type: str = "video/mp4", coach: str = "hu", severity: int = 5, style: str = "conservative"):
+    selected = _pick_evenly(list(zip(frames, timestamps, crops, hashes)), send_count)
+    # Resize, JPEG/WebP encode and base64
+    with metrics.span("frame_encode"):
+        encoded = encode_frames([s[0] for s in selected], crops=[s[2] for s in selected])
+    return {
+        "encoded": encoded,
+        "duration": duration,
+        "timestamps": [s[1] for s in selected],
+        "hashes": [s[3] for s in selected],
+        "motion": motion,
+        "preview_frames": [s[0] for s in selected],
+        "proxy": proxy_url
+    }
+
+def extract_frames_from_video(video_source: str | bytes, num_frames: int = 10) -> tuple[dict, float]:
+    """
+    Extracts evenly spaced frames from video (bytes or file path) and encodes them for the model.
+    Returns (encode_frames result with base64 frames and payload stats, duration).
+    """
+    prepared = prepare_video_frames(video_source, num_frames)
+    return prepared["encoded"], prepared["duration"]
+
+def probe_duration(video_path: str) -> float:
+    """Reads the video duration in seconds from the container header (no decoding)."""
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        return total_frames / fps if fps > 0 and total_frames > 0 else 0.0
+    finally:
+        cap.release()
+
+def format_duration(seconds: float) -> str:
+    return f"{int(seconds // 60)}:{int(seconds % 60):02d}"
+
+def _structured_call(
+    model: str,
+    messages: list,
+    kind: str,
+    timeout: float | None = None,
+    on_section: Callable[[str, Any], None] | None = None
+) -> dict:
+    """
+    One report request ("video" or "style") to `model` (blocking): JSON output mode where the
+    model supports it, the response streamed through the repairing parser (QWEN_STREAM_ANALYSIS)
+    and validated against the report schema.
+    Returns {"text", "result": validated report} or {"text", "error"}.
+    """
+    stream = settings.QWEN_STREAM_ANALYSIS
+    on_member = None
+    if on_section is not None and stream:
+        on_member = lambda key, value: on_section(key, analysis_schema.validate_section(kind, key, value))
+
+    stream_kwargs = {"stream": True, "stream_options": {"include_usage": True}} if stream else {}
+    # The response is read inside the call, so a stream cut off midway is retried like a failed request
+    parsed = structured_output.with_response_format(
+        model,
+        lambda response_format: model_client.chat_completion(
+            model, messages, timeout=timeout,
+            read=lambda completion: structured_output.read_json(completion, stream, on_member),
+            **stream_kwargs, **response_format
+        ),
+        schema=analysis_schema.json_schema(kind)
+    )
+    if "error" in parsed:
+        return parsed
+    try:
+        return {"text": parsed["text"], "result": analysis_schema.validate_report(kind, parsed["value"])}
+    except ValueError as e:
+        return {"text": parsed["text"], "error": str(e)}
+
+def call_video_model(encoded: dict, prompt: str, on_section: Callable[[str, Any], None] | None = None) -> dict:
+    """
+    Sends encoded frames and the prompt to the video model picked by the model router (blocking).
+    With `on_section`, each top-level report section is passed to on_section(key, value) as soon as
+    it has streamed in (after a retry or a fallback to another model, sections may arrive again).
+    Returns {"result": validated report, "model_meta": routing choice} or {"error": message, "raw": response text}.
+    """
+    # Build message content
+    content_parts = []
+    for b64_frame in encoded["frames"]:
+        content_parts.append({
+            "type": "image_url",
+            "image_url": {"url": f"data:{encoded['mime_type']};base64,{b64_frame}"}
+        })
+    
+    content_parts.append({"type": "text", "text": prompt})
+    messages = [{"role": "user", "content": content_parts}]
+
+    try:
+        with metrics.span("model_call", task="video"):
+            response, model_meta = model_router.route_call(
+                "video",
+                lambda model: _structured_call(model, messages, "video", settings.QWEN_VIDEO_TIMEOUT_SECONDS, on_section),
+                input_size=len(encoded["frames"])
+            )
+    except Exception as api_err:
+        logger.error(f"OpenAI API Error: {str(api_err)}")
+        return {**model_client.error_result(api_err), "raw": ""}
+
+    if "error" in response:
+        logger.error(f"JSON Parse Error ({response['error']}). Raw response: {response['text']}")
+        return {"error": "Parsing failed", "raw": response["text"], "model_meta": model_meta}
+    return {"result": response["result"], "model_meta": model_meta}
+
+async def analyze_video(
+    video_source: str | bytes,
+    mime_type: str = "video/mp4",
+    coach: str = "hu",
+    severity: int = 5,
+    style: str = "conservative",
+    long_mode: bool | None = None,
+    media_sha: str | None = None,
+    on_section: Callable[[str, Any], None] | None = None
+):
     """
     Analyzes video content using Qwen-Omni-Turbo (via frames).
     Accepts either bytes or file path string.
+    Videos longer than LONG_VIDEO_THRESHOLD_SECONDS (or with long_mode=True) are analyzed
+    segment by segment and reduced into one report (see long_video.analyze_long_video).
+    For stored media (`media_sha`), preview assets are built from the decoded frames and
+    returned as "previews".
+    `on_section(key, value)` (called from a worker thread) receives report sections while the
+    model response streams in; long videos only produce the final result.
     """
+    from app.services import pose
+    from app.services.frame_encoding import payload_stats
+    from app.services.previews import build_previews
+
     if not settings.QWEN_API_KEY:
         return {"error": "Qwen API Key is not configured."}
 
+    temp_video_path = None
     try:
-        # Extract frames and duration
-        frames, duration = extract_frames_from_video(video_source)
-        if not frames:
+        if isinstance(video_source, bytes):
+            # Decode from one temp file for all passes (probe, frames, segments)
+            with metrics.span("temp_write"), tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_video:
+                temp_video.write(video_source)
+                temp_video_path = temp_video.name
+            video_source = temp_video_path
+
+        if long_mode is not False:
+            total_duration = probe_duration(video_source)
+            if long_mode or total_duration > settings.LONG_VIDEO_THRESHOLD_SECONDS:
+                from app.services.long_video import analyze_long_video
+                return await analyze_long_video(video_source, total_duration, severity, style, media_sha=media_sha)
+
+        # Extract frames and duration (plus the proxy video, in the same decode)
+        with_previews = bool(media_sha) and settings.PREVIEW_ENABLED
+        prepared = await asyncio.to_thread(
+            prepare_video_frames, video_source, proxy_key=media_sha if with_previews and settings.PREVIEW_PROXY else None
+        )
+        encoded, duration, motion = prepared["encoded"], prepared["duration"], prepared["motion"]
+        if not encoded["frames"]:
             return {"error": "Could not extract frames from video."}
 
+        stats = payload_stats(encoded)
+        logger.info(
+            f"Frame payload for the video model: {stats['frame_count']} x {stats['width']}x{stats['height']} "
+            f"{stats['mime_type']} q{stats['quality']}, {stats['payload_bytes'] / 1024:.0f} KB, ~{stats['estimated_tokens']} tokens"
+        )
+
         # Format duration for display
-        minutes = int(duration // 60)
-        seconds = int(duration % 60)
-        duration_str = f"{minutes}:{seconds:02d}" if duration > 0 else "Unknown"
+        duration_str = format_duration(duration) if duration > 0 else "Unknown"
         
         # Inject duration into prompt
-        prompt = get_video_analysis_prompt(strictness=severity, style=style)
+        prompt = get_video_analysis_prompt(strictness=severity, style=style, motion_summary=pose.format_motion_summary(motion))
         prompt = f"Video Duration: {duration:.2f} seconds.\n" + prompt
 
-        logger.info(f"Starting comprehensive video analysis (Duration: {duration_str}, Severity: {severity}, Style: {style}) with Qwen-Omni...")
+        logger.info(f"Starting comprehensive video analysis (Duration: {duration_str}, Severity: {severity}, Style: {style})...")
 
-        # Build message content
-        content_parts = []
-        for b64_frame in frames:
-            content_parts.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{b64_frame}"}
-            })
-        
-        content_parts.append({"type": "text", "text": prompt})
+        response = await asyncio.to_thread(call_video_model, encoded, prompt, on_section)
+        if "error" in response:
+            if response["error"] == "Parsing failed":
+                return {"analysis": {"error": "Parsing failed", "raw": response["raw"]}, "error": "Parsing failed"}
+            return {k: v for k, v in response.items() if k != "raw"}
 
-        client = get_client()
-        try:
-            completion = client.chat.completions.create(
-                model="qwen-omni-turbo",
-                messages=[{"role": "user", "content": content_parts}],
-                stream=False
-            )
-        except Exception as api_err:
-            logger.error(f"OpenAI API Error: {str(api_err)}")
-            return {"error": f"API Call Failed: {str(api_err)}"}
-        
-        text_response = completion.choices[0].message.content.strip()
+        result_json = response["result"]
         
-        # Clean up markdown code blocks
-        if text_response.startswith("```"):
-             lines = text_response.split("\n")
-             if len(lines) > 1:
-                 text_response = "\n".join(lines[1:-1])
-        
-        try:
-            result_json = json.loads(text_response)
-            
-            # Inject metadata into result
-            if "analysis_report" not in result_json:
-                result_json["analysis_report"] = {}
-            result_json["analysis_report"]["video_duration"] = duration_str
-            result_json["analysis_report"]["video_info"] = f"Video ({duration_str})"
-
-            save_analysis_history(result_json, type="video")
-
-            # --- Auto-link to Documentation DISABLED (User requested manual control) ---
-            # try:
-            #     video_info_text = result_json.get("analysis_report", {}).get("video_info", "")
-            #     # Clean up "Video (0:31)" -> just try to find match in the whole string or parts
-            #     # Actually prompt output usually puts "High Clear" in video_info if it detects it.
-            #     # If prompt doesn't, we rely on top_issues tags maybe?
-            #     
-            #     from app.services.documentation import find_matching_doc, append_to_doc_detailed_desc
-            #     
-            #     # Try to find doc based on video_info or tags from issues
-            #     doc = find_matching_doc(video_info_text)
-            #     
-            #     if not doc:
-            #         # Try top issues tags
-            #         for issue in result_json.get("top_issues", []):
-            #             doc = find_matching_doc(issue.get("tag_name", ""))
-            #             if doc: break
-            #     
-            #     if doc:
-            #         # Extract advice to append
-            #         advice_text = ""
-            #         hu_advice = result_json.get("coach_advice", {}).get("coach_hu", "")
-            #         if hu_advice:
-            #             advice_text += f"**技术指导**: {hu_advice}\n"
-            #         
-            #         issues = result_json.get("top_issues", [])
-            #         if issues:
-            #             advice_text += "**常见问题**:\n" + "\n".join([f"- {issue['tag_name']}: {issue['description']}" for issue in issues])
-            #         
-            #         if advice_text:
-            #             append_to_doc_detailed_desc(doc["id"], f"### 视频分析案例 ({datetime.now().strftime('%Y-%m-%d')})\n{advice_text}")
-            #             logger.info(f"Auto-linked video analysis to Doc '{doc['title']}'")
-            # except Exception as doc_err:
-            #     logger.warning(f"Failed to auto-link to docs: {doc_err}")
-            # ----------------------------------
-
-            return {"analysis": result_json}
-        except json.JSONDecodeError:
-            logger.error(f"JSON Parse Error. Raw response: {text_response}")
-            return {"analysis": {"error": "Parsing failed", "raw": text_response}, "error": "Parsing failed"}
+        # Inject metadata into result
+        if "analysis_report" not in result_json:
+            result_json["analysis_report"] = {}
+        result_json["analysis_report"]["video_duration"] = duration_str
+        result_json["analysis_report"]["video_info"] = f"Video ({duration_str})"
+        if motion:
+            result_json["motion_summary"] = motion
+
+        await asyncio.to_thread(save_analysis_history, result_json, type="video")
+
+        # --- Auto-link to Documentation DISABLED (User requested manual control) ---
+        # try:
+        #     video_info_text = result_json.get("analysis_report", {}).get("video_info", "")
+        #     # Clean up "Video (0:31)" -> just try to find match in the whole string or parts
+        #     # Actually prompt output usually puts "High Clear" in video_info if it detects it.
+        #     # If prompt doesn't, we rely on top_issues tags maybe?
+        #     
+        #     from app.services.documentation import find_matching_doc, append_to_doc_detailed_desc
+        #     
+        #     # Try to find doc based on video_info or tags from issues
+        #     doc = find_matching_doc(video_info_text)
+        #     
+        #     if not doc:
+        #         # Try top issues tags
+        #         for issue in result_json.get("top_issues", []):
+        #             doc = find_matching_doc(issue.get("tag_name", ""))
+        #             if doc: break
+        #     
+        #     if doc:
+        #         # Extract advice to append
+        #         advice_text = ""
+        #         hu_advice = result_json.get("coach_advice", {}).get("coach_hu", "")
+        #         if hu_advice:
+        #             advice_text += f"**技术指导**: {hu_advice}\n"
+        #         
+        #         issues = result_json.get("top_issues", [])
+        #         if issues:
+        #             advice_text += "**常见问题**:\n" + "\n".join([f"- {issue['tag_name']}: {issue['description']}" for issue in issues])
+        #         
+        #         if advice_text:
+        #             append_to_doc_detailed_desc(doc["id"], f"### 视频分析案例 ({datetime.now().strftime('%Y-%m-%d')})\n{advice_text}")
+        #             logger.info(f"Auto-linked video analysis to Doc '{doc['title']}'")
+        # except Exception as doc_err:
+        #     logger.warning(f"Failed to auto-link to docs: {doc_err}")
+        # ----------------------------------
 
+        result = {"analysis": result_json, "payload": stats, "model_meta": response["model_meta"]}
+        if with_previews:
+            with metrics.span("previews"):
+                previews = build_previews(media_sha, prepared["preview_frames"], prepared["timestamps"], prepared["proxy"])
+            if previews:
+                result["previews"] = previews
+        return result
+
+    except admission.AdmissionRejected as e:
+        return e.to_result()
     except Exception as e:
         logger.error(f"Error during video analysis: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
         return {"error": f"Analysis failed: {str(e)}"}
+    finally:
+        if temp_video_path and os.path.exists(temp_video_path):
+            os.remove(temp_video_path)
 
 async def analyze_photo(photo_content: bytes, mime_type: str = "image/jpeg"):
     """
@@ -233,40 +453,38 @@ async def analyze_photo(photo_content: bytes, mime_type: str = "image/jpeg"):
         prompt = get_style_analysis_prompt()
         logger.info("Starting 6-Dimension OOTD analysis with Qwen-VL-Plus...")
 
-        b64_image = base64.b64encode(photo_content).decode('utf-8')
+        with metrics.span("base64_encode"):
+            b64_image = base64.b64encode(photo_content).decode('utf-8')
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{b64_image}"}},
+                    {"type": "text", "text": prompt}
+                ]
+            }
+        ]
         
-        client = get_client()
         try:
-            completion = client.chat.completions.create(
-                model="qwen-vl-plus", # Using qwen-vl-plus as standard for image analysis
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{b64_image}"}},
-                            {"type": "text", "text": prompt}
-                        ]
-                    }
-                ]
-            )
+            with metrics.span("model_call", task="style"):
+                response, model_meta = await asyncio.to_thread(
+                    model_router.route_call,
+                    "style", # qwen-vl-plus by default (MODEL_STYLE_TIERS)
+                    lambda model: _structured_call(model, messages, "style"),
+                    len(photo_content)
+                )
         except Exception as api_err:
             logger.error(f"OpenAI API Error (Style): {str(api_err)}")
-            return {"error": f"API Call Failed: {str(api_err)}"}
-        
-        text_response = completion.choices[0].message.content.strip()
-        
-        if text_response.startswith("```"):
-             lines = text_response.split("\n")
-             if len(lines) > 1:
-                 text_response = "\n".join(lines[1:-1])
-             
-        try:
-            result_json = json.loads(text_response)
-            save_analysis_history(result_json, type="style")
-            return result_json
-        except json.JSONDecodeError:
-            logger.error(f"JSON Parse Error (Style). Raw response: {text_response}")
-            return {"error": "Parsing failed", "raw_response": text_response}
+            return model_client.error_result(api_err)
+
+        if "error" in response:
+            logger.error(f"JSON Parse Error (Style, {response['error']}). Raw response: {response['text']}")
+            return {"error": "Parsing failed", "raw_response": response["text"]}
+
+        result_json = response["result"]
+        result_json["model_meta"] = model_meta
+        await asyncio.to_thread(save_analysis_history, result_json, type="style")
+        return result_json
 
     except Exception as e:
         logger.error(f"Error during photo analysis: {str(e)}")
@@ -282,12 +500,8 @@ def get_embedding(text: str) -> list[float]:
         return []
     
     try:
-        client = get_client()
-        response = client.embeddings.create(
-            model="text-embedding-v3",
-            input=text
-        )
-        return response.data[0].embedding
+        embedding, _ = model_router.route_call("embedding", lambda model: model_client.embedding(model, text))
+        return embedding
     except Exception as e:
         logger.error(f"Error getting embedding: {e}")
         return []
@@ -322,7 +536,8 @@ async def chat_with_coach(message: str, context: dict = None):
         # -------------------------------------
 
         # 1. RAG Search
-        rag_results = search_knowledge(message, top_k=2)
+        with metrics.span("rag_search"):
+            rag_results = await asyncio.to_thread(search_knowledge, message, top_k=2)
         rag_context = ""
         if rag_results:
              rag_context = "【知识库参考资料】:\n" + "\n".join([f"- {item['content']}" for item in rag_results]) + "\n"
@@ -342,18 +557,23 @@ async def chat_with_coach(message: str, context: dict = None):
         if not settings.QWEN_API_KEY:
             logger.error("QWEN_API_KEY missing in settings!")
 
-        client = get_client()
         try:
-            completion = client.chat.completions.create(
-                model="qwen-flash-character", 
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": message}
-                ]
-            )
+            # Hedged: a second request goes out if the first is slower than the recent p95
+            # Short turns go to the fastest tier (MODEL_CHAT_TIERS)
+            with metrics.span("model_call", task="chat"):
+                completion, model_meta = await asyncio.to_thread(
+                    model_router.chat_completion,
+                    "chat",
+                    [
+                        {"role": "system", "content": prompt},
+                        {"role": "user", "content": message}
+                    ],
+                    input_size=len(message),
+                    hedge=settings.QWEN_HEDGE_CHAT
+                )
         except Exception as api_err:
             logger.error(f"OpenAI API Error (Chat): {str(api_err)}")
-            return {"error": f"API Call Failed: {str(api_err)}"}
+            return model_client.error_result(api_err)
         
         response_content = completion.choices[0].message.content
         
@@ -407,7 +627,7 @@ async def chat_with_coach(message: str, context: dict = None):
         except Exception as extract_err:
             logger.warning(f"Failed to extract knowledge: {extract_err}")
 
-        return {"response": response_content}
+        return {"response": response_content, "model_meta": model_meta}
 
     except Exception as e:
         logger.error(f"Error during chat: {str(e)}")
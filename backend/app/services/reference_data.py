@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from app.core.config import get_settings, get_data_dir
+from app.core.json_codec import dumps, etag_for
+from app.core.snapshot import snapshot_file
+from app.core.storage import load_json
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+_SOURCE_DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+
+
+class ReferenceFile:
+    """
+    A read-mostly JSON file held in memory, both parsed and pre-serialized (bytes + ETag).
+
+    The file is (re)loaded when its (mtime, size) changes. While the watcher thread runs,
+    requests never touch the disk; without it (scripts, serverless) a request re-stats the
+    file at most once per REFDATA_POLL_SECONDS. Writers call invalidate() after saving.
+    Callers must treat the returned data as read-only.
+    """
+
+    def __init__(self, name: str, paths_fn: Callable[[], List[str]], default: Any):
+        self.name = name
+        self._paths_fn = paths_fn
+        self._default = default
+        self._lock = threading.Lock()
+        self._sig: Optional[Tuple[str, int, int]] = None
+        self._data: Any = None
+        self._body: bytes = b""
+        self._etag: str = ""
+        self._loaded = False
+        self._checked_at = 0.0
+
+    def _stat(self) -> Optional[Tuple[str, int, int]]:
+        for path in self._paths_fn():
+            try:
+                st = os.stat(path)
+                return (path, st.st_mtime_ns, st.st_size)
+            except OSError:
+                continue
+        return None
+
+    def refresh(self) -> bool:
+        """Reloads the file if it changed since the last load. Returns True when it was reloaded."""
+        sig = self._stat()
+        self._checked_at = time.monotonic()
+        if self._loaded and sig == self._sig:
+            return False
+        data = load_json(sig[0], self._default) if sig else self._default
+        body = dumps(data)
+        with self._lock:
+            self._data, self._body, self._etag = data, body, etag_for(body)
+            self._sig, self._loaded = sig, True
+        logger.info(f"Reference data '{self.name}' loaded ({len(body)} bytes)")
+        return True
+
+    def _ensure_fresh(self):
+        if not self._loaded or (not watcher_running() and time.monotonic() - self._checked_at >= settings.REFDATA_POLL_SECONDS):
+            self.refresh()
+
+    def get(self) -> Any:
+        self._ensure_fresh()
+        return self._data
+
+    def body(self) -> Tuple[bytes, str]:
+        """Pre-serialized JSON and its ETag."""
+        self._ensure_fresh()
+        with self._lock:
+            return self._body, self._etag
+
+    def invalidate(self):
+        """Reloads right away (called after writes made by this process)."""
+        self._sig = None
+        self.refresh()
+
+
+def _with_snapshot(paths: List[str], name: str) -> List[str]:
+    # The build-time snapshot is the last resort (fresh serverless data dir)
+    snapshot = snapshot_file(name)
+    return paths + [snapshot] if snapshot else paths
+
+
+def _documentation_paths() -> List[str]:
+    return _with_snapshot([os.path.join(get_data_dir(), "documentation.json")], "documentation.json")
+
+
+def _technical_guides_paths() -> List[str]:
+    # The source tree copy is read-only and wins; the data dir copy is a fallback
+    return _with_snapshot([
+        os.path.join(_SOURCE_DATA_DIR, "technical_guides.json"),
+        os.path.join(get_data_dir(), "technical_guides.json"),
+    ], "technical_guides.json")
+
+
+documentation = ReferenceFile("documentation", _documentation_paths, [])
+technical_guides = ReferenceFile("technical_guides", _technical_guides_paths, [])
+
+_ALL = (documentation, technical_guides)
+
+
+# --- Watcher ---
+
+_watcher: Optional[threading.Thread] = None
+_watcher_stop = threading.Event()
+
+
+def watcher_running() -> bool:
+    return _watcher is not None and _watcher.is_alive()
+
+
+def _watch_loop():
+    while not _watcher_stop.wait(settings.REFDATA_POLL_SECONDS):
+        for ref in _ALL:
+            try:
+                ref.refresh()
+            except Exception as e:
+                logger.error(f"Reloading reference data '{ref.name}' failed: {e}")
+
+
+def start_reference_watcher():
+    """Loads all reference data and starts the stat-poll watcher (called from the app lifespan)."""
+    global _watcher
+    for ref in _ALL:
+        ref.refresh()
+    if watcher_running():
+        return
+    _watcher_stop.clear()
+    _watcher = threading.Thread(target=_watch_loop, name="refdata-watcher", daemon=True)
+    _watcher.start()
+
+
+def stop_reference_watcher():
+    global _watcher
+    _watcher_stop.set()
+    if _watcher is not None:
+        _watcher.join(timeout=5)
+        _watcher = None
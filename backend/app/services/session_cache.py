@@ -0,0 +1,209 @@
+import copy
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from app.core.storage import load_json, update_json
+
+logger = logging.getLogger(__name__)
+
+
+def _merge_session(on_disk: dict, ours: dict) -> dict:
+    """
+    Our version of a session, plus the messages only the file has (appended by another worker
+    since we loaded it), in timestamp order. Other fields are last writer wins.
+    """
+    known = {m.get("id") for m in ours.get("messages", [])}
+    extra = [m for m in on_disk.get("messages", []) if m.get("id") not in known]
+    if not extra:
+        return ours
+    merged = dict(ours)
+    merged["messages"] = sorted(ours.get("messages", []) + extra, key=lambda m: m.get("timestamp", ""))
+    merged["updated_at"] = max(ours.get("updated_at", ""), on_disk.get("updated_at", ""))
+    return merged
+
+
+class SessionCache:
+    """
+    Write-behind cache for the session store.
+
+    Sessions are held in memory and reads never touch the disk (apart from a stat() to notice
+    writes made by other workers). Writes mark sessions dirty; a background thread merges the
+    dirty sessions into the JSON file every `flush_interval` seconds, or as soon as `max_dirty`
+    sessions are pending. While the flusher is not running every write is flushed immediately,
+    so scripts and serverless containers keep write-through behaviour.
+    """
+
+    def __init__(self, path_fn: Callable[[], str], flush_interval: float = 2.0, max_dirty: int = 20):
+        self._path_fn = path_fn
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._sessions: Dict[str, dict] = {}
+        self._dirty: Set[str] = set()
+        self._deleted: Set[str] = set()
+        self._loaded = False
+        self._file_sig: Optional[Tuple[int, int]] = None
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Loading ---
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self._path_fn())
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _sync_from_disk(self):
+        """(Re)loads the file if it changed since we last saw it. Dirty sessions win over disk."""
+        sig = self._stat()
+        if self._loaded and sig == self._file_sig:
+            return
+
+        on_disk = load_json(self._path_fn(), [])
+        disk_ids = set()
+        for s in on_disk:
+            disk_ids.add(s["id"])
+            if s["id"] not in self._dirty and s["id"] not in self._deleted:
+                self._sessions[s["id"]] = s
+        if self._loaded:
+            # Sessions removed by another worker
+            for session_id in list(self._sessions):
+                if session_id not in disk_ids and session_id not in self._dirty:
+                    del self._sessions[session_id]
+
+        self._loaded = True
+        self._file_sig = sig
+
+    # --- Reads ---
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            self._sync_from_disk()
+            return self._sessions.get(session_id)
+
+    def all(self) -> List[dict]:
+        with self._lock:
+            self._sync_from_disk()
+            # Newest first, same order as the file
+            return sorted(self._sessions.values(), key=lambda s: s.get("created_at", ""), reverse=True)
+
+    # --- Writes ---
+
+    def insert(self, session: dict):
+        with self._lock:
+            self._sync_from_disk()
+            self._sessions[session["id"]] = session
+            self._deleted.discard(session["id"])
+            self._dirty.add(session["id"])
+        self._after_write()
+
+    def update(self, session_id: str, mutate: Callable[[dict], object]):
+        """Applies `mutate` to a cached session under the cache lock. Returns None if not found."""
+        with self._lock:
+            self._sync_from_disk()
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            result = mutate(session)
+            self._dirty.add(session_id)
+        self._after_write()
+        return result
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            self._sync_from_disk()
+            if self._sessions.pop(session_id, None) is None:
+                return False
+            self._dirty.discard(session_id)
+            self._deleted.add(session_id)
+        self._after_write()
+        return True
+
+    def _after_write(self):
+        if not self.is_running():
+            self.flush()
+        elif len(self._dirty) + len(self._deleted) >= self.max_dirty:
+            self._wake.set()
+
+    # --- Flushing ---
+
+    def flush(self):
+        """
+        Merges dirty and deleted sessions into the session file. Messages another worker appended
+        to the same session meanwhile are kept (see _merge_session).
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty and not self._deleted:
+                    return
+                dirty = {sid: copy.deepcopy(self._sessions[sid]) for sid in self._dirty if sid in self._sessions}
+                deleted = set(self._deleted)
+                self._dirty.clear()
+                self._deleted.clear()
+            merged: Dict[str, dict] = {}
+            sigs: Dict[str, Optional[Tuple[int, int]]] = {}
+
+            def merge(sessions):
+                sigs["before"] = self._stat()  # under the store lock, as is the "after" stat
+                pending = dict(dirty)  # update_json may run this again; keep `dirty` intact
+                merged.clear()
+                sessions[:] = [s for s in sessions if s["id"] not in deleted]
+                for i, s in enumerate(sessions):
+                    if s["id"] in pending:
+                        sessions[i] = merged[s["id"]] = _merge_session(s, pending.pop(s["id"]))
+                # New sessions go to the front (newest first)
+                sessions[:0] = sorted(pending.values(), key=lambda s: s.get("created_at", ""), reverse=True)
+
+            def written():
+                sigs["after"] = self._stat()
+
+            try:
+                update_json(self._path_fn(), merge, [], on_commit=written)
+            except Exception:
+                logger.exception("Failed to flush session cache; will retry")
+                with self._lock:
+                    self._dirty.update(sid for sid in dirty if sid in self._sessions)
+                    self._deleted.update(deleted)
+                return
+
+            with self._lock:
+                # Pick up what the merge added, unless the session changed again since
+                for sid, session in merged.items():
+                    if sid in self._sessions and sid not in self._dirty:
+                        self._sessions[sid] = session
+                # Our own write must not trigger a reload, unless another worker wrote before it
+                if "after" in sigs and sigs["before"] == self._file_sig:
+                    self._file_sig = sigs["after"]
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="session-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background flusher and writes out everything still pending."""
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
@@ -0,0 +1,406 @@
+"""
+Structured (JSON) output of the analysis calls.
+
+Models asked for "pure JSON" still wrap it in markdown fences, add a sentence before or after,
+leave trailing commas or get cut off at the token limit. TolerantJSONParser reads the response
+incrementally (as stream deltas arrive) and repairs those defects instead of failing the whole
+call; top-level members are reported as soon as they are complete, so a streaming endpoint can
+forward report sections before the response ends.
+
+Where the provider supports it, calls also ask for JSON mode (QWEN_JSON_MODE_MODELS) or the
+report's JSON schema (QWEN_JSON_SCHEMA_MODELS).
+"""
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core import metrics, tracing
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+_CLOSERS = {"{": "}", "[": "]"}
+_LITERALS = {"true": "true", "false": "false", "null": "null", "none": "null", "undefined": "null", "nan": "null"}
+
+
+class TolerantJSONParser:
+    """
+    Incremental, repairing JSON parser. feed() text as it arrives, then finish() for the value.
+
+    Skips anything before the root value (prose, ``` / ```json / ~~~ fences) and after it closes.
+    An array holding no object, such as "[1]" or "[JSON]" in the prose, does not count as the root:
+    the scan goes on, and it is the value only when nothing else follows. Repairs trailing or missing commas, // and /* */ comments, single-quoted
+    strings and unquoted keys, Python literals (True/None), raw newlines in strings, mismatched
+    closing brackets and truncation (open strings and containers are closed, a dangling key
+    gets null). `repaired` tells whether any of that was needed.
+    """
+
+    def __init__(self, on_member: Optional[Callable[[str, Any], None]] = None):
+        self.on_member = on_member
+        self.repaired = False
+        self.done = False
+        self._out: List[str] = []
+        # Open containers: [bracket, expecting] with expecting one of key/colon/value/comma
+        self._stack: List[List[str]] = []
+        self._quote: Optional[str] = None
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._word: List[str] = []
+        self._comment: Optional[str] = None
+        self._slash = False
+        self._star = False
+        self._member_key: Optional[str] = None
+        self._member_start: Optional[int] = None
+        self._has_object = False
+        self._skipped: Optional[str] = None  # the last object-less root array
+
+    # --- Feeding ---
+
+    def feed(self, text: str):
+        for char in text:
+            if self.done:
+                return
+            self._char(char)
+
+    def _char(self, c: str):
+        if self._quote is not None:
+            self._string_char(c)
+        elif self._comment is not None:
+            if self._comment == "line":
+                if c == "\n":
+                    self._comment = None
+            else:
+                if self._star and c == "/":
+                    self._comment = None
+                self._star = c == "*"
+        elif self._slash:
+            self._slash = False
+            if c in "/*":
+                self._comment = "line" if c == "/" else "block"
+                self._star = False
+                self.repaired = True
+            else:
+                self._char(c)
+        elif not self._stack:
+            if c in _CLOSERS:
+                self._open(c)
+            elif not c.isspace():
+                self.repaired = True  # prose or a fence before the JSON
+        elif c.isalnum() or c in "+-._":
+            self._word.append(c)
+        else:
+            self._flush_word()
+            self._structural(c)
+
+    def _string_char(self, c: str):
+        if self._escape:
+            self._escape = False
+            if c == "'":  # \' is not a JSON escape
+                self._out[-1] = "'"
+            else:
+                self._out.append(c)
+        elif c == "\\":
+            self._escape = True
+            self._out.append(c)
+        elif c == self._quote:
+            self._out.append('"')
+            self._quote = None
+            self._end_string()
+        elif c == '"':
+            self._out.append('\\"')
+        elif c < " ":
+            self._out.append({"\n": "\\n", "\r": "\\r", "\t": "\\t"}.get(c, ""))
+        else:
+            self._out.append(c)
+
+    def _structural(self, c: str):
+        top = self._stack[-1]
+        if c in " \t\r\n":
+            return
+        if c in "\"'":
+            if c == "'":
+                self.repaired = True
+            self._string_is_key = top[0] == "{" and top[1] in ("key", "comma")
+            if self._string_is_key:
+                self._before_key()
+            else:
+                self._before_value()
+            self._quote = c
+            self._string_start = len(self._out)
+            self._out.append('"')
+        elif c in _CLOSERS:
+            self._before_value()
+            self._open(c)
+        elif c in "}]":
+            if _CLOSERS[top[0]] != c:
+                self.repaired = True
+            self._close()
+        elif c == ":":
+            if top[0] == "{" and top[1] == "colon":
+                self._out.append(":")
+                top[1] = "value"
+            else:
+                self.repaired = True
+        elif c == ",":
+            if top[1] == "comma":
+                self._out.append(",")
+                top[1] = "key" if top[0] == "{" else "value"
+            else:
+                self.repaired = True
+        elif c == "/":
+            self._slash = True
+        else:
+            self.repaired = True  # stray character outside strings
+
+    def _open(self, bracket: str):
+        self._stack.append([bracket, "key" if bracket == "{" else "value"])
+        self._out.append(bracket)
+        if bracket == "{":
+            self._has_object = True
+
+    def _before_key(self):
+        top = self._stack[-1]
+        if top[1] == "comma":  # missing comma between members
+            self._out.append(",")
+            self.repaired = True
+        top[1] = "key"
+
+    def _before_value(self):
+        top = self._stack[-1]
+        if top[0] == "{" and top[1] == "colon":  # missing colon
+            self._out.append(":")
+            self.repaired = True
+        elif top[0] == "{" and top[1] in ("key", "comma"):
+            # A value where a key belongs: keep it under a placeholder key
+            self._before_key()
+            self._out.append('"":')
+            self.repaired = True
+        elif top[1] == "comma":
+            self._out.append(",")
+            self.repaired = True
+        top[1] = "value"
+        if len(self._stack) == 1 and top[0] == "{":
+            self._member_start = len(self._out)
+
+    def _end_string(self):
+        if self._string_is_key:
+            self._stack[-1][1] = "colon"
+            if len(self._stack) == 1:
+                self._member_key = json.loads("".join(self._out[self._string_start:]), strict=False)
+        else:
+            self._end_value()
+
+    def _end_value(self):
+        if not self._stack:
+            return
+        self._stack[-1][1] = "comma"
+        if len(self._stack) == 1 and self._stack[0][0] == "{" and self._member_start is not None:
+            text = "".join(self._out[self._member_start:])
+            self._member_start = None
+            if self.on_member is not None:
+                try:
+                    value = json.loads(text, strict=False)
+                except ValueError:
+                    return
+                self.on_member(self._member_key or "", value)
+
+    def _flush_word(self, truncated: bool = False):
+        if not self._word:
+            return
+        word = "".join(self._word)
+        self._word = []
+        top = self._stack[-1]
+        if top[0] == "{" and top[1] in ("key", "comma"):  # unquoted key
+            self.repaired = True
+            self._string_is_key = True
+            self._before_key()
+            self._string_start = len(self._out)
+            self._out.append(json.dumps(word, ensure_ascii=False))
+            self._end_string()
+            return
+
+        literal = _LITERALS.get(word.lower())
+        if literal is None and truncated:
+            literal = next((v for k, v in _LITERALS.items() if k.startswith(word.lower())), None)
+        if literal is None:
+            number = word.rstrip(".eE+-") if truncated else word
+            literal = _number(number) if number else "null"
+        if literal is None:
+            literal = json.dumps(word, ensure_ascii=False)  # unquoted string
+        if literal != word:
+            self.repaired = True
+        self._before_value()
+        self._out.append(literal)
+        self._end_value()
+
+    def _close(self):
+        top = self._stack[-1]
+        if top[0] == "{" and top[1] == "colon":  # dangling key
+            self._out.append(":null")
+            top[1] = "comma"
+            self.repaired = True
+        elif top[0] == "{" and top[1] == "value":
+            self._out.append("null")
+            top[1] = "comma"
+            self.repaired = True
+        if self._out[-1] == ",":  # trailing comma
+            self._out.pop()
+            self.repaired = True
+        self._out.append(_CLOSERS[self._stack.pop()[0]])
+        if self._stack:
+            self._end_value()
+        elif self._out[0] == "[" and not self._has_object:
+            # Bracketed prose ("see [1]:"); keep looking for the report
+            self._skipped = "".join(self._out)
+            self._out = []
+        else:
+            self.done = True
+
+    # --- Results ---
+
+    def _close_truncated(self):
+        if self._quote is not None:
+            if self._escape:
+                self._out.pop()
+                self._escape = False
+            self._out.append('"')
+            self._quote = None
+            self.repaired = True
+            self._end_string()
+        if self._stack:
+            self._flush_word(truncated=True)
+        while self._stack:
+            self.repaired = True
+            self._close()
+
+    def finish(self) -> Any:
+        """The parsed value, closing whatever is still open. ValueError if there was no JSON."""
+        if not self._out and self._skipped is not None:
+            self._out = [self._skipped]
+        elif self._skipped is not None:
+            self.repaired = True
+        if not self._out:
+            raise ValueError("No JSON object in model response")
+        self._close_truncated()
+        try:
+            return json.loads("".join(self._out), strict=False)
+        except ValueError as e:
+            raise ValueError(f"Unrepairable JSON in model response: {e}") from e
+
+
+def _number(word: str) -> Optional[str]:
+    """JSON spelling of a numeric word (+1, .5, 1.), or None."""
+    try:
+        value = float(word)
+    except ValueError:
+        return None
+    if value != value or value in (float("inf"), float("-inf")):
+        return None
+    text = word.lstrip("+")
+    if text.startswith(".") or text.startswith("-."):
+        text = text.replace(".", "0.", 1)
+    if text.endswith("."):
+        text += "0"
+    try:
+        json.loads(text)
+    except ValueError:
+        return json.dumps(int(value) if value.is_integer() and "." not in word else value)
+    return text
+
+
+# --- Provider output modes ---
+
+# Models that rejected response_format (400) in this process; asked without it from then on
+_unsupported: set = set()
+_unsupported_lock = threading.Lock()
+
+
+def _models(value: str) -> List[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def response_format(model: str, schema: Optional[Dict] = None) -> Dict:
+    """
+    Request kwargs asking `model` for JSON: the schema for QWEN_JSON_SCHEMA_MODELS, JSON mode for
+    QWEN_JSON_MODE_MODELS, nothing otherwise (the prompt still asks for pure JSON).
+    """
+    if not settings.QWEN_JSON_MODE or model in _unsupported:
+        return {}
+    if schema is not None and model in _models(settings.QWEN_JSON_SCHEMA_MODELS):
+        return {"response_format": {"type": "json_schema", "json_schema": {"name": "report", "schema": schema}}}
+    if model in _models(settings.QWEN_JSON_MODE_MODELS):
+        return {"response_format": {"type": "json_object"}}
+    return {}
+
+
+def with_response_format(model: str, request: Callable[[Dict], Any], schema: Optional[Dict] = None) -> Any:
+    """
+    Runs `request(format_kwargs)` with the model's JSON output mode. If the provider rejects the
+    parameter (HTTP 400), the call is repeated once without it and the model is not asked again.
+    """
+    kwargs = response_format(model, schema)
+    try:
+        return request(kwargs)
+    except Exception as e:
+        if not kwargs or getattr(e, "status_code", None) != 400:
+            raise
+        logger.warning(f"{model} rejected structured output mode ({e}); retrying without it")
+        with _unsupported_lock:
+            _unsupported.add(model)
+        return request({})
+
+
+def read_json(completion: Any, stream: bool, on_member: Optional[Callable[[str, Any], None]] = None) -> Dict:
+    """
+    Reads a chat completion (a stream of deltas when `stream`) through TolerantJSONParser;
+    on_member(key, value) gets each top-level member as soon as it is complete.
+    Returns {"text": response text, "value": parsed value, "usage"}, or {"text", "error", "usage"}
+    when the text holds no usable JSON. Parser time is recorded as the json_parse stage (and, in
+    a trace, as a json_parse span from the first chunk to the end with its CPU time as attribute).
+    """
+    parser = TolerantJSONParser(on_member)
+    parse_seconds = 0.0
+    usage = None
+    first_ns = time.time_ns()
+    if stream:
+        parts = []
+        for chunk in completion:
+            usage = getattr(chunk, "usage", None) or usage  # last chunk with stream_options.include_usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if not parts:
+                first_ns = time.time_ns()
+            parts.append(delta)
+            start = time.perf_counter()
+            parser.feed(delta)
+            parse_seconds += time.perf_counter() - start
+        text = "".join(parts)
+    else:
+        text = completion.choices[0].message.content or ""
+        usage = getattr(completion, "usage", None)
+        start = time.perf_counter()
+        parser.feed(text)
+        parse_seconds += time.perf_counter() - start
+    start = time.perf_counter()
+    error = None
+    try:
+        value = parser.finish()
+    except ValueError as e:
+        error = e
+        return {"text": text.strip(), "error": str(e), "usage": usage}
+    finally:
+        parse_seconds += time.perf_counter() - start
+        outcome = "ok" if error is None else "error"
+        metrics.observe("stage_duration_seconds", parse_seconds, stage="json_parse", outcome=outcome)
+        tracing.record_span("json_parse", first_ns, time.time_ns(), {
+            "cpu_seconds": round(parse_seconds, 6), "repaired": parser.repaired, "response_chars": len(text)
+        }, error)
+    if parser.repaired:
+        logger.info("Repaired malformed JSON in model response")
+    return {"text": text.strip(), "value": value, "usage": usage}
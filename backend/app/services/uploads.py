@@ -0,0 +1,271 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.core.config import get_settings, get_data_dir
+from app.core.ids import new_id
+from app.core.storage import load_json, update_json
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+UPLOADS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "static", "uploads")
+# A chunk write still registered after this long is assumed dead (its worker crashed)
+_WRITE_LEASE_SECONDS = 600
+
+
+class UploadError(Exception):
+    """Client-visible upload protocol error; `status_code` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_uploads_file() -> str:
+    return os.path.join(get_data_dir(), "uploads.json")
+
+
+def _merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """Adds [start, end) to a sorted list of received byte ranges, merging overlaps."""
+    merged = []
+    for r_start, r_end in sorted(ranges + [[start, end]]):
+        if merged and r_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], r_end)
+        else:
+            merged.append([r_start, r_end])
+    return merged
+
+
+def _missing_ranges(upload: Dict) -> List[List[int]]:
+    missing, position = [], 0
+    for start, end in upload["received"]:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < upload["size"]:
+        missing.append([position, upload["size"]])
+    return missing
+
+
+def _status(upload: Dict) -> Dict:
+    received = sum(end - start for start, end in upload["received"])
+    return {
+        "upload_id": upload["id"],
+        "filename": upload["filename"],
+        "size": upload["size"],
+        "received_bytes": received,
+        "missing": _missing_ranges(upload),
+        "chunk_size": settings.UPLOAD_CHUNK_MAX_BYTES,
+        "status": upload["status"]
+    }
+
+
+def _prune_expired(uploads: List[Dict]):
+    """Drops unfinished uploads idle for longer than UPLOAD_EXPIRE_SECONDS, with their partial files."""
+    cutoff = time.time() - settings.UPLOAD_EXPIRE_SECONDS
+    kept = []
+    for upload in uploads:
+        if upload["status"] in ("uploading", "finalizing") and upload["updated_at"] < cutoff:
+            try:
+                os.remove(os.path.join(UPLOADS_DIR, upload["stored_name"]))
+            except OSError:
+                pass
+            logger.info(f"Expired upload {upload['id']} ({upload['filename']})")
+            continue
+        kept.append(upload)
+    uploads[:] = kept
+
+
+def create_upload(filename: str, size: int, content_type: Optional[str] = None, session_id: Optional[str] = None) -> Dict:
+    """
+    Starts a resumable upload: reserves the file under static/uploads at its full size, so chunks
+    are written in place at their offsets and finalize only renames it into the media store.
+    """
+    if size <= 0:
+        raise UploadError("Upload size must be positive.")
+    if size > settings.UPLOAD_MAX_BYTES:
+        raise UploadError(f"File too large (max {settings.UPLOAD_MAX_BYTES} bytes).", 413)
+
+    upload_id = new_id("UP_")
+    file_ext = os.path.splitext(filename.lower())[1]
+    stored_name = f"{upload_id}{file_ext}"
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    with open(os.path.join(UPLOADS_DIR, stored_name), "wb") as f:
+        f.truncate(size)
+
+    now = time.time()
+    upload = {
+        "id": upload_id,
+        "filename": filename,
+        "stored_name": stored_name,
+        "content_type": content_type,
+        "session_id": session_id,
+        "size": size,
+        "received": [],
+        "status": "uploading",
+        "created_at": datetime.now().isoformat(),
+        "updated_at": now
+    }
+
+    def mutate(uploads):
+        _prune_expired(uploads)
+        uploads.append(upload)
+
+    update_json(get_uploads_file(), mutate, [])
+    return _status(upload)
+
+
+def get_upload(upload_id: str) -> Dict:
+    for upload in load_json(get_uploads_file(), []):
+        if upload["id"] == upload_id:
+            return upload
+    raise UploadError("Upload not found.", 404)
+
+
+def get_upload_status(upload_id: str) -> Dict:
+    return _status(get_upload(upload_id))
+
+
+def get_upload_path(upload: Dict) -> str:
+    return os.path.join(UPLOADS_DIR, upload["stored_name"])
+
+
+def _active_writers(upload: Dict) -> Dict[str, float]:
+    cutoff = time.time() - _WRITE_LEASE_SECONDS
+    return {token: started for token, started in upload.get("writers", {}).items() if started >= cutoff}
+
+
+def _update_upload(upload_id: str, change) -> Dict:
+    """Applies change(upload) to the stored upload record under the store lock; returns the record."""
+    def mutate(uploads):
+        for item in uploads:
+            if item["id"] == upload_id:
+                change(item)
+                return item
+        raise UploadError("Upload not found.", 404)
+
+    return update_json(get_uploads_file(), mutate, [])
+
+
+async def write_chunk(upload_id: str, offset: int, chunks, checksum: str) -> Dict:
+    """
+    Writes one chunk (an async iterator of bytes, e.g. the request body stream) into the
+    final file at `offset`. The chunk is buffered (at most UPLOAD_CHUNK_MAX_BYTES) and only
+    written, and its byte range recorded as received, when its SHA-256 matches `checksum`;
+    on a mismatch nothing is written (a corrupt re-send cannot overwrite good bytes) and the
+    client re-sends the same range. The write is registered on the upload record while it
+    runs, so finalize cannot move the file from under it.
+    """
+    import aiofiles
+
+    if not checksum:
+        raise UploadError("Missing chunk checksum (X-Chunk-Sha256).")
+    token = new_id("W_")
+
+    def register(item):
+        if item["status"] != "uploading":
+            raise UploadError("Upload is already finalized.", 409)
+        if offset < 0 or offset >= item["size"]:
+            raise UploadError("Chunk offset out of range.", 416)
+        item["writers"] = {**_active_writers(item), token: time.time()}
+
+    upload = await asyncio.to_thread(_update_upload, upload_id, register)
+
+    received = None
+    try:
+        digest = hashlib.sha256()
+        buffer = bytearray()
+        async for data in chunks:
+            if not data:
+                continue
+            size = len(buffer) + len(data)
+            if size > settings.UPLOAD_CHUNK_MAX_BYTES or offset + size > upload["size"]:
+                raise UploadError("Chunk exceeds the chunk size limit or the declared file size.", 413)
+            digest.update(data)
+            buffer += data
+
+        if not buffer:
+            raise UploadError("Empty chunk.")
+        if digest.hexdigest() != checksum.lower():
+            raise UploadError("Chunk checksum mismatch; re-send this chunk.", 422)
+        async with aiofiles.open(get_upload_path(upload), "r+b") as out_file:
+            await out_file.seek(offset)
+            await out_file.write(bytes(buffer))
+        received = (offset, offset + len(buffer))
+    finally:
+        def release(item):
+            item.get("writers", {}).pop(token, None)
+            if received is not None:
+                item["received"] = _merge_range(item["received"], *received)
+                item["updated_at"] = time.time()
+
+        upload = await asyncio.to_thread(_update_upload, upload_id, release)
+
+    return _status(upload)
+
+
+def finalize_upload(upload_id: str, sha256: Optional[str] = None) -> Dict:
+    """
+    Marks a fully received upload complete, moves the file into the media store (a rename,
+    not a copy) and returns the upload record with "media" (the media store record).
+    With `sha256`, the whole file is verified first. Finalizing twice returns the same record.
+    The upload is claimed ("finalizing") under the store lock first: a concurrent finalize, or
+    one while chunks are still being written, gets a 409.
+    """
+    from app.services.media import adopt_file, get_media
+
+    claimed = {}
+
+    def claim(item):
+        if item["status"] == "complete":
+            return
+        if item["status"] == "finalizing":
+            raise UploadError("Upload is already being finalized.", 409)
+        missing = _missing_ranges(item)
+        if missing:
+            raise UploadError(f"Upload incomplete: {len(missing)} byte ranges missing.", 409)
+        if _active_writers(item):
+            raise UploadError("Chunks are still being written; finalize again when they are done.", 409)
+        item["status"] = "finalizing"
+        item["updated_at"] = time.time()
+        claimed["ok"] = True
+
+    upload = _update_upload(upload_id, claim)
+    if not claimed:
+        media = get_media(upload["media_sha"])
+        if media is None:
+            raise UploadError("Uploaded file is no longer stored.", 410)
+        return {**upload, "media": media}
+
+    try:
+        path = get_upload_path(upload)
+        if sha256:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                while block := f.read(1024 * 1024):
+                    digest.update(block)
+            if digest.hexdigest() != sha256.lower():
+                raise UploadError("File checksum mismatch.", 422)
+        media = adopt_file(path, upload["filename"], upload.get("content_type"))
+    except BaseException:
+        def release(item):
+            item["status"] = "uploading"
+            item["updated_at"] = time.time()
+
+        _update_upload(upload_id, release)
+        raise
+
+    def complete(item):
+        item["status"] = "complete"
+        item["media_sha"] = media["sha256"]
+        item["updated_at"] = time.time()
+
+    upload = _update_upload(upload_id, complete)
+    logger.info(f"Upload {upload_id} complete ({upload['size']} bytes, media {media['sha256'][:12]})")
+    return {**upload, "media": media}
@@ -0,0 +1,74 @@
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+# Rows scored per block in the approximate pass (bounds the float32 temporary)
+_BLOCK_ROWS = 16384
+
+
+def cosine_scores(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Exact cosine similarity of every row of `matrix` against `query` (float32)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    query = np.asarray(query, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    return (matrix @ query) / np.where(norms == 0, 1, norms)
+
+
+class QuantizedIndex:
+    """
+    int8 scalar-quantized copy of a set of embeddings for fast approximate search.
+
+    Rows are L2-normalized and quantized per dimension (symmetric, scale = max|x| / 127),
+    so the index takes a quarter of the float32 memory. search() scores all codes
+    approximately, then re-ranks the best `rerank_k` candidates exactly in float32
+    using `fetch_rows`, which only needs to read those rows (e.g. from a memory map).
+    """
+
+    def __init__(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        normalized = vectors / np.where(norms == 0, 1, norms)
+
+        max_abs = np.abs(normalized).max(axis=0) if len(normalized) else np.zeros(vectors.shape[1], dtype=np.float32)
+        self.scale = np.where(max_abs == 0, 1, max_abs / 127.0).astype(np.float32)
+        self.codes = np.clip(np.rint(normalized / self.scale), -127, 127).astype(np.int8)
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scale.nbytes
+
+    def approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        # Fold the per-dimension scale into the query once instead of dequantizing the codes
+        scaled_query = (query / (norm if norm else 1)) * self.scale
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), _BLOCK_ROWS):
+            block = self.codes[start:start + _BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ scaled_query
+        return scores
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        rerank_k: int,
+        fetch_rows: Callable[[np.ndarray], np.ndarray]
+    ) -> List[Tuple[int, float]]:
+        """Returns [(position, exact cosine score)] of the best `top_k` rows, best first."""
+        if not len(self) or top_k <= 0:
+            return []
+
+        approx = self.approximate_scores(query)
+        n_candidates = min(len(self), max(top_k, rerank_k))
+        if n_candidates < len(self):
+            candidates = np.argpartition(-approx, n_candidates - 1)[:n_candidates]
+        else:
+            candidates = np.arange(len(self))
+
+        exact = cosine_scores(fetch_rows(candidates), query)
+        order = np.argsort(-exact)[:top_k]
+        return [(int(candidates[i]), float(exact[i])) for i in order]
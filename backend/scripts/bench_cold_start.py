@@ -0,0 +1,67 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# `-X importtime` lines: "import time: <self us> | <cumulative us> | <indent><module>"
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+_HEAVY = ("cv2", "numpy", "openai")
+
+
+def run_once(target: str):
+    """Imports `target` in a fresh interpreter; returns (total ms, {module: (self ms, cumulative ms)})."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        sys.exit(f"import {target} failed:\n{proc.stderr}")
+    modules = {}
+    total = 0.0
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if not match:
+            continue
+        own, cumulative, indent, name = match.groups()
+        modules[name] = (int(own) / 1000, int(cumulative) / 1000)
+        if len(indent) == 1:  # top-level import
+            total += int(cumulative) / 1000
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import time of the API (python -X importtime).")
+    parser.add_argument("--target", default="app.main", help="module to import")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    args = parser.parse_args()
+
+    totals, runs = [], []
+    for _ in range(args.runs):
+        total, modules = run_once(args.target)
+        totals.append(total)
+        runs.append(modules)
+
+    print(f"import {args.target}: median {statistics.median(totals):.1f} ms "
+          f"(min {min(totals):.1f}, max {max(totals):.1f}) over {args.runs} runs")
+
+    # Median self/cumulative time per module across runs
+    names = set().union(*runs)
+    medians = {
+        name: (statistics.median(r[name][0] for r in runs if name in r),
+               statistics.median(r[name][1] for r in runs if name in r))
+        for name in names
+    }
+    print(f"\n{'self ms':>9} {'cumul. ms':>10}  module")
+    for name, (own, cumulative) in sorted(medians.items(), key=lambda item: item[1][0], reverse=True)[:args.top]:
+        print(f"{own:9.1f} {cumulative:10.1f}  {name}")
+
+    print("\nheavy modules loaded at startup: " + (", ".join(m for m in _HEAVY if m in names) or "none"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add backend directory to sys.path so the app services can be imported
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.vector_index import QuantizedIndex, cosine_scores
+
+def make_corpus(n: int, dim: int, clusters: int, seed: int):
+    """Synthetic clustered embeddings (real text embeddings are far from uniform)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    corpus = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    query_labels = rng.integers(0, clusters, size=64)
+    queries = centers[query_labels] + 0.6 * rng.standard_normal((64, dim)).astype(np.float32)
+    return corpus, queries
+
+def baseline_loop(corpus_lists, query, top_k):
+    """The original search_knowledge scoring: one np.dot per entry over JSON float lists."""
+    query_vec = np.array(query)
+    results = []
+    for i, embedding in enumerate(corpus_lists):
+        doc_vec = np.array(embedding)
+        similarity = np.dot(query_vec, doc_vec) / (np.linalg.norm(query_vec) * np.linalg.norm(doc_vec))
+        results.append((i, float(similarity)))
+    results.sort(key=lambda x: x[1], reverse=True)
+    return [i for i, _ in results[:top_k]]
+
+def exact_vectorized(corpus, query, top_k):
+    scores = cosine_scores(corpus, query)
+    return list(np.argsort(-scores)[:top_k])
+
+def timed(fn, queries):
+    latencies, outputs = [], []
+    for q in queries:
+        start = time.perf_counter()
+        outputs.append(fn(q))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return outputs, np.array(latencies)
+
+def recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark knowledge search: full-precision loop vs int8 + re-rank.")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--rerank-k", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--queries", type=int, default=32)
+    parser.add_argument("--baseline-queries", type=int, default=4, help="the per-entry loop is slow; use fewer queries")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus, queries = make_corpus(args.rows, args.dim, args.clusters, args.seed)
+    queries = queries[:args.queries]
+    print(f"Corpus: {args.rows} x {args.dim}, top_k={args.top_k}, {len(queries)} queries")
+
+    truth, exact_ms = timed(lambda q: exact_vectorized(corpus, q, args.top_k), queries)
+
+    corpus_lists = corpus.tolist()
+    _, loop_ms = timed(lambda q: baseline_loop(corpus_lists, q, args.top_k), queries[:args.baseline_queries])
+    del corpus_lists
+
+    build_start = time.perf_counter()
+    index = QuantizedIndex(corpus)
+    build_ms = (time.perf_counter() - build_start) * 1000
+
+    print(f"\n{'method':<28}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'memory MB':>12}")
+    float_list_mb = args.rows * args.dim * 32 / 1e6  # boxed Python float + list slot per value
+    print(f"{'loop over float lists':<28}{1.0:>10.3f}{np.percentile(loop_ms, 50):>10.2f}{np.percentile(loop_ms, 95):>10.2f}{float_list_mb:>12.1f}")
+    print(f"{'vectorized float32':<28}{1.0:>10.3f}{np.percentile(exact_ms, 50):>10.2f}{np.percentile(exact_ms, 95):>10.2f}{corpus.nbytes / 1e6:>12.1f}")
+
+    for rerank_k in args.rerank_k:
+        found, ms = timed(
+            lambda q: [p for p, _ in index.search(q, args.top_k, rerank_k, lambda rows: corpus[rows])],
+            queries
+        )
+        label = f"int8 + rerank {rerank_k}"
+        print(f"{label:<28}{recall(found, truth):>10.3f}{np.percentile(ms, 50):>10.2f}{np.percentile(ms, 95):>10.2f}{index.nbytes / 1e6:>12.1f}")
+
+    print(f"\nint8 index build: {build_ms:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timezone
+
+# Add backend directory to sys.path so the app modules can be imported
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(BACKEND_DIR)
+
+from app.core.json_codec import dumps, etag_for
+
+try:
+    import numpy as np
+except ImportError:  # the snapshot then keeps embeddings inline (searchable, just not memory-mapped)
+    np = None
+
+
+def _load(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_knowledge(source_dir, out_dir, dtype):
+    """
+    Writes knowledge_base.json with every embedding moved into one compact .npy matrix
+    (rows renumbered, orphaned rows dropped), ready to be memory-mapped.
+    """
+    kb = _load(os.path.join(source_dir, "knowledge_base.json"), [])
+    matrix_path = os.path.join(source_dir, "knowledge_embeddings.npy")
+    source_matrix = None
+    if any(item.get("embedding_row") is not None for item in kb):
+        if np is None:
+            print("WARNING: numpy is not installed; entries stored in the .npy sidecar lose their embeddings")
+        elif os.path.exists(matrix_path):
+            source_matrix = np.load(matrix_path, mmap_mode="r")
+
+    vectors = []
+    for item in kb:
+        row = item.pop("embedding_row", None)
+        vector = item.pop("embedding", None)
+        if not vector and row is not None and source_matrix is not None:
+            vector = source_matrix[row]
+        if vector is None or not len(vector):
+            continue
+        if np is None:
+            item["embedding"] = vector
+        else:
+            item["embedding_row"] = len(vectors)
+            vectors.append(np.asarray(vector, dtype=dtype))
+
+    files = ["knowledge_base.json"]
+    if vectors:
+        np.save(os.path.join(out_dir, "knowledge_embeddings.npy"), np.vstack(vectors))
+        files.append("knowledge_embeddings.npy")
+    _write_json(os.path.join(out_dir, "knowledge_base.json"), kb)
+
+    embedded = len(vectors) if np is not None else sum(1 for item in kb if item.get("embedding"))
+    info = {"entries": len(kb), "embedded": embedded, "inline": np is None}
+    if vectors:
+        info.update({"dim": int(vectors[0].shape[0]), "dtype": str(np.dtype(dtype))})
+    return files, info
+
+
+def build_documentation(source_dir, out_dir):
+    """documentation.json plus the precomputed per-doc search text (see documentation.search_docs)."""
+    docs = _load(os.path.join(source_dir, "documentation.json"), [])
+    _write_json(os.path.join(out_dir, "documentation.json"), docs)
+    files = ["documentation.json"]
+    try:
+        from app.services.documentation import doc_search_text
+    except ImportError as e:  # app dependencies missing at build time: the index is built on first search instead
+        print(f"WARNING: docs search index skipped ({e})")
+        return files, {"docs": len(docs)}
+    index = {"source_etag": etag_for(dumps(docs)), "texts": [doc_search_text(doc) for doc in docs]}
+    _write_json(os.path.join(out_dir, "docs_search_index.json"), index)
+    return files + ["docs_search_index.json"], {"docs": len(docs)}
+
+
+def build(source_dir, out_dir, dtype):
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    knowledge_files, knowledge = build_knowledge(source_dir, tmp_dir, dtype)
+    doc_files, documentation = build_documentation(source_dir, tmp_dir)
+    guides = _load(os.path.join(source_dir, "technical_guides.json"), [])
+    _write_json(os.path.join(tmp_dir, "technical_guides.json"), guides)
+
+    names = knowledge_files + doc_files + ["technical_guides.json"]
+    manifest = {
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "files": {
+            name: {"bytes": os.path.getsize(os.path.join(tmp_dir, name)), "sha256": _sha256(os.path.join(tmp_dir, name))}
+            for name in names
+        },
+        "knowledge": knowledge,
+        "documentation": documentation,
+        "technical_guides": {"guides": len(guides)}
+    }
+    # Written last: a snapshot without a manifest is ignored
+    _write_json(os.path.join(tmp_dir, "manifest.json"), manifest)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the read-only data snapshot loaded under the data dir on cold start.")
+    parser.add_argument("--source", default=os.path.join(BACKEND_DIR, "data"), help="data directory to snapshot")
+    parser.add_argument("--out", default=os.path.join(BACKEND_DIR, "snapshot"))
+    parser.add_argument("--dtype", default=os.environ.get("EMBEDDING_DTYPE", "float32"), help="embedding matrix dtype")
+    args = parser.parse_args()
+
+    manifest = build(os.path.abspath(args.source), os.path.abspath(args.out), args.dtype)
+    total = sum(f["bytes"] for f in manifest["files"].values())
+    print(f"Snapshot written to {os.path.abspath(args.out)} ({total / 1024:.1f} KB)")
+    for name, info in manifest["files"].items():
+        print(f"  {name}: {info['bytes'] / 1024:.1f} KB")
+    print(f"  knowledge: {manifest['knowledge']}")
+
+
+if __name__ == "__main__":
+    main()
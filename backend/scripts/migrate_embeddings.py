@@ -0,0 +1,32 @@
+import os
+import sys
+
+# Add backend directory to sys.path so the app services can be imported
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.embedding_store import get_embeddings_file
+from app.services.knowledge import KNOWLEDGE_FILE, compact_embeddings
+
+def migrate():
+    """
+    Moves inline embedding lists out of knowledge_base.json into the .npy sidecar
+    and drops rows no longer referenced by any entry.
+    """
+    print("Starting embedding migration...")
+
+    if not os.path.exists(KNOWLEDGE_FILE):
+        print(f"Knowledge file not found: {KNOWLEDGE_FILE}")
+        return
+
+    size_before = os.path.getsize(KNOWLEDGE_FILE)
+    rows = compact_embeddings()
+    size_after = os.path.getsize(KNOWLEDGE_FILE)
+
+    sidecar = get_embeddings_file()
+    sidecar_size = os.path.getsize(sidecar) if os.path.exists(sidecar) else 0
+
+    print(f"knowledge_base.json: {size_before / 1024:.1f} KB -> {size_after / 1024:.1f} KB")
+    print(f"Embedding sidecar: {rows} rows, {sidecar_size / 1024:.1f} KB ({sidecar})")
+
+if __name__ == "__main__":
+    migrate()